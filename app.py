@@ -1,15 +1,37 @@
+from __future__ import annotations
+
 import os
+import argparse
 import json
+import logging
+import logging.handlers
 import re
 import time
 import asyncio
-import zipfile
+import bisect
+import contextlib
+import hashlib
+import heapq
+import hmac
+import importlib
+import io
+import shutil
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
 from datetime import datetime, timedelta, timezone
-from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, Dict, List, Optional, Any, Set, Tuple
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from queue import Full, Queue
 
 import requests
+
 from telegram import (
     Update, InlineKeyboardButton, InlineKeyboardMarkup,
     LinkPreviewOptions, CopyTextButton, InputMediaPhoto,
@@ -17,15 +39,32 @@ from telegram import (
 )
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
-    MessageHandler, filters, ContextTypes, JobQueue
+    MessageHandler, ChatMemberHandler, TypeHandler, BaseUpdateProcessor, BasePersistence, PersistenceInput,
+    filters, ContextTypes, JobQueue
 )
 from colorama import init, Fore, Style
 from dotenv import load_dotenv
 from telegram.constants import ParseMode
-from telegram.error import BadRequest
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+class LazyModule:
+    def __init__(self, name: str):
+        self.name = name
+        self.module = None
+    
+    def __getattr__(self, attr: str):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attr)
+
+if TYPE_CHECKING:
+    from aiohttp import web
+else:
+    web = LazyModule("aiohttp.web")
 
 init(autoreset=True)
 load_dotenv()
+log = logging.getLogger("otpbot")
 
 print(f"{Fore.GREEN}[]════════[] STARTING BOT []════════[]{Style.RESET_ALL}")
 
@@ -39,6 +78,33 @@ class Config:
     SUPPORT: str = os.getenv("SUPPORT", "")
     OTPS_GROUP: str = os.getenv("OTPS_GROUP", "")
     NUM_GROUP_ID: str = os.getenv("NUM_GROUP_ID", "")
+    BOT_API_URL: str = os.getenv("BOT_API_URL", "").rstrip("/")
+    UPDATE_MODE: str = os.getenv("UPDATE_MODE", "polling").strip().lower()
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_LISTEN: str = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8443"))
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_MAX_CONNECTIONS: int = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    WEBHOOK_REGISTER: bool = os.getenv("WEBHOOK_REGISTER", "1") != "0"
+    UPDATE_CONCURRENCY: int = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+    SMS_MODE: str = os.getenv("SMS_MODE", "inline").strip().lower()
+    SMS_QUEUE_MAX: int = int(os.getenv("SMS_QUEUE_MAX", "1000"))
+    SMS_ENDPOINT: str = os.getenv("SMS_ENDPOINT", "")
+    METRICS_LISTEN: str = os.getenv("METRICS_LISTEN", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9108"))
+    LOOP_LAG_THRESHOLD: float = float(os.getenv("LOOP_LAG_THRESHOLD", "0.5"))
+    LOOP_LAG_ALERT: float = float(os.getenv("LOOP_LAG_ALERT", "5"))
+    SHUTDOWN_TIMEOUT: float = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+    STATE_FLUSH_SECONDS: float = float(os.getenv("STATE_FLUSH_SECONDS", "5"))
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text").strip().lower()
+    LOG_FILE: str = os.getenv("LOG_FILE", "logs/bot.jsonl")
+    LOG_MAX_MB: float = float(os.getenv("LOG_MAX_MB", "10"))
+    LOG_BACKUPS: int = int(os.getenv("LOG_BACKUPS", "5"))
+    LOG_SAMPLE_WINDOW: float = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+    LOG_SAMPLE_BURST: int = int(os.getenv("LOG_SAMPLE_BURST", "5"))
+    change_hooks = []
     
     def __post_init__(self):
         if not self.BOT_TOKEN:
@@ -47,6 +113,18 @@ class Config:
             raise ValueError("APIKEY not found in .env")
         if self.OWNER_ID == 0:
             raise ValueError("OWNER_ID not found in .env")
+        if self.UPDATE_MODE not in ("polling", "webhook"):
+            raise ValueError("UPDATE_MODE must be polling or webhook")
+        if self.SMS_MODE not in ("inline", "queue", "dispatch"):
+            raise ValueError("SMS_MODE must be inline, queue or dispatch")
+        if self.LOG_FORMAT not in ("text", "json"):
+            raise ValueError("LOG_FORMAT must be text or json")
+        if self.UPDATE_MODE == "webhook" and not self.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL not found in .env")
+        if not self.WEBHOOK_SECRET:
+            self.WEBHOOK_SECRET = hashlib.sha256(self.BOT_TOKEN.encode()).hexdigest()[:32]
+        if not self.WEBHOOK_PATH.startswith("/"):
+            self.WEBHOOK_PATH = "/" + self.WEBHOOK_PATH
     
     @staticmethod
     def save_env(key: str, value: str):
@@ -67,9 +145,507 @@ class Config:
                 f.write(f"{k}={v}\n")
         
         load_dotenv(override=True)
+        
+        for hook in Config.change_hooks:
+            try:
+                hook(key, value)
+            except Exception:
+                log.exception("config hook failed", extra={"key": key})
+    
+    def provider_accounts(self) -> List[Tuple[str, str, str]]:
+        accounts = []
+        for entry in self.APIKEY.split(","):
+            key, _, url = entry.strip().partition("|")
+            if key.strip():
+                name = f"#{len(accounts) + 1}-{key.strip()[-4:]}"
+                accounts.append((name, key.strip(), url.strip() or self.SMS_ENDPOINT or SMSProvider.URL))
+        return accounts
+    
+    @staticmethod
+    def register_change_hook(hook):
+        Config.change_hooks.append(hook)
+
+class LogSampler(logging.Filter):
+    def __init__(self, window: float, burst: int):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.started = time.monotonic()
+        self.counts: Dict[Tuple, int] = {}
+        self.suppressed: Dict[Tuple, int] = {}
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+        now = time.monotonic()
+        if now - self.started > self.window:
+            self.started = now
+            self.suppressed = {key: count - self.burst for key, count in self.counts.items() if count > self.burst}
+            self.counts = {}
+        
+        error = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.name, str(record.msg), error)
+        count = self.counts[key] = self.counts.get(key, 0) + 1
+        if count > self.burst:
+            Metrics.inc("log_suppressed_total", level=record.levelname.lower())
+            return False
+        skipped = self.suppressed.pop(key, 0)
+        if skipped:
+            record.suppressed = skipped
+        return True
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            Metrics.inc("log_dropped_total")
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = Logging.TRACEBACKS.formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+class LogQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "process": record.processName,
+            "msg": record.getMessage(),
+        }
+        entry.update(Logging.extras(record))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextLogFormatter(logging.Formatter):
+    COLORS = {"DEBUG": Fore.CYAN, "INFO": Fore.GREEN, "WARNING": Fore.YELLOW, "ERROR": Fore.RED, "CRITICAL": Fore.RED}
+    
+    def __init__(self, color: bool):
+        super().__init__()
+        self.color = color
+    
+    def format(self, record: logging.LogRecord) -> str:
+        stamp = datetime.fromtimestamp(record.created).strftime("%H:%M:%S")
+        fields = " ".join(f"{key}={value}" for key, value in Logging.extras(record).items())
+        line = f"{stamp} {record.levelname:<7} {record.getMessage()}{' ' + fields if fields else ''}"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        if self.color:
+            line = f"{self.COLORS.get(record.levelname, '')}{line}{Style.RESET_ALL}"
+        return line
+
+class Logging:
+    QUEUE_SIZE = 10000
+    TRACEBACKS = logging.Formatter()
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+    listener: Optional[LogQueueListener] = None
+    
+    @classmethod
+    def extras(cls, record: logging.LogRecord) -> Dict[str, Any]:
+        return {key: value for key, value in vars(record).items() if key not in cls.RESERVED}
+    
+    @classmethod
+    def setup(cls, config: Config, role: str = "bot"):
+        cls.stop()
+        console = logging.StreamHandler(sys.stdout)
+        if config.LOG_FORMAT == "json":
+            console.setFormatter(JsonLogFormatter())
+        else:
+            console.setFormatter(TextLogFormatter(sys.stdout.isatty()))
+        handlers = [console]
+        
+        if config.LOG_FILE:
+            path = Path(config.LOG_FILE)
+            if role != "bot":
+                path = path.with_name(f"{path.stem}-{role}{path.suffix}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            rotating = logging.handlers.RotatingFileHandler(
+                path, maxBytes=int(config.LOG_MAX_MB * 1024 * 1024), backupCount=config.LOG_BACKUPS, encoding="utf-8"
+            )
+            rotating.setFormatter(JsonLogFormatter())
+            handlers.append(rotating)
+        
+        records = Queue(maxsize=cls.QUEUE_SIZE)
+        handler = LogQueueHandler(records)
+        handler.addFilter(LogSampler(config.LOG_SAMPLE_WINDOW, config.LOG_SAMPLE_BURST))
+        log.handlers = [handler]
+        log.setLevel(getattr(logging, config.LOG_LEVEL, logging.INFO))
+        log.propagate = False
+        cls.listener = LogQueueListener(records, *handlers)
+        cls.listener.start()
+    
+    @classmethod
+    def stop(cls):
+        if cls.listener:
+            cls.listener.stop()
+            cls.listener = None
+
+class Metrics:
+    LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+    STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+    LABEL_ID_RE = re.compile(r'-?\d+')
+    DEFINITIONS = {
+        "sms_provider_poll_seconds": ("histogram", "Provider get_list call latency", LATENCY_BUCKETS),
+        "sms_provider_poll_results": ("histogram", "SMS rows returned per provider poll", SIZE_BUCKETS),
+        "sms_provider_errors_total": ("counter", "Failed provider polls", None),
+        "sms_ingested_total": ("counter", "New SMS accepted from providers", None),
+        "sms_deduped_total": ("counter", "SMS dropped as already processed", None),
+        "otp_extraction_seconds": ("histogram", "OTP extraction time", LATENCY_BUCKETS),
+        "telegram_send_seconds": ("histogram", "send_message latency per recipient", LATENCY_BUCKETS),
+        "telegram_send_failures_total": ("counter", "Failed send_message calls per recipient", None),
+        "db_load_seconds": ("histogram", "Database.load_db duration per table", LATENCY_BUCKETS),
+        "db_save_seconds": ("histogram", "Database.save_db duration per table", LATENCY_BUCKETS),
+        "job_run_seconds": ("histogram", "Job queue callback run time", LATENCY_BUCKETS),
+        "handler_seconds": ("histogram", "Update handler latency", LATENCY_BUCKETS),
+        "event_loop_lag_seconds": ("histogram", "Event loop scheduling lag per watchdog tick", LATENCY_BUCKETS),
+        "event_loop_stalls_total": ("counter", "Event loop stalls longer than LOOP_LAG_THRESHOLD", None),
+        "log_dropped_total": ("counter", "Log records dropped because the log queue was full", None),
+        "log_suppressed_total": ("counter", "Repeated warnings and errors dropped by log sampling", None),
+        "otp_stage_seconds": ("histogram", "OTP delivery trace time per stage", STAGE_BUCKETS),
+    }
+    counters: Dict[Tuple, float] = {}
+    histograms: Dict[Tuple, List[float]] = {}
+    gauges: Dict[str, Tuple[str, Any]] = {}
+    lock = threading.Lock()
+    
+    @staticmethod
+    def label_key(labels: Dict[str, Any]) -> Tuple:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+    
+    @classmethod
+    def label_value(cls, value: str) -> str:
+        return cls.LABEL_ID_RE.sub("*", value)[:64]
+    
+    @classmethod
+    def inc(cls, name: str, value: float = 1, **labels):
+        key = (name, cls.label_key(labels))
+        with cls.lock:
+            cls.counters[key] = cls.counters.get(key, 0) + value
+    
+    @classmethod
+    def observe(cls, name: str, value: float, **labels):
+        key = (name, cls.label_key(labels))
+        buckets = cls.DEFINITIONS[name][2]
+        slot = bisect.bisect_left(buckets, value)
+        with cls.lock:
+            series = cls.histograms.get(key)
+            if series is None:
+                series = cls.histograms[key] = [0] * (len(buckets) + 3)
+            series[slot] += 1
+            series[-2] += value
+            series[-1] += 1
+    
+    @classmethod
+    @contextlib.contextmanager
+    def timer(cls, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.observe(name, time.perf_counter() - started, **labels)
+    
+    @classmethod
+    def timed_job(cls, callback):
+        async def run(context: ContextTypes.DEFAULT_TYPE):
+            started = time.perf_counter()
+            try:
+                await callback(context)
+            finally:
+                job = context.job.name if context.job else callback.__name__
+                cls.observe("job_run_seconds", time.perf_counter() - started, job=job)
+        return run
+    
+    @classmethod
+    def register_gauge(cls, name: str, help_text: str, collect):
+        cls.gauges[name] = (help_text, collect)
+    
+    @staticmethod
+    def format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        escaped = (f'{key}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for key, value in pairs)
+        return "{" + ",".join(escaped) + "}"
+    
+    @classmethod
+    def render(cls) -> str:
+        with cls.lock:
+            counters = list(cls.counters.items())
+            histograms = [(key, list(series)) for key, series in cls.histograms.items()]
+        lines = []
+        for name, (kind, help_text, buckets) in cls.DEFINITIONS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in counters:
+                    if metric == name:
+                        lines.append(f"{name}{cls.format_labels(labels)} {value}")
+                continue
+            for (metric, labels), series in histograms:
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, series):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{cls.format_labels(labels, (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{cls.format_labels(labels, (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{name}_sum{cls.format_labels(labels)} {series[-2]}")
+                lines.append(f"{name}_count{cls.format_labels(labels)} {series[-1]}")
+        
+        for name, (help_text, collect) in list(cls.gauges.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            try:
+                for labels, value in collect():
+                    if value is not None:
+                        lines.append(f"{name}{cls.format_labels(cls.label_key(labels))} {value}")
+            except Exception:
+                log.exception("metrics gauge failed", extra={"gauge": name})
+        return "\n".join(lines) + "\n"
+
+class StartupReport:
+    phases: List[Tuple[str, float]] = []
+    last = time.perf_counter()
+    
+    @staticmethod
+    def process_age() -> Optional[float]:
+        try:
+            with open("/proc/self/stat", "r") as f:
+                started = int(f.read().rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+            with open("/proc/uptime", "r") as f:
+                return float(f.read().split()[0]) - started
+        except (OSError, ValueError, IndexError):
+            return None
+    
+    @classmethod
+    def begin(cls):
+        age = cls.process_age()
+        if age is not None:
+            cls.phases.append(("interpreter + imports", age))
+        cls.last = time.perf_counter()
+    
+    @classmethod
+    def mark(cls, phase: str):
+        now = time.perf_counter()
+        cls.phases.append((phase, now - cls.last))
+        cls.last = now
+    
+    @classmethod
+    def render(cls) -> str:
+        width = max(len(phase) for phase, _ in cls.phases)
+        lines = [f"{phase:<{width}}  {seconds * 1000:8.1f} ms" for phase, seconds in cls.phases]
+        total = sum(seconds for _, seconds in cls.phases)
+        lines.append(f"{'total':<{width}}  {total * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+class Lifecycle:
+    SIGNALS = ("SIGTERM", "SIGINT")
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.state = "starting"
+        self.started_at = time.time()
+        self.stopping = asyncio.Event()
+        self.forced = asyncio.Event()
+        self.reason = ""
+        self.details: Dict[str, Any] = {}
+    
+    def install(self, loop: asyncio.AbstractEventLoop):
+        for name in self.SIGNALS:
+            sig = getattr(signal, name, None)
+            if sig is None:
+                continue
+            try:
+                loop.add_signal_handler(sig, self.request_stop, name)
+            except (NotImplementedError, RuntimeError):
+                pass
+    
+    def request_stop(self, reason: str = "requested"):
+        if self.stopping.is_set():
+            self.forced.set()
+            log.warning("second stop request, skipping drain", extra={"reason": reason})
+            return
+        self.reason = reason
+        self.state = "draining"
+        log.info("shutdown requested", extra={"reason": reason})
+        self.stopping.set()
+    
+    def ready(self):
+        self.state = "ready"
+    
+    def register_detail(self, name: str, provider):
+        self.details[name] = provider
+    
+    def remaining(self, deadline: float) -> float:
+        return 0.0 if self.forced.is_set() else max(0.0, deadline - time.monotonic())
+    
+    async def bounded(self, task: asyncio.Future, deadline: float) -> bool:
+        forced = asyncio.ensure_future(self.forced.wait())
+        try:
+            done, _ = await asyncio.wait({task, forced}, timeout=self.remaining(deadline),
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            forced.cancel()
+        if task in done:
+            return True
+        task.cancel()
+        await asyncio.wait({task})
+        return False
+    
+    def health(self) -> Dict[str, Any]:
+        body = {"state": self.state, "uptime": round(time.time() - self.started_at, 1)}
+        for name, provider in self.details.items():
+            try:
+                body[name] = provider()
+            except Exception as e:
+                body[name] = f"error: {e}"
+        return body
+    
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(self.health(), status=200 if self.state != "stopped" else 503)
+    
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        return web.json_response(self.health(), status=200 if self.state == "ready" else 503)
+
+class MetricsServer:
+    def __init__(self, config: Config, lifecycle: Optional[Lifecycle] = None):
+        self.config = config
+        self.lifecycle = lifecycle
+        self.runner: Optional[web.AppRunner] = None
+    
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=Metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+    
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        if self.lifecycle:
+            app.router.add_get("/healthz", self.lifecycle.handle_health)
+            app.router.add_get("/readyz", self.lifecycle.handle_ready)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.config.METRICS_LISTEN, self.config.METRICS_PORT).start()
+        log.info("metrics listening", extra={"listen": self.config.METRICS_LISTEN, "port": self.config.METRICS_PORT})
+    
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+class LoopWatchdog:
+    INTERVAL = 0.25
+    WINDOW = 2400
+    STACK_LIMIT = 40
+    ALERT_COOLDOWN = 600
+    
+    def __init__(self, config: Config, bot):
+        self.config = config
+        self.bot = bot
+        self.lags = deque(maxlen=self.WINDOW)
+        self.stalls = deque(maxlen=20)
+        self.heartbeat = time.monotonic()
+        self.loop_thread = threading.get_ident()
+        self.captured: Optional[Dict[str, Any]] = None
+        self.last_alert = 0.0
+        self.halt = threading.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.thread = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+    
+    def start(self):
+        self.loop_thread = threading.get_ident()
+        Metrics.register_gauge("event_loop_lag_quantile_seconds", "Event loop lag percentiles over the last 10 minutes",
+                               lambda: [({"quantile": str(int(key[1:]) / 100)}, value) for key, value in self.percentiles().items()])
+        self.task = asyncio.create_task(self.measure())
+        self.thread.start()
+    
+    def stop(self):
+        self.halt.set()
+        if self.task:
+            self.task.cancel()
+    
+    def percentiles(self) -> Dict[str, float]:
+        return Utils.percentiles(self.lags, (50, 90, 99))
+    
+    def stack(self) -> str:
+        frame = sys._current_frames().get(self.loop_thread)
+        lines = []
+        while frame is not None and len(lines) < self.STACK_LIMIT:
+            lines.append(f"{Path(frame.f_code.co_filename).name}:{frame.f_lineno} in {frame.f_code.co_name}")
+            frame = frame.f_back
+        return "\n".join(reversed(lines))
+    
+    def watch(self):
+        threshold = self.config.LOOP_LAG_THRESHOLD
+        while not self.halt.wait(threshold / 2):
+            blocked = time.monotonic() - self.heartbeat - self.INTERVAL
+            if blocked > threshold and self.captured is None:
+                self.captured = {"at": time.time(), "stack": self.stack()}
+                log.warning("event loop blocked", extra={"blocked": round(blocked, 3), "stack": self.captured["stack"]})
+    
+    async def measure(self):
+        while True:
+            expected = time.monotonic() + self.INTERVAL
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.INTERVAL)
+            self.heartbeat = time.monotonic()
+            lag = max(0.0, self.heartbeat - expected)
+            self.lags.append(lag)
+            Metrics.observe("event_loop_lag_seconds", lag)
+            
+            if lag <= self.config.LOOP_LAG_THRESHOLD:
+                continue
+            Metrics.inc("event_loop_stalls_total")
+            stall = self.captured or {"at": time.time(), "stack": ""}
+            stall["lag"] = lag
+            self.stalls.append(stall)
+            self.captured = None
+            log.warning("event loop stalled", extra={"lag": round(lag, 3)})
+            
+            if self.config.LOOP_LAG_ALERT and lag >= self.config.LOOP_LAG_ALERT and time.time() - self.last_alert > self.ALERT_COOLDOWN:
+                self.last_alert = time.time()
+                try:
+                    await self.bot.send_message(
+                        chat_id=self.config.OWNER_ID,
+                        text=f"⚠️ <b>Event loop stalled for {lag:.1f}s</b>\n"
+                             f"<pre>{Utils.escape_html(stall['stack'][-3000:] or 'no stack captured')}</pre>",
+                        parse_mode=ParseMode.HTML
+                    )
+                except Exception as e:
+                    log.warning("loop lag alert failed: %s", e)
 
 class Database:
     BASE_DIR = Path("database")
+    KNOWN_TABLES = (
+        "groups", "users", "otps", "user_request", "country", "numbers", "verif",
+        "sms_history", "autodel", "bot_messages", "daily_stats", "membership"
+    )
+    reload_hooks: List = []
+    cache: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+    
+    @classmethod
+    def register_reload_hook(cls, hook):
+        cls.reload_hooks.append(hook)
+    
+    @classmethod
+    def notify_reload(cls, kind: str):
+        for hook in cls.reload_hooks:
+            try:
+                hook(kind)
+            except Exception:
+                log.exception("reload hook failed", extra={"kind": kind})
     
     @classmethod
     def init_db(cls):
@@ -104,26 +680,72 @@ class Database:
             "sms_history.json": [],
             "autodel.json": {"enabled": False, "minutes": 0, "notif_message_ids": {}},
             "bot_messages.json": [],
-            "daily_stats.json": {}
+            "daily_stats.json": {},
+            "membership.json": {}
         }
         
         for file, content in default_files.items():
             path = cls.BASE_DIR / file
-            if not path.exists():
-                with open(path, "w", encoding="utf-8") as f:
-                    json.dump(content, f, indent=4, ensure_ascii=False)
+            if path.is_file() and cls.looks_valid(path):
+                continue
+            if path.is_file() and path.stat().st_size > 0:
+                cls.quarantine(path)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(content, f, indent=4, ensure_ascii=False)
+    
+    @staticmethod
+    def looks_valid(path: Path) -> bool:
+        try:
+            with open(path, "rb") as f:
+                head = f.read(64).lstrip()
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(size - 64, 0))
+                tail = f.read().rstrip()
+        except OSError:
+            return False
+        if not head or not tail:
+            return False
+        pairs = {b"{"[0]: b"}"[0], b"["[0]: b"]"[0]}
+        return pairs.get(head[0]) == tail[-1]
+    
+    @staticmethod
+    def quarantine(path: Path):
+        target = path.with_name(f"{path.name}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}")
+        with contextlib.suppress(OSError):
+            os.replace(path, target)
+            log.error("corrupt table moved aside", extra={"table": path.stem, "moved_to": str(target)})
     
     @classmethod
     def load_db(cls, db_name: str) -> Any:
         path = cls.BASE_DIR / f"{db_name}.json"
-        if path.exists():
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except:
+        with Metrics.timer("db_load_seconds", table=db_name):
+            if path.exists():
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        return json.load(f)
+                except ValueError:
+                    cls.quarantine(path)
+                    default = cls.get_default_structure(db_name)
+                    cls.save_db(db_name, default)
+                    return default
+                except Exception:
+                    return cls.get_default_structure(db_name)
+            else:
                 return cls.get_default_structure(db_name)
-        else:
-            return cls.get_default_structure(db_name)
+    
+    @classmethod
+    def load_cached(cls, db_name: str) -> Any:
+        try:
+            stat = (cls.BASE_DIR / f"{db_name}.json").stat()
+        except OSError:
+            return cls.load_db(db_name)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = cls.cache.get(db_name)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        data = cls.load_db(db_name)
+        cls.cache[db_name] = (stamp, data)
+        return data
     
     @classmethod
     def get_default_structure(cls, db_name: str) -> Any:
@@ -138,15 +760,29 @@ class Database:
             "sms_history": [],
             "autodel": {"enabled": False, "minutes": 0, "notif_message_ids": {}},
             "bot_messages": [],
-            "daily_stats": {}
+            "daily_stats": {},
+            "membership": {}
         }
         return default_structures.get(db_name, {})
     
     @classmethod
-    def save_db(cls, db_name: str, data: Any):
+    def save_db(cls, db_name: str, data: Any, compact: bool = False):
         path = cls.BASE_DIR / f"{db_name}.json"
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        cls.cache.pop(db_name, None)
+        with Metrics.timer("db_save_seconds", table=db_name):
+            fd, temp_path = tempfile.mkstemp(prefix=f".{db_name}.", suffix=".tmp", dir=cls.BASE_DIR)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    if compact:
+                        json.dump(data, f, separators=(",", ":"), ensure_ascii=False)
+                    else:
+                        json.dump(data, f, indent=4, ensure_ascii=False)
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.unlink(temp_path)
+                raise
     
     @classmethod
     def get_users(cls) -> Dict[str, List[int]]:
@@ -196,7 +832,7 @@ class Database:
     
     @classmethod
     def get_groups(cls) -> List[str]:
-        data = cls.load_db("groups")
+        data = cls.load_cached("groups")
         if isinstance(data, dict) and "groups" in data:
             return data["groups"]
         return []
@@ -223,7 +859,7 @@ class Database:
     
     @classmethod
     def get_user_requests(cls) -> List[Dict]:
-        data = cls.load_db("user_request")
+        data = cls.load_cached("user_request")
         if isinstance(data, list):
             return data
         else:
@@ -268,11 +904,8 @@ class Database:
     
     @classmethod
     def get_country_by_code(cls, phone: str) -> Optional[Dict]:
-        countries = cls.get_countries()
-        for code, info in countries.items():
-            if phone.startswith(code):
-                return info
-        return None
+        code = NumberNormalizer.country_code(phone.lstrip("+"))
+        return NumberNormalizer.prefix_table()[3].get(code) if code else None
     
     @classmethod
     def add_otp_record(cls, otp_data: Dict):
@@ -294,7 +927,7 @@ class Database:
             cls.cleanup_otps()
             
         except Exception as e:
-            print(f"Error in add_otp_record: {type(e).__name__}: {e}")
+            log.error("add_otp_record failed: %s", e, exc_info=True)
             cls.save_db("otps", {"otps": [], "statistics": {}, "last_cleanup": datetime.now(timezone.utc).isoformat()})
     
     @classmethod
@@ -328,7 +961,7 @@ class Database:
             cls.save_db("daily_stats", stats)
             
         except Exception as e:
-            print(f"Error updating daily stats: {e}")
+            log.error("daily stats update failed: %s", e, exc_info=True)
     
     @classmethod
     def cleanup_otps(cls):
@@ -493,7 +1126,7 @@ class Database:
     
     @classmethod
     def get_ranges(cls) -> List[Dict]:
-        data = cls.load_db("numbers")
+        data = cls.load_cached("numbers")
         if isinstance(data, list):
             return data
         else:
@@ -501,13 +1134,13 @@ class Database:
     
     @classmethod
     def add_range(cls, range_data: Dict):
-        data = cls.get_ranges()
+        data = list(cls.get_ranges())
         data.append(range_data)
         cls.save_db("numbers", data)
     
     @classmethod
     def remove_range(cls, range_id: int) -> bool:
-        data = cls.get_ranges()
+        data = [dict(item) for item in cls.get_ranges()]
         if 0 <= range_id < len(data):
             range_data = data[range_id]
             filename = range_data.get("filename", "")
@@ -558,18 +1191,29 @@ class Database:
         return False
     
     @classmethod
-    def check_sms_history(cls, phone: str, datetime_str: str) -> bool:
+    def sms_seen(cls, phone: str, datetime_str: str) -> bool:
+        history = cls.load_db("sms_history")
+        return isinstance(history, list) and f"{phone}_{datetime_str}" in history
+    
+    @classmethod
+    def mark_sms(cls, phone: str, datetime_str: str):
         history = cls.load_db("sms_history")
         if not isinstance(history, list):
             history = []
         
         sms_id = f"{phone}_{datetime_str}"
         if sms_id in history:
-            return True
+            return
         
         history.append(sms_id)
         cls.save_db("sms_history", history)
         cls.cleanup_sms_history()
+    
+    @classmethod
+    def check_sms_history(cls, phone: str, datetime_str: str) -> bool:
+        if cls.sms_seen(phone, datetime_str):
+            return True
+        cls.mark_sms(phone, datetime_str)
         return False
     
     @classmethod
@@ -586,77 +1230,361 @@ class Database:
             notif_message_ids = {}
         data = {"enabled": minutes > 0, "minutes": minutes, "notif_message_ids": notif_message_ids}
         cls.save_db("autodel", data)
+
+class OTPTemplateCache:
+    MASK_TABLE = str.maketrans("123456789", "000000000")
+    MAX_SIZE = 2048
+    MIN_CONFIRMATIONS = 2
+    
+    def __init__(self, max_size: int = MAX_SIZE):
+        self.max_size = max_size
+        self.templates: "OrderedDict[Tuple[str, str], List[int]]" = OrderedDict()
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "learned": 0, "conflicts": 0, "evictions": 0}
+    
+    def skeleton(self, message: str) -> str:
+        return message.translate(self.MASK_TABLE)
+    
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.stats["lookups"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+    
+    def lookup(self, sender: str, skeleton: str) -> Optional[Tuple[int, int]]:
+        self.stats["lookups"] += 1
+        key = (sender, skeleton)
+        entry = self.templates.get(key)
+        if entry is not None and entry[2] >= self.MIN_CONFIRMATIONS:
+            self.templates.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0], entry[1]
+        self.stats["misses"] += 1
+        return None
+    
+    def learn(self, sender: str, skeleton: str, span: Tuple[int, int]):
+        key = (sender, skeleton)
+        entry = self.templates.get(key)
+        if entry is None:
+            self.templates[key] = [span[0], span[1], 1]
+            self.stats["learned"] += 1
+            if len(self.templates) > self.max_size:
+                self.templates.popitem(last=False)
+                self.stats["evictions"] += 1
+            return
+        if (entry[0], entry[1]) == span:
+            entry[2] += 1
+        else:
+            entry[0], entry[1], entry[2] = span[0], span[1], 1
+            self.stats["conflicts"] += 1
+        self.templates.move_to_end(key)
+    
+    def clear(self):
+        self.templates.clear()
+
+class OTPExtractor:
+    NUMBER_RE = re.compile(r'(?<![\d.,/+])\d{3,8}(?:[- ]\d{3,8})?(?![\d]|[.,]\d)')
+    TOKEN_RE = re.compile(
+        r'(?P<num>(?<![\d.,/+])\d{3,8}(?:[- ]\d{3,8})?(?![\d]|[.,]\d))'
+        r'|(?P<word>[^\W\d_]+)'
+    )
+    ADJACENT_AFTER_RE = re.compile(r'[- ]?\d')
+    STRONG_KEYWORDS = {
+        "code", "kode", "otp", "pin", "verification", "verifikasi", "passcode", "password",
+        "sandi", "token", "codigo", "código", "код", "confirmation", "konfirmasi", "guard",
+        "인증번호", "security", "xac", "thuc"
+    }
+    WEAK_KEYWORDS = {"is", "adalah", "use", "gunakan", "es", "est", "la", "é", "ist", "lautet"}
+    TIME_WORDS = {
+        "menit", "minute", "minutes", "min", "mins", "detik", "second", "seconds", "sec",
+        "jam", "hour", "hours", "minutos", "segundos"
+    }
+    SERVICE_HINTS = {
+        "whatsapp": re.compile(r'(?<!\d)(\d{3}[- ]\d{3})(?!\d)'),
+        "signal": re.compile(r'(?<!\d)(\d{3}[- ]\d{3})(?!\d)'),
+        "google": re.compile(r'\bG-(\d{4,8})\b'),
+        "instagram": re.compile(r'(?<!\d)(\d{3} \d{3})(?!\d)')
+    }
+    WINDOW = 6
+    templates = OTPTemplateCache()
     
     @classmethod
-    def add_bot_message(cls, group_id: str, message_id: int):
-        data = cls.load_db("bot_messages")
-        if not isinstance(data, list):
-            data = []
-        
-        data.append({
-            "group_id": group_id,
-            "message_id": message_id,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        })
-        cls.save_db("bot_messages", data)
+    def service_hint(cls, message: str, sender: str) -> Optional[Tuple[int, int]]:
+        for service, pattern in cls.SERVICE_HINTS.items():
+            if service in sender:
+                match = pattern.search(message)
+                if match:
+                    return match.span(1)
+        return None
     
     @classmethod
-    def get_old_bot_messages(cls, older_than_minutes: int) -> List[Dict]:
-        data = cls.load_db("bot_messages")
-        if not isinstance(data, list):
-            return []
+    def score_candidates(cls, message: str) -> List[Tuple[float, int, int]]:
+        tokens = []
+        keywords = []
+        for match in cls.TOKEN_RE.finditer(message):
+            word = match.group("word")
+            if word is None:
+                tokens.append(("num", match.group("num"), match.start(), match.end()))
+                continue
+            lowered = word.lower()
+            if lowered in cls.STRONG_KEYWORDS:
+                keywords.append((len(tokens), 10.0))
+            elif lowered in cls.WEAK_KEYWORDS:
+                keywords.append((len(tokens), 5.0))
+            tokens.append(("word", lowered, match.start(), match.end()))
+        
+        candidates = []
+        for index, (kind, value, start, end) in enumerate(tokens):
+            if kind != "num":
+                continue
+            score = 0.0
+            for position, weight in keywords:
+                distance = index - position
+                if 0 < distance <= cls.WINDOW:
+                    score = max(score, weight - 1.5 * (distance - 1))
+                elif -cls.WINDOW <= distance < 0:
+                    score = max(score, weight * 0.5 - 2 * (-distance - 1))
+            
+            digits = len(value.replace("-", "").replace(" ", ""))
+            score += 2 if digits >= 4 else -2
+            if digits == 4 and value[:2] in ("19", "20"):
+                score -= 2
+            if index + 1 < len(tokens) and tokens[index + 1][0] == "word" and tokens[index + 1][1] in cls.TIME_WORDS:
+                score -= 8
+            if cls.ADJACENT_AFTER_RE.match(message, end) or (start >= 2 and message[start - 2].isdigit() and message[start - 1] in "- "):
+                score -= 8
+            
+            candidates.append((score, -start, end))
+        return candidates
+    
+    @classmethod
+    def locate(cls, message: str, sender: str = "") -> Optional[Tuple[int, int]]:
+        if sender:
+            span = cls.service_hint(message, sender)
+            if span:
+                return span
         
-        now = datetime.now(timezone.utc)
-        old_messages = []
-        for msg in data:
-            try:
-                timestamp = datetime.fromisoformat(msg["timestamp"])
-                if (now - timestamp).total_seconds() > older_than_minutes * 60:
-                    old_messages.append(msg)
-            except:
-                pass
+        numbers = [match.span() for match in cls.NUMBER_RE.finditer(message)]
+        if not numbers:
+            return None
+        if len(numbers) == 1:
+            return numbers[0]
         
-        return old_messages
+        candidates = cls.score_candidates(message)
+        if not candidates:
+            return None
+        _, negative_start, end = max(candidates)
+        return -negative_start, end
     
     @classmethod
-    def remove_bot_message(cls, group_id: str, message_id: int):
-        data = cls.load_db("bot_messages")
-        if not isinstance(data, list):
-            return
+    def extract(cls, message: str, senderid: str = "") -> str:
+        if not message:
+            return 'N/A'
+        
+        sender = senderid.lower() if senderid else ""
+        skeleton = None
+        if sender:
+            skeleton = cls.templates.skeleton(message)
+            span = cls.templates.lookup(sender, skeleton)
+            if span:
+                return message[span[0]:span[1]].replace(' ', '-')
+        
+        span = cls.locate(message, sender)
+        if span is None:
+            return 'N/A'
+        if sender:
+            cls.templates.learn(sender, skeleton, span)
+        return message[span[0]:span[1]].replace(' ', '-')
+
+class NumberNormalizer:
+    CANDIDATE_RE = re.compile(r'(?<![\w+])\+?\(?\d+\)?(?:[ \-.]\(?\d+\)?)*')
+    STRIP_TABLE = str.maketrans("", "", " ()-.+")
+    MIN_DIGITS = 8
+    MAX_DIGITS = 15
+    MAX_CODE_DIGITS = 4
+    LEGACY_RANGE = (10, 15)
+    DEFAULT_LENGTHS = {
+        "1": (10, 10), "7": (10, 10), "33": (9, 9), "44": (9, 10), "49": (7, 13),
+        "55": (10, 11), "58": (10, 10), "62": (9, 12), "81": (9, 10), "82": (8, 10),
+        "86": (9, 11), "91": (10, 10), "225": (8, 10), "228": (8, 8), "229": (8, 10),
+        "234": (8, 10)
+    }
+    cache: Optional[Tuple] = None
+    
+    @classmethod
+    def prefix_table(cls) -> Tuple[Dict[str, str], Dict[str, Tuple[int, int]], int, Dict]:
+        try:
+            stamp = (Database.BASE_DIR / "country.json").stat().st_mtime_ns
+        except OSError:
+            stamp = None
+        if cls.cache is None or cls.cache[0] != stamp:
+            countries = Database.get_countries()
+            bounds = {}
+            for code, info in countries.items():
+                if not code.isdigit() or len(code) > cls.MAX_CODE_DIGITS:
+                    continue
+                lengths = info.get("lengths") if isinstance(info, dict) else None
+                if not lengths:
+                    lengths = cls.DEFAULT_LENGTHS.get(code, (cls.MIN_DIGITS - len(code), cls.MAX_DIGITS - len(code)))
+                bounds[code] = (max(int(lengths[0]) + len(code), cls.MIN_DIGITS),
+                                min(int(lengths[1]) + len(code), cls.MAX_DIGITS))
+            width = max(map(len, bounds), default=0)
+            lookup = {}
+            for size in range(1, width + 1):
+                for value in range(10 ** size):
+                    prefix = f"{value:0{size}d}"
+                    for end in range(size, 0, -1):
+                        if prefix[:end] in bounds:
+                            lookup[prefix] = prefix[:end]
+                            break
+            cls.cache = (stamp, lookup, bounds, width, countries)
+        return cls.cache[1:]
+    
+    @classmethod
+    def invalidate(cls):
+        cls.cache = None
+    
+    @classmethod
+    def digits(cls, raw: str) -> str:
+        digits = raw if raw.isdigit() else raw.translate(cls.STRIP_TABLE)
+        if raw[0] != "+" and digits.startswith("00"):
+            digits = digits[2:]
+        return digits
+    
+    @classmethod
+    def country_code(cls, digits: str) -> Optional[str]:
+        lookup, _, width, _ = cls.prefix_table()
+        return lookup.get(digits[:width]) if width else None
+    
+    @classmethod
+    def classify(cls, digits: str, lookup: Dict[str, str], bounds: Dict[str, Tuple[int, int]], width: int) -> Tuple[str, Optional[str]]:
+        size = len(digits)
+        if size < cls.MIN_DIGITS:
+            return "short", None
+        if size > cls.MAX_DIGITS:
+            return "length", None
+        code = lookup.get(digits[:width])
+        if code is None:
+            return "unknown", None
+        low, high = bounds[code]
+        if low <= size <= high:
+            return "ok", code
+        return "length", code
+    
+    @classmethod
+    def normalize(cls, text: str) -> Dict:
+        lookup, bounds, width, _ = cls.prefix_table()
+        classify = cls.classify
+        strip = cls.STRIP_TABLE
+        seen = set()
+        groups: Dict[str, List[str]] = {code: [] for code in bounds}
+        unknown: List[str] = []
+        mislength: List[str] = []
+        rejected = {"length": 0, "unknown": 0, "duplicate": 0}
+        scanned = 0
+        
+        def take(digits: str, status: str, code: Optional[str]):
+            if digits in seen:
+                rejected["duplicate"] += 1
+                return
+            seen.add(digits)
+            if status == "ok":
+                groups[code].append(digits)
+            elif status == "unknown":
+                rejected["unknown"] += 1
+                unknown.append(digits)
+            else:
+                rejected["length"] += 1
+                mislength.append(digits)
+        
+        for raw in cls.CANDIDATE_RE.findall(text):
+            digits = raw if raw.isdigit() else raw.translate(strip)
+            if raw[0] != "+" and digits[:2] == "00":
+                digits = digits[2:]
+            code = lookup.get(digits[:width])
+            if code is not None and digits not in seen:
+                low, high = bounds[code]
+                if low <= len(digits) <= high:
+                    seen.add(digits)
+                    groups[code].append(digits)
+                    scanned += 1
+                    continue
+            status, code = classify(digits, lookup, bounds, width)
+            if status != "ok" and " " in raw:
+                checked = [(piece, classify(piece, lookup, bounds, width)) for piece in map(cls.digits, raw.split())]
+                if any(result[0] == "ok" for _, result in checked):
+                    for piece, (status, code) in checked:
+                        if status != "short":
+                            scanned += 1
+                            take(piece, status, code)
+                    continue
+            if status == "short":
+                continue
+            scanned += 1
+            take(digits, status, code)
         
-        new_data = [m for m in data if not (m["group_id"] == group_id and m["message_id"] == message_id)]
-        if len(new_data) != len(data):
-            cls.save_db("bot_messages", new_data)
+        ordered = sorted(((code, numbers) for code, numbers in groups.items() if numbers),
+                         key=lambda item: len(item[1]), reverse=True)
+        return {
+            "groups": dict(ordered),
+            "unknown": unknown,
+            "mislength": mislength,
+            "rejected": rejected,
+            "scanned": scanned,
+            "accepted": sum(len(numbers) for _, numbers in ordered)
+        }
+    
+    @classmethod
+    def numbers(cls, result: Dict, include_unknown: bool = False) -> List[str]:
+        numbers = [number for group in result["groups"].values() for number in group]
+        if include_unknown:
+            low, high = cls.LEGACY_RANGE
+            numbers.extend(number for number in result["unknown"] + result["mislength"] if low <= len(number) <= high)
+        return numbers
+    
+    @classmethod
+    def summary(cls, result: Dict, limit: int = 15) -> str:
+        countries = cls.prefix_table()[3]
+        lines = []
+        for code, numbers in list(result["groups"].items())[:limit]:
+            info = countries.get(code, {})
+            lines.append(f"{info.get('flag', '🌐')} {info.get('name', code)} (+{code}): {len(numbers):,}")
+        if len(result["groups"]) > limit:
+            lines.append(f"... and {len(result['groups']) - limit} more countries")
+        rejected = result["rejected"]
+        skipped = [f"{count:,} {reason}" for reason, count in rejected.items() if count]
+        if skipped:
+            lines.append(f"⚠️ Skipped: {', '.join(skipped)}")
+        return "\n".join(lines)
 
 class Utils:
     @staticmethod
-    def extract_otp(message: str) -> str:
-        patterns = [
-            re.compile(r'(?:kode|code|otp|pin|verification)[\s:]*([0-9]{3,8}(?:[- ][0-9]{3,8})?)', re.IGNORECASE),
-            re.compile(r'(?:adalah|is|use|gunakan)[\s:]*([0-9]{3,8}(?:[- ][0-9]{3,8})?)', re.IGNORECASE),
-            re.compile(r'(?::\s*|\/|\*)?([0-9]{3,8}(?:[- ][0-9]{3,8})?)(?:\.|,|$)'),
-            re.compile(r'\b([0-9]{3,8}(?:[- ][0-9]{3,8})?)\b'),
-            re.compile(r'#\s*([0-9]{3,8}(?:[- ][0-9]{3,8})?)')
-        ]
-        
-        for pattern in patterns:
-            match = pattern.search(message)
-            if match and match[1]:
-                return match[1].replace(' ', '-')
-        
-        dash_pattern = re.compile(r'\b(\d{3,8}[- ]\d{3,8})\b')
-        dash_match = dash_pattern.search(message)
-        if dash_match and dash_match[1]:
-            return dash_match[1].replace(' ', '-')
-        
-        all_numbers = re.findall(r'\b\d{3,8}\b', message)
-        if all_numbers and len(all_numbers) > 0:
-            for i in range(len(all_numbers) - 1, -1, -1):
-                num = all_numbers[i]
-                if 3 <= len(num) <= 8:
-                    return num
-        
-        return 'N/A'
+    def extract_otp(message: str, senderid: str = "") -> str:
+        with Metrics.timer("otp_extraction_seconds"):
+            return OTPExtractor.extract(message, senderid)
+    
+    @staticmethod
+    def percentiles(values, points=(50, 90, 95, 99)) -> Dict[str, float]:
+        ordered = sorted(values)
+        if not ordered:
+            return {f"p{point}": 0.0 for point in points}
+        last = len(ordered) - 1
+        return {f"p{point}": ordered[min(last, int(round(point / 100 * last)))] for point in points}
+    
+    @staticmethod
+    def format_shard(summary: Dict[str, Any]) -> str:
+        lag = f"{summary['lag']:.0f}s" if summary["lag"] is not None else "n/a"
+        line = (f"{summary['name']}: {summary['sms']} sms, {summary['per_minute']:.1f}/min, "
+                f"lag {lag}, {summary['errors']}/{summary['polls']} failed polls")
+        if summary["backoff"]:
+            line += f", backing off {summary['backoff']:.0f}s"
+        return line
+    
+    @staticmethod
+    def format_seconds(seconds: float) -> str:
+        if seconds < 1:
+            return f"{seconds * 1000:.0f}ms"
+        if seconds < 120:
+            return f"{seconds:.1f}s"
+        return f"{seconds / 60:.1f}m"
     
     @staticmethod
     def mask_phone(phone: str) -> str:
@@ -688,235 +1616,2295 @@ class Utils:
     
     @staticmethod
     def extract_numbers_from_file(file_content: str) -> List[str]:
-        numbers = []
-        for line in file_content.split('\n'):
-            line = line.strip()
-            if not line:
-                continue
-            
-            phone_matches = re.findall(r'\b\d{10,15}\b', line)
-            for phone in phone_matches:
-                numbers.append(phone)
-        
-        return list(set(numbers))
+        return NumberNormalizer.numbers(NumberNormalizer.normalize(file_content))
     
     @staticmethod
     def extract_numbers_from_text(text: str) -> List[str]:
-        numbers = re.findall(r'\b\d{10,15}\b', text)
-        return list(set(numbers))
+        return NumberNormalizer.numbers(NumberNormalizer.normalize(text), include_unknown=True)
 
-class OTPReceiver:
-    def __init__(self, config: Config):
-        self.config = config
-        self.URL = "https://api.iprn-elite.com/v1.0/json"
-        self.last_seen_id = None
+class MembershipTracker:
+    JOINED_STATUSES = ('member', 'administrator', 'creator')
+    RECONCILE_INTERVAL = 3600
+    RECONCILE_CONCURRENCY = 8
+    RECONCILE_BATCH = 100
+    RECONCILE_LIMIT = 500
+    RECONCILE_MAX_AGE = 86400
+    RECONCILE_PAUSE = 1.0
+    RECONCILE_ATTEMPTS = 3
+    FLUSH_INTERVAL = 30
     
-    def get_sms(self):
-        API_KEY = self.config.APIKEY
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Api-Key": API_KEY
-        }
-        
-        from datetime import timezone
-        now = datetime.now(timezone.utc)
-        start_time = (now - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        end_time = now.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        
-        payload = {
-            "jsonrpc": "2.0",
-            "method": "sms.mdr_full:get_list",
-            "params": {
-                "filter": {
-                    "start_date": start_time,
-                    "end_date": end_time
-                },
-                "page": 1,
-                "per_page": 10
-            },
-            "id": 1
+    def __init__(self):
+        self.table: Dict[str, Dict[str, str]] = {}
+        self.checked: Dict[Tuple[str, str], float] = {}
+        self.dirty = False
+        self.stats = {
+            "updates": 0,
+            "api_fallbacks": 0,
+            "reconcile_runs": 0,
+            "reconcile_checked": 0,
+            "reconcile_joined": 0,
+            "reconcile_left": 0,
+            "reconcile_errors": 0,
+            "reconcile_throttled": 0,
+            "reconcile_skipped": 0
         }
-        
-        try:
-            response = requests.post(self.URL, headers=headers, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"Server Error {response.status_code}: {response.text}")
-                return None
-        except Exception as e:
-            print(f"Connection Error: {e}")
-            return None
+        self.load()
     
-    async def process_sms(self, bot_app):
-        os.system('cls' if os.name == 'nt' else 'clear')
-
-        print(f"{Fore.CYAN}[]═════════════════════════════════[]{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}[]════════[] WAITING OTPS []════════[]{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}[]═════════════════════════════════[]{Style.RESET_ALL}")
+    def load(self):
+        data = Database.load_db("membership")
+        self.table = {}
+        if isinstance(data, dict):
+            for chat_id, members in data.items():
+                if isinstance(members, dict):
+                    self.table[str(chat_id)] = {str(u): str(s) for u, s in members.items()}
+        self.dirty = False
+    
+    def flush(self):
+        if self.dirty:
+            Database.save_db("membership", self.table)
+            self.dirty = False
+    
+    @staticmethod
+    def tracked_chats() -> List[str]:
+        chats = []
+        for info in Database.load_cached("verif").values():
+            group_id = str(info.get('id', ''))
+            if group_id.startswith('-100'):
+                chats.append(group_id)
+        return chats
+    
+    def get_status(self, chat_id: str, user_id: int) -> Optional[str]:
+        return self.table.get(str(chat_id), {}).get(str(user_id))
+    
+    def set_status(self, chat_id: str, user_id: int, status: str) -> bool:
+        self.checked[(str(chat_id), str(user_id))] = time.time()
+        members = self.table.setdefault(str(chat_id), {})
+        previous = members.get(str(user_id))
+        if previous == status:
+            return False
+        members[str(user_id)] = status
+        self.dirty = True
+        return True
+    
+    def is_joined(self, status: Optional[str]) -> bool:
+        return status in self.JOINED_STATUSES
+    
+    async def fetch_status(self, bot, chat_id: str, user_id: int) -> Optional[str]:
+        try:
+            member = await bot.get_chat_member(int(chat_id), user_id)
+        except Exception:
+            return None
+        self.set_status(chat_id, user_id, member.status)
+        return member.status
+    
+    async def has_joined_all(self, bot, user_id: int, refresh: bool = False) -> bool:
+        for chat_id in self.tracked_chats():
+            status = self.get_status(chat_id, user_id)
+            if status is None or (refresh and not self.is_joined(status)):
+                self.stats["api_fallbacks"] += 1
+                status = await self.fetch_status(bot, chat_id, user_id)
+            if not self.is_joined(status):
+                return False
+        return True
+    
+    def on_member_update(self, chat_id: str, user_id: int, status: str) -> bool:
+        if str(chat_id) not in self.tracked_chats():
+            return False
+        self.stats["updates"] += 1
+        self.set_status(chat_id, user_id, status)
+        return True
+    
+    async def reconcile(self, bot) -> Dict[str, int]:
+        chats = self.tracked_chats()
+        for chat_id in list(self.table.keys()):
+            if chat_id not in chats:
+                del self.table[chat_id]
+                self.dirty = True
+        self.checked = {key: at for key, at in self.checked.items() if key[0] in chats}
+        
+        verified = Database.get_users().get("Verified", [])
+        now = time.time()
+        stale = []
+        for chat_id in chats:
+            user_ids = set(self.table.get(chat_id, {}).keys())
+            user_ids.update(str(u) for u in verified)
+            for user_id in user_ids:
+                checked_at = self.checked.get((chat_id, user_id), 0.0)
+                if now - checked_at >= self.RECONCILE_MAX_AGE:
+                    stale.append((checked_at, chat_id, int(user_id)))
+        stale.sort()
+        pairs = [(chat_id, user_id) for _, chat_id, user_id in stale[:self.RECONCILE_LIMIT]]
+        
+        diff = {"checked": 0, "joined": 0, "left": 0, "errors": 0, "throttled": 0,
+                "skipped": len(stale) - len(pairs)}
+        semaphore = asyncio.Semaphore(self.RECONCILE_CONCURRENCY)
+        cooldown = {"until": 0.0}
+        
+        async def check(chat_id: str, user_id: int):
+            async with semaphore:
+                before = self.get_status(chat_id, user_id)
+                member = None
+                for attempt in range(self.RECONCILE_ATTEMPTS):
+                    wait = cooldown["until"] - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    try:
+                        member = await bot.get_chat_member(int(chat_id), user_id)
+                        break
+                    except RetryAfter as e:
+                        diff["throttled"] += 1
+                        retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+                        cooldown["until"] = max(cooldown["until"], time.monotonic() + float(retry_after))
+                    except Exception:
+                        break
+                if member is None:
+                    diff["errors"] += 1
+                    return
+                diff["checked"] += 1
+                if self.set_status(chat_id, user_id, member.status):
+                    if self.is_joined(member.status) and not self.is_joined(before):
+                        diff["joined"] += 1
+                    elif self.is_joined(before) and not self.is_joined(member.status):
+                        diff["left"] += 1
+        
+        for start in range(0, len(pairs), self.RECONCILE_BATCH):
+            if start:
+                await asyncio.sleep(self.RECONCILE_PAUSE)
+            batch = pairs[start:start + self.RECONCILE_BATCH]
+            await asyncio.gather(*(check(chat_id, user_id) for chat_id, user_id in batch))
+        
+        self.stats["reconcile_runs"] += 1
+        self.stats["reconcile_checked"] += diff["checked"]
+        self.stats["reconcile_joined"] += diff["joined"]
+        self.stats["reconcile_left"] += diff["left"]
+        self.stats["reconcile_errors"] += diff["errors"]
+        self.stats["reconcile_throttled"] += diff["throttled"]
+        self.stats["reconcile_skipped"] += diff["skipped"]
+        self.flush()
+        return diff
+
+class AutoDeleteQueue:
+    JOB_NAME = "auto_delete"
+    BATCH_SIZE = 100
+    MAX_ATTEMPTS = 3
+    MAX_PASSES = 5
+    RETRY_DELAY = 60
+    PERMANENT_ERRORS = ("chat not found", "bot was kicked", "not enough rights", "have no rights")
+    
+    def __init__(self):
+        self.heap: List[Tuple[float, str, int, int]] = []
+        self.ttl = 0
+        self.job_queue: Optional[JobQueue] = None
+        self.callback = None
+        self.next_deadline: Optional[float] = None
+        self.dirty = False
+        self.load()
+    
+    def load(self):
+        setting = Database.get_autodel_setting()
+        self.ttl = int(setting.get("minutes", 0)) * 60 if setting.get("enabled") else 0
+        
+        data = Database.load_db("bot_messages")
+        rows = []
+        if isinstance(data, list):
+            for item in data:
+                try:
+                    if isinstance(item, list):
+                        passes = int(item[3]) if len(item) > 3 else 0
+                        rows.append((float(item[0]), str(item[1]), int(item[2]), passes))
+                    elif isinstance(item, dict):
+                        sent_at = datetime.fromisoformat(item["timestamp"]).timestamp()
+                        rows.append((sent_at + self.ttl, str(item["group_id"]), int(item["message_id"]), 0))
+                except Exception:
+                    continue
+        heapq.heapify(rows)
+        self.heap = rows if self.enabled else []
+        self.dirty = bool(rows) and not self.enabled
+    
+    def persist(self):
+        Database.save_db("bot_messages", [
+            [round(e, 3), c, m, p] if p else [round(e, 3), c, m] for e, c, m, p in self.heap
+        ], compact=True)
+        self.dirty = False
+    
+    def flush(self):
+        if self.dirty:
+            self.persist()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+    
+    def set_ttl(self, minutes: int):
+        new_ttl = max(minutes, 0) * 60
+        delta = new_ttl - self.ttl
+        if not new_ttl:
+            self.dirty = self.dirty or bool(self.heap)
+            self.heap = []
+        elif delta:
+            self.heap = [(e + delta, c, m, p) for e, c, m, p in self.heap]
+            self.dirty = True
+        self.ttl = new_ttl
+        self.reschedule()
+    
+    def push(self, chat_id: str, message_id: int):
+        if not self.enabled:
+            return
+        expire_at = time.time() + self.ttl
+        heapq.heappush(self.heap, (expire_at, str(chat_id), int(message_id), 0))
+        self.dirty = True
+        if self.next_deadline is None or expire_at < self.next_deadline:
+            self.reschedule()
+    
+    def pop_expired(self, now: Optional[float] = None) -> Dict[str, Dict[int, int]]:
+        if now is None:
+            now = time.time()
+        expired: Dict[str, Dict[int, int]] = {}
+        while self.heap and self.heap[0][0] <= now:
+            _, chat_id, message_id, passes = heapq.heappop(self.heap)
+            expired.setdefault(chat_id, {})[message_id] = passes
+        return expired
+    
+    @classmethod
+    def is_permanent(cls, error: Exception) -> bool:
+        if isinstance(error, Forbidden):
+            return True
+        message = str(error).lower()
+        return isinstance(error, BadRequest) and any(text in message for text in cls.PERMANENT_ERRORS)
+    
+    async def delete_batch(self, bot, chat_id: str, message_ids: List[int], stats: Dict[str, int]) -> List[int]:
+        for attempt in range(self.MAX_ATTEMPTS):
+            try:
+                stats["calls"] += 1
+                await bot.delete_messages(chat_id=int(chat_id), message_ids=message_ids)
+                stats["deleted"] += len(message_ids)
+                return []
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+                await asyncio.sleep(retry_after)
+            except (BadRequest, Forbidden) as e:
+                if self.is_permanent(e):
+                    raise
+                if len(message_ids) == 1:
+                    stats["failed"] += 1
+                    return []
+                middle = len(message_ids) // 2
+                left = await self.delete_batch(bot, chat_id, message_ids[:middle], stats)
+                right = await self.delete_batch(bot, chat_id, message_ids[middle:], stats)
+                return left + right
+            except Exception:
+                return message_ids
+        return message_ids
+    
+    async def delete_expired(self, bot) -> Dict[str, int]:
+        stats = {"expired": 0, "deleted": 0, "failed": 0, "dropped": 0, "requeued": 0, "calls": 0}
+        expired = self.pop_expired()
+        if not expired:
+            return stats
+        
+        retry_at = time.time() + self.RETRY_DELAY
+        for chat_id, passes in expired.items():
+            message_ids = list(passes)
+            stats["expired"] += len(message_ids)
+            for i in range(0, len(message_ids), self.BATCH_SIZE):
+                try:
+                    leftover = await self.delete_batch(bot, chat_id, message_ids[i:i + self.BATCH_SIZE], stats)
+                except (BadRequest, Forbidden) as e:
+                    stats["dropped"] += len(message_ids) - i
+                    log.warning("auto-delete dropped chat: %s", e, extra={"chat_id": chat_id, "messages": len(message_ids) - i})
+                    break
+                for message_id in leftover:
+                    if passes[message_id] + 1 >= self.MAX_PASSES:
+                        stats["dropped"] += 1
+                        continue
+                    heapq.heappush(self.heap, (retry_at, chat_id, message_id, passes[message_id] + 1))
+                    stats["requeued"] += 1
+        
+        self.dirty = True
+        return stats
+    
+    def attach(self, job_queue: Optional[JobQueue], callback):
+        self.job_queue = job_queue
+        self.callback = callback
+        self.reschedule()
+    
+    def cancel(self):
+        if self.job_queue:
+            for job in self.job_queue.get_jobs_by_name(self.JOB_NAME):
+                job.schedule_removal()
+        self.next_deadline = None
+    
+    def reschedule(self):
+        self.cancel()
+        if not self.job_queue or not self.callback or not self.enabled or not self.heap:
+            return
+        self.next_deadline = self.heap[0][0]
+        self.job_queue.run_once(
+            self.callback,
+            when=max(self.next_deadline - time.time(), 0),
+            name=self.JOB_NAME
+        )
+
+class SpoolSlice:
+    def __init__(self, spool, offset: int, length: int):
+        self.spool = spool
+        self.offset = offset
+        self.length = length
+        self.position = 0
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def tell(self) -> int:
+        return self.position
+    
+    def seek(self, position: int, whence: int = 0) -> int:
+        base = {0: 0, 1: self.position, 2: self.length}[whence]
+        self.position = min(max(base + position, 0), self.length)
+        return self.position
+    
+    def read(self, size: int = -1) -> bytes:
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b""
+        self.spool.seek(self.offset + self.position)
+        chunk = self.spool.read(size)
+        self.position += len(chunk)
+        return chunk
+
+class BackupManager:
+    UPLOAD_LIMIT = 19 * 1024 * 1024
+    LOCAL_UPLOAD_LIMIT = 49 * 1024 * 1024
+    DOWNLOAD_LIMIT = 20 * 1024 * 1024
+    PART_RE = re.compile(r'^(?P<base>.+)\.(?P<index>\d{3})$')
+    PART_CAPTION_RE = re.compile(r'Part (\d+)/(\d+)')
+    SPOOL_SIZE = 16 * 1024 * 1024
+    DENSE_SUFFIXES = {".zip", ".gz", ".zst", ".jpg", ".jpeg", ".png", ".mp4"}
+    SOURCES = {
+        "db": ("database", "*.json"),
+        "numbers": ("numbers", "*.txt")
+    }
+    STATE_DIR = Path("backups")
+    MANIFEST_NAME = "MANIFEST.json"
+    MANIFEST_LIMIT = 16 * 1024 * 1024
+    MAX_CHAIN = 10
+    MAX_MEMBERS = 10000
+    MAX_UNPACKED = 1024 * 1024 * 1024
+    
+    @staticmethod
+    def zstd():
+        try:
+            import zstandard
+        except ImportError:
+            return None
+        return zstandard
+    
+    @classmethod
+    def get_codec(cls) -> str:
+        codec = os.getenv("BACKUP_CODEC", "auto").lower()
+        zstandard = cls.zstd()
+        if codec == "auto":
+            codec = "zstd" if zstandard else "deflate"
+        if codec == "zstd" and zstandard is None:
+            codec = "deflate"
+        if codec not in ("zstd", "deflate", "stored"):
+            codec = "deflate"
+        return codec
+    
+    @classmethod
+    def collect_files(cls, kind: str) -> List[Tuple[Path, str]]:
+        directory, pattern = cls.SOURCES[kind]
+        return [(path, f"{directory}/{path.name}") for path in sorted(Path(directory).glob(pattern))]
+    
+    @classmethod
+    def load_state(cls) -> Dict:
+        try:
+            with open(cls.STATE_DIR / "state.json", "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+    
+    @classmethod
+    def save_state(cls, state: Dict):
+        cls.STATE_DIR.mkdir(exist_ok=True)
+        temp_path = cls.STATE_DIR / "state.json.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(temp_path, cls.STATE_DIR / "state.json")
+    
+    @staticmethod
+    def hash_file(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    @classmethod
+    def scan(cls, kind: str, previous: Dict[str, List]) -> Dict[str, List]:
+        entries = {}
+        for path, arcname in cls.collect_files(kind):
+            stat = path.stat()
+            old = previous.get(arcname)
+            if old and old[1] == stat.st_size and old[2] == stat.st_mtime_ns:
+                entries[arcname] = old
+            else:
+                entries[arcname] = [cls.hash_file(path), stat.st_size, stat.st_mtime_ns]
+        return entries
+    
+    @classmethod
+    def plan(cls, kind: str, mode: str = "full") -> Optional[Dict]:
+        state = cls.load_state().get(kind, {})
+        previous = state.get("files", {})
+        chain = state.get("chain", [])
+        current = cls.scan(kind, previous)
+        
+        full = mode != "inc" or not chain or len(chain) > cls.MAX_CHAIN
+        if full:
+            changed = list(current.keys())
+            deleted = []
+        else:
+            changed = [a for a, entry in current.items() if a not in previous or previous[a][0] != entry[0]]
+            deleted = [a for a in previous if a not in current]
+            if not changed and not deleted:
+                return None
+        
+        backup_id = f"{kind}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}"
+        manifest = {
+            "id": backup_id,
+            "kind": kind,
+            "type": "full" if full else "delta",
+            "base": backup_id if full else chain[0],
+            "parent": None if full else chain[-1],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "files": {a: entry[0] for a, entry in current.items()},
+            "changed": changed,
+            "deleted": deleted
+        }
+        return {
+            "manifest": manifest,
+            "entries": current,
+            "chain": [backup_id] if full else chain + [backup_id]
+        }
+    
+    @classmethod
+    def commit(cls, kind: str, plan: Dict):
+        state = cls.load_state()
+        kind_state = state.get(kind, {})
+        kind_state["chain"] = plan["chain"]
+        kind_state["files"] = plan["entries"]
+        state[kind] = kind_state
+        cls.save_state(state)
+    
+    @classmethod
+    def write_archive(cls, files: List[Tuple[Path, str]], codec: str, target,
+                      extra: Optional[Dict[str, bytes]] = None) -> str:
+        import tarfile
+        import zipfile
+        
+        extra = extra or {}
+        if codec == "zstd":
+            compressor = cls.zstd().ZstdCompressor(level=3, threads=-1)
+            with compressor.stream_writer(target, closefd=False) as writer:
+                with tarfile.open(fileobj=writer, mode="w|") as tar:
+                    for name, payload in extra.items():
+                        info = tarfile.TarInfo(name)
+                        info.size = len(payload)
+                        info.mtime = int(time.time())
+                        tar.addfile(info, io.BytesIO(payload))
+                    for path, arcname in files:
+                        tar.add(path, arcname=arcname)
+            return ".tar.zst"
+        
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zipf:
+            for name, payload in extra.items():
+                zipf.writestr(name, payload)
+            for path, arcname in files:
+                if codec == "stored" or path.suffix.lower() in cls.DENSE_SUFFIXES:
+                    zipf.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+                else:
+                    zipf.write(path, arcname)
+        return ".zip"
+    
+    @classmethod
+    def build(cls, kind: str, mode: str = "full"):
+        plan = cls.plan(kind, mode)
+        if plan is None:
+            return None, None, [], None
+        manifest = plan["manifest"]
+        files = [(Path(arcname), arcname) for arcname in manifest["changed"]]
+        extra = {cls.MANIFEST_NAME: json.dumps(manifest, ensure_ascii=False).encode("utf-8")}
+        spool = tempfile.SpooledTemporaryFile(max_size=cls.SPOOL_SIZE)
+        extension = cls.write_archive(files, cls.get_codec(), spool, extra)
+        size = spool.tell()
+        spool.seek(0)
+        return spool, extension, cls.split_parts(spool, size), plan
+    
+    @classmethod
+    def part_limit(cls) -> int:
+        return cls.LOCAL_UPLOAD_LIMIT if Config.BOT_API_URL else cls.UPLOAD_LIMIT
+    
+    @classmethod
+    def split_parts(cls, spool, size: int) -> List[Any]:
+        limit = cls.part_limit()
+        if size <= limit:
+            return [spool]
+        return [SpoolSlice(spool, offset, min(limit, size - offset)) for offset in range(0, size, limit)]
+    
+    @classmethod
+    def part_info(cls, filename: Optional[str], caption: Optional[str]) -> Optional[Tuple[str, int, int]]:
+        match = cls.PART_RE.match(filename or "")
+        if not match:
+            return None
+        total = cls.PART_CAPTION_RE.search(caption or "")
+        if not total:
+            raise ValueError("split archive part without its 'Part i/n' caption, reply to the original backup message")
+        index, count = int(match["index"]), int(total[2])
+        if not 1 <= index <= count:
+            raise ValueError(f"part {index} is outside 1..{count}")
+        return PurePosixPath(match["base"]).name, index, count
+    
+    @classmethod
+    def parts_dir(cls, base: str) -> Path:
+        return cls.STATE_DIR / "parts" / base
+    
+    @classmethod
+    def stash_part(cls, source: Path, base: str, index: int, total: int) -> Tuple[Optional[Path], List[int]]:
+        directory = cls.parts_dir(base)
+        directory.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(source), directory / f"{index:03d}")
+        missing = [i for i in range(1, total + 1) if not (directory / f"{i:03d}").exists()]
+        if missing:
+            return None, missing
+        archive = directory / "archive"
+        with open(archive, "wb") as out:
+            for i in range(1, total + 1):
+                with open(directory / f"{i:03d}", "rb") as part:
+                    shutil.copyfileobj(part, out, 1024 * 1024)
+        return archive, []
+    
+    @classmethod
+    async def send(cls, bot, chat_id: int, kind: str, basename: str, title: str, mode: str = "full") -> int:
+        spool, extension, parts, plan = await asyncio.to_thread(cls.build, kind, mode)
+        if plan is None:
+            return 0
+        try:
+            manifest = plan["manifest"]
+            total = len(parts)
+            if manifest["type"] == "delta":
+                basename += "_inc"
+                title += " (Incremental)"
+            summary = (
+                f"🧾 <i>{manifest['type']} • {len(manifest['changed'])} changed • "
+                f"{len(manifest['deleted'])} deleted</i>\n"
+                f"🆔 <code>{manifest['id']}</code>\n"
+            )
+            for index, part in enumerate(parts, 1):
+                filename = f"{basename}{extension}"
+                part_info = ""
+                if total > 1:
+                    filename += f".{index:03d}"
+                    part_info = f"🧩 <i>Part {index}/{total}</i>\n"
+                await bot.send_document(
+                    chat_id=chat_id,
+                    document=part,
+                    filename=filename,
+                    caption=f"📦 <b>{title}</b>\n"
+                            f"⏰ <i>{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</i>\n"
+                            f"{summary}{part_info}\n"
+                            f"<blockquote>©𝗣𝗼𝘄𝗲𝗿𝗲𝗱 𝗕𝘆 𝗗𝗮𝘆𝘇𝗗𝗶𝗴𝗶𝘁𝗮𝗹 𝗢𝗳𝗳𝗶𝗰𝗶𝗮𝗹亗</blockquote>",
+                    parse_mode=ParseMode.HTML,
+                    read_timeout=300,
+                    write_timeout=300
+                )
+            cls.commit(kind, plan)
+            return total
+        finally:
+            spool.close()
+    
+    @classmethod
+    def open_members(cls, archive_path: Path):
+        import tarfile
+        import zipfile
+        
+        if zipfile.is_zipfile(archive_path):
+            with zipfile.ZipFile(archive_path, "r") as zipf:
+                for info in zipf.infolist():
+                    if not info.is_dir():
+                        with zipf.open(info) as member:
+                            yield info.filename, member
+            return
+        
+        zstandard = cls.zstd()
+        if zstandard is None:
+            raise ValueError("zstandard is not installed, cannot read .tar.zst backups")
+        with open(archive_path, "rb") as raw:
+            reader = zstandard.ZstdDecompressor().stream_reader(raw)
+            with tarfile.open(fileobj=reader, mode="r|") as tar:
+                for info in tar:
+                    if info.isfile():
+                        yield info.name, tar.extractfile(info)
+    
+    @classmethod
+    def is_valid_member(cls, kind: str, name: str) -> bool:
+        if name == cls.MANIFEST_NAME:
+            return True
+        directory, pattern = cls.SOURCES[kind]
+        path = PurePosixPath(name)
+        return (
+            not path.is_absolute()
+            and len(path.parts) == 2
+            and path.parts[0] == directory
+            and not path.name.startswith(".")
+            and "\\" not in name
+            and path.match(pattern)
+        )
+    
+    @classmethod
+    def read_manifest(cls, member) -> Dict:
+        payload = member.read(cls.MANIFEST_LIMIT + 1)
+        if len(payload) > cls.MANIFEST_LIMIT:
+            raise ValueError("archive manifest is too large")
+        return json.loads(payload.decode("utf-8"))
+    
+    @classmethod
+    def extract(cls, archive_path: Path, kind: str, root: Path) -> Optional[Dict]:
+        manifest = None
+        members = 0
+        unpacked = 0
+        for name, member in cls.open_members(archive_path):
+            members += 1
+            if members > cls.MAX_MEMBERS:
+                raise ValueError(f"archive has more than {cls.MAX_MEMBERS} members")
+            if not cls.is_valid_member(kind, name):
+                raise ValueError(f"Unexpected path in archive: {name}")
+            if name == cls.MANIFEST_NAME:
+                manifest = cls.read_manifest(member)
+                continue
+            target = root / name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if target.exists():
+                target.unlink()
+            with open(target, "wb") as f:
+                while True:
+                    chunk = member.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    unpacked += len(chunk)
+                    if unpacked > cls.MAX_UNPACKED:
+                        raise ValueError(f"archive unpacks to more than {cls.MAX_UNPACKED // (1024 * 1024)} MB")
+                    f.write(chunk)
+        
+        if manifest:
+            for arcname in manifest.get("deleted", []):
+                if not cls.is_valid_member(kind, arcname):
+                    continue
+                path = root / arcname
+                if path.exists():
+                    path.unlink()
+        return manifest
+    
+    @classmethod
+    def peek_manifest(cls, archive_path: Path) -> Optional[Dict]:
+        for name, member in cls.open_members(archive_path):
+            if name == cls.MANIFEST_NAME:
+                return cls.read_manifest(member)
+        return None
+    
+    @classmethod
+    def check_replay_order(cls, kind: str, manifest: Optional[Dict]) -> Optional[str]:
+        if not manifest or manifest.get("type") != "delta":
+            return None
+        if manifest.get("kind") != kind:
+            return f"archive is a {manifest.get('kind')} backup"
+        parent = manifest.get("parent")
+        if parent and parent == cls.load_state().get(kind, {}).get("restored"):
+            return None
+        return f"apply {parent} first"
+    
+    @classmethod
+    def mark_restored(cls, kind: str, manifest: Optional[Dict]):
+        if not manifest:
+            return
+        state = cls.load_state()
+        kind_state = state.get(kind, {})
+        kind_state["restored"] = manifest.get("id")
+        state[kind] = kind_state
+        cls.save_state(state)
+    
+    @staticmethod
+    def copy_tree(source: Path, target: Path, pattern: str):
+        target.mkdir(parents=True, exist_ok=True)
+        if not source.exists():
+            return
+        for path in source.glob(pattern):
+            if path.is_file() and not path.name.startswith("."):
+                shutil.copy2(path, target / path.name)
+    
+    @classmethod
+    def verify_staged(cls, kind: str, directory: Path):
+        if kind == "db":
+            for path in directory.glob("*.json"):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except Exception as e:
+                    raise ValueError(f"{path.name} is not valid JSON: {e}")
+                expected = Database.get_default_structure(path.stem)
+                if path.stem in Database.KNOWN_TABLES and type(data) is not type(expected):
+                    raise ValueError(f"{path.name} has unexpected structure")
+        else:
+            for path in directory.glob("*.txt"):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        for _ in f:
+                            pass
+                except UnicodeDecodeError:
+                    raise ValueError(f"{path.name} is not a UTF-8 text file")
+    
+    @classmethod
+    def prepare_restore(cls, archive_path: Path, kind: str) -> Tuple[Path, Optional[Dict]]:
+        manifest = cls.peek_manifest(archive_path)
+        problem = cls.check_replay_order(kind, manifest)
+        if problem:
+            raise ValueError(f"Out of order incremental restore: {problem}")
+        
+        directory, pattern = cls.SOURCES[kind]
+        root = Path(tempfile.mkdtemp(prefix=f".restore_{kind}_", dir="."))
+        try:
+            if manifest and manifest.get("type") == "delta":
+                cls.copy_tree(Path(directory), root / directory, pattern)
+            else:
+                (root / directory).mkdir(parents=True)
+            manifest = cls.extract(archive_path, kind, root)
+            cls.verify_staged(kind, root / directory)
+        except Exception:
+            shutil.rmtree(root, ignore_errors=True)
+            raise
+        return root, manifest
+    
+    @staticmethod
+    def owns_directory(live: Path, pattern: str) -> bool:
+        return all(path.is_file() and path.match(pattern) for path in live.iterdir())
+    
+    @staticmethod
+    def swap_directory(live: Path, staged: Path):
+        retired = live.with_name(f".{live.name}.old")
+        shutil.rmtree(retired, ignore_errors=True)
+        os.rename(live, retired)
+        os.rename(staged, live)
+        shutil.rmtree(retired, ignore_errors=True)
+    
+    @classmethod
+    def commit_restore(cls, kind: str, root: Path, manifest: Optional[Dict]):
+        problem = cls.check_replay_order(kind, manifest)
+        if problem:
+            raise ValueError(f"Out of order incremental restore: {problem}")
+        directory, pattern = cls.SOURCES[kind]
+        live = Path(directory)
+        staged = root / directory
+        live.mkdir(exist_ok=True)
+        if cls.owns_directory(live, pattern):
+            cls.swap_directory(live, staged)
+        else:
+            keep = set()
+            for path in staged.glob(pattern):
+                if path.is_file() and not path.name.startswith("."):
+                    os.replace(path, live / path.name)
+                    keep.add(path.name)
+            for path in live.glob(pattern):
+                if path.is_file() and not path.name.startswith(".") and path.name not in keep:
+                    path.unlink()
+        cls.mark_restored(kind, manifest)
+        Database.notify_reload(kind)
+    
+    @classmethod
+    def cleanup_restore(cls, root: Path):
+        shutil.rmtree(root, ignore_errors=True)
+
+class MessageRenderer:
+    LINK_FIELDS = ("CH_INFO", "OWNER_LINK", "SUPPORT", "OTPS_GROUP", "NUM_GROUP_ID")
+    NO_PREVIEW = LinkPreviewOptions(is_disabled=True)
+    GREETING_HEAD = "\n<blockquote>𝗢𝗧𝗣𝗦 𝗫 𝗗𝘇𝗗 𝗣𝗥𝗘𝗠𝗜𝗨𝗠</blockquote>\n \n( 👤 ) - Info 𝗛𝗲𝗹𝗹𝗼, @"
+    GREETING_INTRO = "\n𝗞𝗶𝗹𝗹𝘂𝗮 𝗫 𝗡𝗲𝘁𝘄𝗼𝗿𝗸 ボット is a fast, flexible and secure automation tool. For digital tasks, support me!.......\n\n"
+    DEVELOPER_FOOTER = '<blockquote>© 𝗗𝗲𝘃𝗲𝗹𝗼𝗽𝗲𝗿 <a href="{owner_link}">𝑲𝒂𝒏𝒈𝑫𝒂𝒚𝒁亗</a> </blockquote>'
+    PANELS = {
+        "user_menu": """<blockquote>» 𝗠𝗔𝗜𝗡 𝗠𝗘𝗡𝗨</blockquote>
+• 📞 𝗚𝗲𝘁 𝗡𝘂𝗺𝗯𝗲𝗿 → Request number
+• 🔒 𝗢𝗧𝗣 → OTP Group
+• 🔗 𝗖𝗵𝗮𝗻𝗻𝗲𝗹 → Official channel
+• ❓ 𝗛𝗲𝗹𝗽 → Contact owner/support
+• 📊 𝗧𝗿𝗮𝗳𝗳𝗶𝗰 → Check OTP traffic
+
+<b>💡 Instructions:</b>
+<i>Use /fastotps and send your number max 10, for fast receive otps in inbox</i>
+{footer}""",
+        "owner_menu": """<blockquote>» 𝗢𝗪𝗡𝗘𝗥 𝗠𝗘𝗡𝗨</blockquote>
+❯ 𝗦𝗬𝗦𝗧𝗘𝗠 𝗢𝗣𝗧𝗜𝗢𝗡𝗦
+» 𝗥𝗮𝗻𝗴𝗲𝘀  —  Ranges Configuration
+» 𝗚𝗿𝗼𝘂𝗽   —  Groups Configuration
+» 𝗢𝘁𝗵𝗲𝗿𝘀  —  Other Configuration
+
+{footer}
+""",
+        "other_menu": """<blockquote>» 𝗢𝗪𝗡𝗘𝗥 𝗖𝗢𝗠𝗠𝗔𝗡𝗗𝗦</blockquote>
+
+/setchlink - Set channel info link
+/setownerlink - Set owner link  
+/setsupportlink - Set support link
+/setotpslink - Set OTP group link
+/groupnumid - Set number group ID
+/autodelmsg - Auto delete old messages
+/verification - Manage user verification
+/cfd - Broadcast message to all users
+/fwd - Forward message to all users
+
+<blockquote>» 𝗨𝗦𝗘𝗥 𝗖𝗢𝗠𝗠𝗔𝗡𝗗𝗦</blockquote>
+/start - Start the bot
+/fastotps - Fast OTPs for numbers
+/traffic - Check OTP traffic (today)
+
+{footer}
+""",
+        "backup_menu": """<blockquote>❯ 𝗕𝗔𝗖𝗞𝗨𝗣 & 𝗥𝗘𝗦𝗧𝗢𝗥𝗘 𝗠𝗘𝗡𝗨</blockquote>
+
+» 𝗔𝗩𝗔𝗜𝗟𝗔𝗕𝗟𝗘 𝗖𝗢𝗠𝗠𝗔𝗡𝗗𝗦:
+• /backupdb [inc] - Backup database
+• /backupnum [inc] - Backup numbers
+• /restoredb - Restore database
+• /restorenum - Restore numbers
+
+{footer}
+"""
+    }
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.cache: Dict[Tuple, Any] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+    
+    def snapshot(self) -> Tuple:
+        return tuple(getattr(self.config, field, "") for field in self.LINK_FIELDS)
+    
+    def cached(self, name: str, builder, *values):
+        key = (name, self.snapshot()) + values
+        value = self.cache.get(key)
+        if value is None:
+            value = self.cache[key] = builder()
+            self.stats["misses"] += 1
+        else:
+            self.stats["hits"] += 1
+        return value
+    
+    def invalidate(self):
+        self.cache.clear()
+        self.stats["invalidations"] += 1
+    
+    def panel_parts(self, name: str) -> Tuple[str, str]:
+        def build():
+            footer = self.DEVELOPER_FOOTER.replace("{owner_link}", self.config.OWNER_LINK)
+            body = self.PANELS[name].replace("{footer}", footer)
+            return self.GREETING_HEAD, self.GREETING_INTRO + body
+        return self.cached(f"panel:{name}", build)
+    
+    def panel(self, name: str, username: str) -> str:
+        head, tail = self.panel_parts(name)
+        return f"{head}{username}{tail}"
+    
+    def keyboard(self, name: str, builder) -> InlineKeyboardMarkup:
+        return self.cached(f"keyboard:{name}", lambda: InlineKeyboardMarkup(builder()))
+    
+    def otp_row(self, otp_code: str) -> List[InlineKeyboardButton]:
+        try:
+            button = InlineKeyboardButton(text=f"{otp_code}", copy_text=CopyTextButton(text=str(otp_code)))
+        except Exception:
+            button = InlineKeyboardButton(text=f"{otp_code}", callback_data="copy_otp")
+        return [button]
+    
+    def group_links_row(self, bot_username: str) -> Tuple[InlineKeyboardButton, ...]:
+        def build():
+            row = []
+            if bot_username:
+                row.append(InlineKeyboardButton("🔧 𝙿𝙰𝙽𝙴𝙻", url=f"https://t.me/{bot_username}"))
+            if self.config.CH_INFO:
+                row.append(InlineKeyboardButton("📢 𝙸𝙽𝙵𝙾", url=self.config.CH_INFO))
+            return tuple(row)
+        return self.cached("group_links_row", build, bot_username)
+    
+    def group_footer(self) -> str:
+        return self.cached(
+            "group_footer",
+            lambda: f"""▙━━━━━━━━━━━━━━━━━━━━▟
+<blockquote><b><a href="{self.config.OWNER_LINK}">©𝗣𝗼𝘄𝗲𝗿𝗲𝗱 𝗕𝘆 𝗗𝗮𝘆𝘇𝗗𝗶𝗴𝗶𝘁𝗮𝗹 𝗢𝗳𝗳𝗶𝗰𝗶𝗮𝗹亗</a></b></blockquote>
+"""
+        )
+    
+    def sms(self, phone: str, message: str, service: str, otp_code: str, country_info: Optional[Dict],
+            bot_username: str) -> Dict[str, Any]:
+        if country_info:
+            flag = country_info.get("flag", "🌐")
+            country = country_info.get("name", "Unknown")
+            short_name = country_info.get("shortName", "XX")
+        else:
+            flag = "🌐"
+            country = "Unknown"
+            short_name = "XX"
+        
+        service_abbr = Utils.get_service_abbr(service)
+        masked_phone = Utils.mask_phone(phone)
+        
+        user_text = f"""<blockquote>🚨 𝗣𝗥𝗘𝗠𝗜𝗨𝗠 𝗦𝗠𝗦 𝗥𝗘𝗖𝗜𝗘𝗩𝗘𝗗 𝗗𝘇𝗗 🚨</blockquote>
+
+» 𝗗𝗲𝘁𝗮𝗶𝗹𝘀 : {flag} <b>{country}</b> — {service}
+» 𝗡𝘂𝗺𝗯𝗲𝗿 : <code>+{phone}</code>
+» 𝗠𝗲𝘀𝘀𝗮𝗴𝗲 :
+<pre>{Utils.escape_html(message)}</pre>
+
+<blockquote>﹂ 𝖳𝗁𝖺𝗇𝗄 𝗒𝗈𝗎 𝖿𝗈𝗋 𝗎𝗌𝗂𝗇𝗀 DzD 𝖻𝗈𝗍💥</blockquote>"""
+        
+        group_text = f"""
+<blockquote>🚨 𝗣𝗥𝗘𝗠𝗜𝗨𝗠 𝗦𝗠𝗦 𝗥𝗘𝗖𝗜𝗘𝗩𝗘𝗗 𝗗𝘇𝗗 🚨</blockquote>
+▛━━━━━━━━━━━━━━━━━━━━▜
+┃  <b>{flag} #{short_name} #{service_abbr}  {masked_phone}</b>  ┃
+{self.group_footer()}"""
+        
+        otp_rows = [self.otp_row(otp_code)] if otp_code and otp_code != 'N/A' else []
+        links_row = self.group_links_row(bot_username)
+        group_rows = otp_rows + ([list(links_row)] if links_row else [])
+        
+        return {
+            "country": country,
+            "user_text": user_text,
+            "user_markup": InlineKeyboardMarkup(otp_rows) if otp_rows else None,
+            "group_text": group_text,
+            "group_markup": InlineKeyboardMarkup(group_rows) if group_rows else None
+        }
+
+class SamplingProfiler:
+    DEFAULT_SECONDS = 30
+    MAX_SECONDS = 300
+    DEFAULT_HZ = 100
+    MAX_HZ = 1000
+    active: Optional["SamplingProfiler"] = None
+    
+    def __init__(self, seconds: float, hz: int):
+        self.seconds = seconds
+        self.hz = hz
+        self.target = threading.get_ident()
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.started = 0.0
+        self.elapsed = 0.0
+        self.halt = threading.Event()
+        self.thread = threading.Thread(target=self.sample, name="profiler", daemon=True)
+    
+    @staticmethod
+    def frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(";", ",")
+    
+    def sample(self):
+        interval = 1 / self.hz
+        while not self.halt.wait(interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                stack.append(self.frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+    
+    @staticmethod
+    def task_dump() -> str:
+        lines = []
+        tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+        for task in tasks:
+            coro = task.get_coro()
+            lines.append(f"{task.get_name()}: {getattr(coro, '__qualname__', coro)}")
+            for frame in task.get_stack(limit=20):
+                lines.append(f"    {Path(frame.f_code.co_filename).name}:{frame.f_lineno} in {frame.f_code.co_name}")
+        return f"{len(tasks)} tasks\n" + "\n".join(lines) + "\n"
+    
+    async def run(self) -> Tuple[bytes, bytes]:
+        SamplingProfiler.active = self
+        self.started = time.perf_counter()
+        self.thread.start()
+        try:
+            await asyncio.to_thread(self.halt.wait, self.seconds)
+        finally:
+            self.halt.set()
+            self.thread.join()
+            self.elapsed = time.perf_counter() - self.started
+            SamplingProfiler.active = None
+        
+        collapsed = "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]))
+        return collapsed.encode("utf-8"), self.task_dump().encode("utf-8")
+    
+    def stop(self):
+        self.halt.set()
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    MAX_BACKLOG = 20
+    BUSY_NOTICE = "⏳ Still working on your previous requests. Please wait a moment and try again."
+    
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.backlogs: Dict[int, deque] = {}
+        self.notified: Set[int] = set()
+        self.stats = {"processed": 0, "queued": 0, "failed": 0, "dropped": 0, "max_backlog": 0}
+    
+    @staticmethod
+    def update_key(update: object) -> Optional[int]:
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+    
+    async def run(self, coroutine):
+        try:
+            await coroutine
+        except Exception as e:
+            self.stats["failed"] += 1
+            log.exception("update processing failed: %s", e)
+        self.stats["processed"] += 1
+    
+    async def do_process_update(self, update: object, coroutine):
+        key = self.update_key(update)
+        if key is None:
+            await self.run(coroutine)
+            return
+        
+        backlog = self.backlogs.get(key)
+        if backlog is not None:
+            if len(backlog) >= self.MAX_BACKLOG:
+                coroutine.close()
+                self.stats["dropped"] += 1
+                log.warning("update backlog full, rejected newest", extra={"key": key, "backlog": len(backlog)})
+                if key not in self.notified:
+                    self.notified.add(key)
+                    await self.notify_busy(update)
+                return
+            backlog.append(coroutine)
+            self.stats["queued"] += 1
+            self.stats["max_backlog"] = max(self.stats["max_backlog"], len(backlog))
+            return
+        
+        backlog = self.backlogs[key] = deque()
+        try:
+            await self.run(coroutine)
+            while backlog:
+                await self.run(backlog.popleft())
+        finally:
+            self.backlogs.pop(key, None)
+            self.notified.discard(key)
+            while backlog:
+                backlog.popleft().close()
+    
+    async def notify_busy(self, update: Update):
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(self.BUSY_NOTICE)
+            elif update.effective_message and update.effective_chat and update.effective_chat.type == "private":
+                await update.effective_message.reply_text(self.BUSY_NOTICE)
+        except Exception as e:
+            log.warning("busy notice failed: %s", e)
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        for backlog in self.backlogs.values():
+            while backlog:
+                backlog.popleft().close()
+        self.backlogs.clear()
+
+class WebhookServer:
+    SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+    STATS_PATH = "/webhook-stats"
+    LATENCY_SAMPLES = 10000
+    PENDING_TTL = 300
+    MAX_PENDING = 10000
+    
+    def __init__(self, config: Config, application: Application):
+        self.config = config
+        self.application = application
+        self.runner: Optional[web.AppRunner] = None
+        self.received: Dict[int, float] = {}
+        self.latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self.stats = {"accepted": 0, "rejected": 0, "invalid": 0, "handled": 0, "expired": 0}
+    
+    def prune(self, now: float):
+        while self.received:
+            update_id, started = next(iter(self.received.items()))
+            if now - started < self.PENDING_TTL and len(self.received) < self.MAX_PENDING:
+                break
+            del self.received[update_id]
+            self.stats["expired"] += 1
+    
+    def authorized(self, request: web.Request) -> bool:
+        token = request.headers.get(self.SECRET_HEADER, "")
+        return hmac.compare_digest(token.encode(), self.config.WEBHOOK_SECRET.encode())
+    
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if not self.authorized(request):
+            self.stats["rejected"] += 1
+            return web.Response(status=403)
+        
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except Exception as e:
+            self.stats["invalid"] += 1
+            log.warning("invalid webhook payload: %s", e)
+            return web.Response(status=400)
+        
+        if update is None:
+            self.stats["invalid"] += 1
+            return web.Response(status=400)
+        
+        now = time.perf_counter()
+        self.prune(now)
+        self.received[update.update_id] = now
+        self.stats["accepted"] += 1
+        await self.application.update_queue.put(update)
+        return web.Response()
+    
+    async def mark_done(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        started = self.received.pop(update.update_id, None)
+        if started is not None:
+            self.latencies.append(time.perf_counter() - started)
+            self.stats["handled"] += 1
+    
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        if not self.authorized(request):
+            return web.Response(status=403)
+        self.prune(time.perf_counter())
+        summary = {key: round(value * 1000, 3) for key, value in Utils.percentiles(self.latencies).items()}
+        return web.json_response({**self.stats, "pending": len(self.received), "latency_ms": summary})
+    
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.config.WEBHOOK_PATH, self.handle_update)
+        app.router.add_get(self.STATS_PATH, self.handle_stats)
+        return app
+    
+    def attach(self):
+        self.application.add_handler(TypeHandler(Update, self.mark_done), group=99)
+    
+    async def start(self, register: bool):
+        self.runner = web.AppRunner(self.build_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.config.WEBHOOK_LISTEN, self.config.WEBHOOK_PORT)
+        await site.start()
+        
+        if register:
+            await self.application.bot.set_webhook(
+                url=self.config.WEBHOOK_URL.rstrip("/") + self.config.WEBHOOK_PATH,
+                secret_token=self.config.WEBHOOK_SECRET,
+                max_connections=self.config.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+        log.info("webhook listening", extra={"listen": self.config.WEBHOOK_LISTEN, "port": self.config.WEBHOOK_PORT,
+                                             "path": self.config.WEBHOOK_PATH})
+    
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+class SMSProvider:
+    URL = "https://api.iprn-elite.com/v1.0/json"
+    
+    def __init__(self, api_key: str, url: str = URL):
+        self.api_key = api_key
+        self.url = url
+    
+    def get_sms(self):
+        headers = {
+            "Content-Type": "application/json",
+            "Api-Key": self.api_key
+        }
+        
+        now = datetime.now(timezone.utc)
+        start_time = (now - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        end_time = now.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "sms.mdr_full:get_list",
+            "params": {
+                "filter": {
+                    "start_date": start_time,
+                    "end_date": end_time
+                },
+                "page": 1,
+                "per_page": 10
+            },
+            "id": 1
+        }
+        
+        try:
+            response = requests.post(self.url, headers=headers, json=payload, timeout=30)
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                log.warning("provider returned HTTP %s", response.status_code, extra={"body": response.text[:500]})
+                return None
+        except Exception as e:
+            log.warning("provider connection error: %s", e)
+            return None
+    
+    @staticmethod
+    def extract_list(data: Optional[Dict]) -> List[Dict]:
+        if data and "result" in data:
+            return data["result"].get("mdr_full_list", []) or []
+        return []
+
+class ReceiverShard:
+    POLL_INTERVAL = 10
+    MAX_BACKOFF = 300
+    SEEN_LIMIT = 2000
+    THROUGHPUT_WINDOW = 300
+    
+    def __init__(self, name: str, provider: SMSProvider):
+        self.name = name
+        self.provider = provider
+        self.seen: "OrderedDict[str, None]" = OrderedDict()
+        self.failures = 0
+        self.next_poll_at = 0.0
+        self.arrivals = deque()
+        self.stats = {"polls": 0, "errors": 0, "sms": 0, "last_poll": 0.0, "lag": None}
+    
+    @staticmethod
+    def sms_key(sms: Dict) -> str:
+        return f"{sms.get('phone', '')}_{sms.get('datetime', '')}"
+    
+    @staticmethod
+    def sms_time(value: str) -> Optional[float]:
+        try:
+            sent_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if sent_at.tzinfo is None:
+            sent_at = sent_at.replace(tzinfo=timezone.utc)
+        return sent_at.timestamp()
+    
+    @classmethod
+    def sms_age(cls, sms: Dict, now: float) -> Optional[float]:
+        sent_at = cls.sms_time(sms.get('datetime', ''))
+        if sent_at is None:
+            return None
+        return max(0.0, now - sent_at)
+    
+    def next_delay(self) -> float:
+        if not self.failures:
+            return self.POLL_INTERVAL
+        return min(self.POLL_INTERVAL * 2 ** self.failures, self.MAX_BACKOFF)
+    
+    def forget(self, key: str):
+        self.seen.pop(key, None)
+    
+    def fresh(self, sms_list: List[Dict]) -> List[Dict]:
+        items = []
+        for sms in reversed(sms_list):
+            key = self.sms_key(sms)
+            if key in self.seen:
+                continue
+            self.seen[key] = None
+            items.append(sms)
+        while len(self.seen) > self.SEEN_LIMIT:
+            self.seen.popitem(last=False)
+        return items
+    
+    def poll(self) -> List[Dict]:
+        now = time.time()
+        self.stats["polls"] += 1
+        self.stats["last_poll"] = now
+        try:
+            with Metrics.timer("sms_provider_poll_seconds", shard=self.name):
+                data = self.provider.get_sms()
+        except Exception as e:
+            log.warning("shard poll failed: %s", e, extra={"shard": self.name})
+            data = None
+        
+        if not data or "error" in data:
+            self.failures += 1
+            self.stats["errors"] += 1
+            Metrics.inc("sms_provider_errors_total", shard=self.name)
+            self.next_poll_at = now + self.next_delay()
+            return []
         
+        self.failures = 0
+        self.next_poll_at = now + self.next_delay()
+        sms_list = SMSProvider.extract_list(data)
+        Metrics.observe("sms_provider_poll_results", len(sms_list), shard=self.name)
+        items = self.fresh(sms_list)
+        if items:
+            Metrics.inc("sms_ingested_total", len(items), shard=self.name)
+        for sms in items:
+            sms['_fetched_at'] = now
+            self.arrivals.append(now)
+            age = self.sms_age(sms, now)
+            if age is not None:
+                self.stats["lag"] = age
+        self.stats["sms"] += len(items)
+        return items
+    
+    def throughput(self) -> float:
+        cutoff = time.time() - self.THROUGHPUT_WINDOW
+        while self.arrivals and self.arrivals[0] < cutoff:
+            self.arrivals.popleft()
+        return len(self.arrivals) * 60 / self.THROUGHPUT_WINDOW
+    
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "polls": self.stats["polls"],
+            "errors": self.stats["errors"],
+            "sms": self.stats["sms"],
+            "lag": self.stats["lag"],
+            "per_minute": self.throughput(),
+            "backoff": self.next_delay() if self.failures else 0
+        }
+    
+    async def run(self, sink: asyncio.Queue):
+        while True:
+            for sms in await asyncio.to_thread(self.poll):
+                await sink.put((self, sms))
+            await asyncio.sleep(max(0.0, self.next_poll_at - time.time()))
+
+class SMSQueue:
+    LEASE_SECONDS = 300
+    MAX_ATTEMPTS = 5
+    RETENTION = 86400
+    
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or Database.BASE_DIR / "sms_queue.sqlite3"
+        self.conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sms ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, sms_key TEXT UNIQUE NOT NULL, "
+            "phone TEXT NOT NULL, message TEXT NOT NULL, senderid TEXT NOT NULL, otp TEXT NOT NULL, "
+            "created_at REAL NOT NULL, leased_until REAL NOT NULL DEFAULT 0, "
+            "attempts INTEGER NOT NULL DEFAULT 0, acked_at REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sms_pending ON sms (acked_at, id)")
+    
+    def put(self, sms_key: str, phone: str, message: str, senderid: str, otp: str) -> bool:
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO sms (sms_key, phone, message, senderid, otp, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (sms_key, phone, message, senderid, otp, time.time())
+        )
+        return cursor.rowcount == 1
+    
+    def backlog(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM sms WHERE acked_at IS NULL").fetchone()[0]
+    
+    def lease(self, limit: int) -> List[sqlite3.Row]:
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                "SELECT id, sms_key, phone, message, senderid, otp, created_at, attempts FROM sms "
+                "WHERE acked_at IS NULL AND leased_until <= ? ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            if rows:
+                self.conn.executemany(
+                    "UPDATE sms SET leased_until = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(now + self.LEASE_SECONDS, row["id"]) for row in rows]
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+    
+    def ack(self, ids: List[int]):
+        now = time.time()
+        self.conn.executemany("UPDATE sms SET acked_at = ? WHERE id = ?", [(now, sms_id) for sms_id in ids])
+    
+    def release(self, ids: List[int]):
+        self.conn.executemany(
+            "UPDATE sms SET leased_until = 0, attempts = MAX(attempts - 1, 0) WHERE id = ? AND acked_at IS NULL",
+            [(sms_id,) for sms_id in ids]
+        )
+    
+    def purge(self) -> int:
+        cursor = self.conn.execute(
+            "DELETE FROM sms WHERE acked_at IS NOT NULL AND acked_at < ?",
+            (time.time() - self.RETENTION,)
+        )
+        return cursor.rowcount
+    
+    def close(self):
+        self.conn.close()
+
+class SMSReceiverWorker:
+    TICK = 1
+    ERROR_DELAY = 30
+    REPORT_INTERVAL = 300
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.shards = [ReceiverShard(name, SMSProvider(key, url)) for name, key, url in config.provider_accounts()]
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(self.shards)), thread_name_prefix="shard")
+        self.queue = SMSQueue()
+        history = Database.load_db("sms_history")
+        self.legacy_seen = set(history) if isinstance(history, list) else set()
+        self.stats = {"polls": 0, "queued": 0, "duplicates": 0, "paused": 0}
+    
+    def enqueue(self, sms_list: List[Dict]) -> int:
+        queued = 0
+        for sms in sms_list:
+            phone = str(sms.get('phone', '')).strip().lstrip('+')
+            datetime_str = str(sms.get('datetime', ''))
+            sms_key = f"{phone}_{datetime_str}"
+            if not phone or sms_key in self.legacy_seen:
+                continue
+            message = str(sms.get('message', '') or '')
+            senderid = str(sms.get('senderid', '') or '')
+            if self.queue.put(sms_key, phone, message, senderid, Utils.extract_otp(message, senderid)):
+                queued += 1
+                log.info("sms queued", extra={"phone": phone, "sender": senderid})
+            else:
+                self.stats["duplicates"] += 1
+                Metrics.inc("sms_deduped_total", stage="queue")
+        self.stats["queued"] += queued
+        return queued
+    
+    def run(self):
+        print(f"{Fore.GREEN}[]════════[] SMS RECEIVER STARTED []════════[]{Style.RESET_ALL}")
+        paused = False
+        last_report = time.time()
         while True:
             try:
-                data = self.get_sms()
+                backlog = self.queue.backlog()
+                if backlog >= self.config.SMS_QUEUE_MAX:
+                    if not paused:
+                        log.warning("sms queue full, pausing provider polls", extra={"backlog": backlog})
+                    paused = True
+                    self.stats["paused"] += 1
+                    time.sleep(ReceiverShard.POLL_INTERVAL)
+                    continue
+                paused = False
                 
-                if data and "result" in data:
-                    sms_list = data["result"].get("mdr_full_list", [])
-                    if sms_list:
-                        latest_sms = sms_list[0]
-                        current_id = f"{latest_sms.get('phone')}_{latest_sms.get('datetime')}"
-                        
-                        if current_id != self.last_seen_id:
-                            if Database.check_sms_history(latest_sms.get('phone', ''), latest_sms.get('datetime', '')):
-                                print(f"{Fore.YELLOW}☐ [ SMS ALREADY PROCESSED ]{Style.RESET_ALL}")
-                                self.last_seen_id = current_id
-                                continue
-                                
-                            phone = latest_sms.get('phone', '')
-                            message = latest_sms.get('message', '')
-                            senderid = latest_sms.get('senderid', '')
-                            
-                            print(f"\n{Fore.GREEN}☐ [ NEW SMS RECIEVED ]{Style.RESET_ALL}")
-                            print(f"{Fore.CYAN}╰══ [] {phone} - {senderid}{Style.RESET_ALL}")
-                            
-                            await self.broadcast_sms(phone, message, senderid, bot_app)
-                            self.last_seen_id = current_id
+                now = time.time()
+                due = [shard for shard in self.shards if shard.next_poll_at <= now]
+                if due:
+                    self.stats["polls"] += len(due)
+                    for items in self.pool.map(ReceiverShard.poll, due):
+                        self.enqueue(items)
+                    self.queue.purge()
                 
-                await asyncio.sleep(10)
+                if now - last_report >= self.REPORT_INTERVAL:
+                    last_report = now
+                    for shard in self.shards:
+                        log.info(Utils.format_shard(shard.summary()), extra={"shard": shard.name})
+                time.sleep(self.TICK)
             except Exception as e:
-                print(f"Error in SMS processing: {e}")
-                await asyncio.sleep(30)
+                log.error("sms receiver error: %s", e, exc_info=True)
+                time.sleep(self.ERROR_DELAY)
+
+def run_sms_receiver():
+    Database.init_db()
+    config = Config()
+    Logging.setup(config, "receiver")
+    try:
+        SMSReceiverWorker(config).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        Logging.stop()
+
+class DeliveryOutbox:
+    MAX_ATTEMPTS = 8
+    BASE_DELAY = 5
+    MAX_DELAY = 900
+    RETENTION = 86400
+    DRAIN_BATCH = 50
+    DRAIN_INTERVAL = 15
+    
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or Database.BASE_DIR / "outbox.sqlite3"
+        self.conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS payloads ("
+            "sms_id TEXT PRIMARY KEY, created_at REAL NOT NULL, "
+            "group_text TEXT NOT NULL, group_markup TEXT, user_text TEXT NOT NULL, user_markup TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, sms_id TEXT NOT NULL, kind TEXT NOT NULL, chat_id TEXT NOT NULL, "
+            "state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL DEFAULT 0, "
+            "last_error TEXT, updated_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries (state, next_attempt_at)")
+        self.stats = {"recorded": 0, "delivered": 0, "retried": 0, "dead": 0}
+        self.last_purge = 0.0
+    
+    @staticmethod
+    def dump_markup(markup: Optional[InlineKeyboardMarkup]) -> Optional[str]:
+        return markup.to_json() if markup else None
+    
+    def record(self, sms_id: str, rendered: Dict[str, Any], recipients: List[Tuple[str, str]]) -> List[sqlite3.Row]:
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO payloads (sms_id, created_at, group_text, group_markup, user_text, user_markup) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (sms_id, now, rendered["group_text"], self.dump_markup(rendered["group_markup"]),
+                 rendered["user_text"], self.dump_markup(rendered["user_markup"]))
+            )
+            self.conn.executemany(
+                "INSERT INTO deliveries (sms_id, kind, chat_id, state, updated_at) VALUES (?, ?, ?, 'inflight', ?)",
+                [(sms_id, kind, chat_id, now) for kind, chat_id in recipients]
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.stats["recorded"] += len(recipients)
+        return self.conn.execute(
+            "SELECT id, kind, chat_id, attempts FROM deliveries WHERE sms_id = ? ORDER BY id", (sms_id,)
+        ).fetchall()
+    
+    def mark_done(self, delivery_id: int):
+        self.conn.execute(
+            "UPDATE deliveries SET state = 'done', updated_at = ? WHERE id = ?", (time.time(), delivery_id)
+        )
+        self.stats["delivered"] += 1
+    
+    def mark_failed(self, delivery_id: int, attempts: int, error: str,
+                    retry_after: Optional[float] = None, permanent: bool = False) -> bool:
+        attempts += 1
+        now = time.time()
+        if permanent or attempts >= self.MAX_ATTEMPTS:
+            self.conn.execute(
+                "UPDATE deliveries SET state = 'dead', attempts = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (attempts, error[:500], now, delivery_id)
+            )
+            self.stats["dead"] += 1
+            return False
+        delay = retry_after if retry_after is not None else min(self.BASE_DELAY * 2 ** (attempts - 1), self.MAX_DELAY)
+        self.conn.execute(
+            "UPDATE deliveries SET state = 'pending', attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? "
+            "WHERE id = ?",
+            (attempts, now + delay, error[:500], now, delivery_id)
+        )
+        self.stats["retried"] += 1
+        return True
+    
+    def recover(self) -> int:
+        cursor = self.conn.execute(
+            "UPDATE deliveries SET state = 'pending', next_attempt_at = 0 WHERE state = 'inflight'"
+        )
+        return cursor.rowcount
+    
+    def claim_due(self, limit: int) -> List[sqlite3.Row]:
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                "SELECT d.id, d.kind, d.chat_id, d.attempts, p.group_text, p.group_markup, p.user_text, p.user_markup "
+                "FROM deliveries d JOIN payloads p ON p.sms_id = d.sms_id "
+                "WHERE d.state = 'pending' AND d.next_attempt_at <= ? ORDER BY d.next_attempt_at LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            if rows:
+                self.conn.executemany(
+                    "UPDATE deliveries SET state = 'inflight', updated_at = ? WHERE id = ?",
+                    [(now, row["id"]) for row in rows]
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+    
+    def pending_count(self) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM deliveries WHERE state IN ('pending', 'inflight')"
+        ).fetchone()[0]
+    
+    def outstanding(self, sms_id: str) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM deliveries WHERE sms_id = ? AND state IN ('pending', 'inflight')", (sms_id,)
+        ).fetchone()[0]
+    
+    def delivered(self, sms_id: str) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM deliveries WHERE sms_id = ? AND state = 'done'", (sms_id,)
+        ).fetchone()[0]
+    
+    def has(self, sms_id: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM payloads WHERE sms_id = ?", (sms_id,)).fetchone() is not None
+    
+    def resume(self, sms_id: str) -> int:
+        cursor = self.conn.execute(
+            "UPDATE deliveries SET state = 'pending', next_attempt_at = 0 WHERE sms_id = ? AND state = 'inflight'",
+            (sms_id,)
+        )
+        return cursor.rowcount
+    
+    def purge(self) -> int:
+        cutoff = time.time() - self.RETENTION
+        cursor = self.conn.execute(
+            "DELETE FROM deliveries WHERE state IN ('done', 'dead') AND updated_at < ?", (cutoff,)
+        )
+        self.conn.execute(
+            "DELETE FROM payloads WHERE created_at < ? AND sms_id NOT IN (SELECT sms_id FROM deliveries)", (cutoff,)
+        )
+        self.last_purge = time.time()
+        return cursor.rowcount
+    
+    def close(self):
+        self.conn.close()
+
+class ConversationStore(BasePersistence):
+    SPILL_RETENTION = 86400
+    
+    def __init__(self, path: Optional[Path] = None, update_interval: float = 5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.path = path or Database.BASE_DIR / "conversations.sqlite3"
+        self.spill_dir = self.path.parent / "spill"
+        self.conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_data ("
+            "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.pending: Dict[int, Optional[str]] = {}
+        self.written: Dict[int, str] = {}
+        self.seen: Dict[int, float] = {}
+        self.flush_handle: Optional[asyncio.Handle] = None
+        self.stats = {"staged": 0, "unchanged": 0, "commits": 0, "rows": 0, "refreshed": 0}
+        self.purge_spills()
+    
+    @staticmethod
+    def encode(data: Dict) -> str:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+    
+    def spill(self, user_id: int, value: Any) -> str:
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(prefix=f"{user_id}-", suffix=".json", dir=self.spill_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f, separators=(",", ":"))
+        return name
+    
+    @staticmethod
+    def unspill(name: Optional[str], default: Any = None) -> Any:
+        if not name:
+            return default
+        try:
+            with open(name, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+    
+    @staticmethod
+    def discard(name: Optional[str]):
+        if name:
+            with contextlib.suppress(OSError):
+                os.unlink(name)
+    
+    def purge_spills(self) -> int:
+        if not self.spill_dir.exists():
+            return 0
+        cutoff = time.time() - self.SPILL_RETENTION
+        removed = 0
+        for path in self.spill_dir.glob("*.json"):
+            with contextlib.suppress(OSError):
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+        return removed
+    
+    def stage(self, user_id: int, encoded: Optional[str]):
+        self.pending[user_id] = encoded
+        self.stats["staged"] += 1
+        if self.flush_handle is None:
+            try:
+                self.flush_handle = asyncio.get_running_loop().call_soon(self.commit)
+            except RuntimeError:
+                self.commit()
+    
+    def commit(self):
+        self.flush_handle = None
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        now = time.time()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO user_data (user_id, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    [(user_id, data, now) for user_id, data in pending.items() if data is not None]
+                )
+                self.conn.executemany(
+                    "DELETE FROM user_data WHERE user_id = ?",
+                    [(user_id,) for user_id, data in pending.items() if data is None]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            self.pending = {**pending, **self.pending}
+            log.error("conversation state commit failed: %s", e, extra={"rows": len(pending)})
+            return
+        for user_id in pending:
+            self.seen[user_id] = now
+        self.stats["commits"] += 1
+        self.stats["rows"] += len(pending)
+    
+    async def get_user_data(self) -> Dict[int, Dict]:
+        data = {}
+        for user_id, encoded, updated_at in self.conn.execute("SELECT user_id, data, updated_at FROM user_data"):
+            try:
+                data[user_id] = json.loads(encoded)
+            except ValueError:
+                continue
+            self.written[user_id] = encoded
+            self.seen[user_id] = updated_at
+        return data
+    
+    async def update_user_data(self, user_id: int, data: Dict):
+        encoded = self.encode(data) if data else None
+        if self.written.get(user_id) == encoded:
+            self.stats["unchanged"] += 1
+            return
+        if encoded is None:
+            self.written.pop(user_id, None)
+        else:
+            self.written[user_id] = encoded
+        self.stage(user_id, encoded)
+    
+    async def refresh_user_data(self, user_id: int, user_data: Dict):
+        if user_id in self.pending:
+            return
+        row = self.conn.execute(
+            "SELECT data, updated_at FROM user_data WHERE user_id = ? AND updated_at > ?",
+            (user_id, self.seen.get(user_id, 0.0))
+        ).fetchone()
+        if row is None:
+            return
+        try:
+            fresh = json.loads(row[0])
+        except ValueError:
+            return
+        user_data.clear()
+        user_data.update(fresh)
+        self.written[user_id] = row[0]
+        self.seen[user_id] = row[1]
+        self.stats["refreshed"] += 1
+    
+    async def drop_user_data(self, user_id: int):
+        self.written.pop(user_id, None)
+        self.stage(user_id, None)
+        for path in self.spill_dir.glob(f"{user_id}-*.json"):
+            self.discard(str(path))
+    
+    async def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        self.commit()
+        self.conn.close()
+    
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return {}
+    
+    async def get_bot_data(self) -> Dict:
+        return {}
+    
+    async def get_callback_data(self):
+        return None
+    
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+    
+    async def update_conversation(self, name: str, key, new_state):
+        pass
+    
+    async def update_chat_data(self, chat_id: int, data: Dict):
+        pass
+    
+    async def update_bot_data(self, data: Dict):
+        pass
+    
+    async def update_callback_data(self, data):
+        pass
+    
+    async def drop_chat_data(self, chat_id: int):
+        pass
+    
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict):
+        pass
+    
+    async def refresh_bot_data(self, bot_data: Dict):
+        pass
+
+class UserStateView(MutableMapping):
+    def __init__(self, field: str):
+        self.field = field
+        self.user_data = defaultdict(dict)
+    
+    def bind(self, user_data):
+        self.user_data = user_data
+    
+    def __getitem__(self, user_id: int):
+        data = self.user_data.get(user_id)
+        if not data or self.field not in data:
+            raise KeyError(user_id)
+        return data[self.field]
+    
+    def __setitem__(self, user_id: int, value):
+        self.user_data[user_id][self.field] = value
+    
+    def __delitem__(self, user_id: int):
+        data = self.user_data.get(user_id)
+        if not data or self.field not in data:
+            raise KeyError(user_id)
+        del data[self.field]
+    
+    def __iter__(self):
+        return iter([user_id for user_id, data in self.user_data.items() if self.field in data])
+    
+    def __len__(self) -> int:
+        return sum(1 for data in self.user_data.values() if self.field in data)
+
+class OTPTracer:
+    MARKS = ("provider", "fetched", "deduped", "queued", "extracted", "persisted")
+    STAGE_WINDOW = 5000
+    GROUP_WINDOW = 500
+    EXPORT_LIMIT = 2000
+    
+    def __init__(self):
+        self.stages: Dict[str, deque] = {}
+        self.groups: Dict[str, deque] = {}
+        self.recent = deque(maxlen=self.EXPORT_LIMIT)
+    
+    @staticmethod
+    def start(sms_key: str, provider_at: Optional[float], fetched_at: Optional[float] = None) -> Dict[str, Any]:
+        return {
+            "sms": sms_key,
+            "marks": {"provider": provider_at, "fetched": fetched_at or time.time()},
+            "sends": [],
+        }
+    
+    @staticmethod
+    def mark(trace: Optional[Dict], name: str, at: Optional[float] = None):
+        if trace is not None:
+            trace["marks"][name] = at or time.time()
+    
+    @staticmethod
+    def sent(trace: Optional[Dict], kind: str, chat_id: str, ok: bool):
+        if trace is not None:
+            trace["sends"].append({"kind": kind, "chat": chat_id, "at": time.time(), "ok": ok})
+    
+    @staticmethod
+    def record(stage: str, seconds: float, window: Dict[str, deque], limit: int):
+        series = window.get(stage)
+        if series is None:
+            series = window[stage] = deque(maxlen=limit)
+        series.append(seconds)
+    
+    def finish(self, trace: Dict[str, Any]):
+        marks = trace["marks"]
+        spans = {}
+        previous = None
+        for name in self.MARKS:
+            at = marks.get(name)
+            if at is None:
+                continue
+            if previous is not None:
+                spans[name] = max(0.0, at - previous)
+            previous = at
+        
+        origin = marks["provider"] or marks["fetched"]
+        persisted = marks.get("persisted") or previous
+        for send in trace["sends"]:
+            if not send["ok"]:
+                continue
+            send["span"] = max(0.0, send["at"] - persisted)
+            send["total"] = max(0.0, send["at"] - origin)
+            self.record("sent", send["span"], self.stages, self.STAGE_WINDOW)
+            self.record("end_to_end", send["total"], self.stages, self.STAGE_WINDOW)
+            group = f"group {send['chat']}" if send["kind"] == "group" else "users"
+            self.record(group, send["total"], self.groups, self.GROUP_WINDOW)
+            Metrics.observe("otp_stage_seconds", send["span"], stage="sent")
+            Metrics.observe("otp_stage_seconds", send["total"], stage="end_to_end")
+        
+        for stage, seconds in spans.items():
+            self.record(stage, seconds, self.stages, self.STAGE_WINDOW)
+            Metrics.observe("otp_stage_seconds", seconds, stage=stage)
+        trace["spans"] = spans
+        self.recent.append(trace)
+    
+    def stage_summary(self) -> List[Tuple[str, int, Dict[str, float]]]:
+        order = [name for name in self.MARKS if name in self.stages] + [
+            name for name in ("sent", "end_to_end") if name in self.stages
+        ]
+        return [(name, len(self.stages[name]), Utils.percentiles(self.stages[name], (50, 95))) for name in order]
+    
+    def group_summary(self, limit: int = 5) -> List[Tuple[str, int, Dict[str, float]]]:
+        rows = [(name, len(series), Utils.percentiles(series, (50, 95))) for name, series in self.groups.items()]
+        rows.sort(key=lambda row: row[2]["p95"], reverse=True)
+        return rows[:limit]
+    
+    def export(self) -> bytes:
+        return "".join(json.dumps(trace, ensure_ascii=False) + "\n" for trace in self.recent).encode("utf-8")
+
+class OTPReceiver:
+    DISPATCH_BATCH = 10
+    MERGE_QUEUE_SIZE = 500
+    SHARD_RESTART_DELAY = 5
+    
+    def __init__(self, config: Config, auto_delete: AutoDeleteQueue, renderer: MessageRenderer):
+        self.config = config
+        self.auto_delete = auto_delete
+        self.renderer = renderer
+        self.shards = [ReceiverShard(name, SMSProvider(key, url)) for name, key, url in config.provider_accounts()]
+        self.outbox = DeliveryOutbox()
+        self.tracer = OTPTracer()
+        self.running = True
+        self.busy = False
+        self.failures: Dict[str, int] = {}
+    
+    def stop(self, task: asyncio.Task):
+        self.running = False
+        if not self.busy:
+            task.cancel()
+    
+    async def process_sms(self, bot_app):
+        if sys.stdout.isatty():
+            print("\033[2J\033[H", end="")
+        
+        print(f"{Fore.CYAN}[]═════════════════════════════════[]{Style.RESET_ALL}")
+        print(f"{Fore.GREEN}[]════════[] WAITING OTPS []════════[]{Style.RESET_ALL}")
+        print(f"{Fore.CYAN}[]═════════════════════════════════[]{Style.RESET_ALL}")
+        
+        sink = asyncio.Queue(maxsize=self.MERGE_QUEUE_SIZE)
+        tasks: Dict[str, asyncio.Task] = {}
+        for shard in self.shards:
+            self.spawn_shard(shard, sink, tasks)
+        try:
+            while self.running:
+                shard, sms = await sink.get()
+                self.busy = True
+                try:
+                    phone = sms.get('phone', '')
+                    datetime_str = sms.get('datetime', '')
+                    key = ReceiverShard.sms_key(sms)
+                    trace = self.tracer.start(key, ReceiverShard.sms_time(datetime_str), sms.get('_fetched_at'))
+                    if Database.sms_seen(phone, datetime_str) or self.outbox.has(key):
+                        Metrics.inc("sms_deduped_total", stage="history")
+                        log.debug("sms already processed", extra={"phone": phone})
+                        continue
+                    
+                    OTPTracer.mark(trace, "deduped")
+                    message = sms.get('message', '')
+                    senderid = sms.get('senderid', '')
+                    
+                    log.info("sms received", extra={"phone": phone, "sender": senderid, "shard": shard.name})
+                    
+                    if await self.broadcast_sms(phone, message, senderid, bot_app, trace=trace, sms_id=key):
+                        self.failures.pop(key, None)
+                        Database.mark_sms(phone, datetime_str)
+                    else:
+                        self.retry_later(shard, key, phone, datetime_str)
+                except Exception as e:
+                    log.error("sms processing failed: %s", e, exc_info=True)
+                finally:
+                    self.busy = False
+        finally:
+            for task in list(tasks.values()):
+                task.cancel()
+    
+    def retry_later(self, shard: ReceiverShard, key: str, phone: str, datetime_str: str):
+        attempts = self.failures.get(key, 0) + 1
+        if attempts >= SMSQueue.MAX_ATTEMPTS or self.outbox.has(key):
+            self.failures.pop(key, None)
+            Database.mark_sms(phone, datetime_str)
+            log.error("sms dropped", extra={"sms": key, "attempts": attempts})
+            return
+        self.failures[key] = attempts
+        shard.forget(key)
+        log.warning("sms broadcast failed, retrying on next poll", extra={"sms": key, "attempts": attempts})
+    
+    def spawn_shard(self, shard: ReceiverShard, sink: asyncio.Queue, tasks: Dict[str, asyncio.Task], delay: float = 0):
+        async def run():
+            if delay:
+                await asyncio.sleep(delay)
+            await shard.run(sink)
+        
+        def restart(task: asyncio.Task):
+            if task.cancelled() or not self.running or tasks.get(shard.name) is not task:
+                return
+            error = task.exception()
+            shard.stats["errors"] += 1
+            log.error("shard task died, restarting in %ss", self.SHARD_RESTART_DELAY, exc_info=error,
+                      extra={"shard": shard.name})
+            self.spawn_shard(shard, sink, tasks, self.SHARD_RESTART_DELAY)
+        
+        task = asyncio.create_task(run(), name=f"shard-{shard.name}")
+        tasks[shard.name] = task
+        task.add_done_callback(restart)
+    
+    async def consume_queue(self, bot_app):
+        queue = SMSQueue()
+        print(f"{Fore.GREEN}[]════════[] WAITING OTPS (QUEUE) []════════[]{Style.RESET_ALL}")
+        
+        try:
+            while self.running:
+                try:
+                    rows = queue.lease(self.DISPATCH_BATCH)
+                    if not rows:
+                        await asyncio.sleep(1)
+                        continue
+                
+                    self.busy = True
+                    index = 0
+                    for index, row in enumerate(rows):
+                        if not self.running:
+                            queue.release([pending["id"] for pending in rows[index:]])
+                            break
+                        if row["attempts"] >= SMSQueue.MAX_ATTEMPTS:
+                            log.error("sms dropped", extra={"sms": row["sms_key"], "attempts": row["attempts"]})
+                            queue.ack([row["id"]])
+                            continue
+                    
+                        log.info("sms received", extra={"phone": row["phone"], "sender": row["senderid"]})
+                    
+                        trace = self.tracer.start(row["sms_key"], ReceiverShard.sms_time(row["sms_key"].partition("_")[2]),
+                                                  row["created_at"])
+                        OTPTracer.mark(trace, "deduped", row["created_at"])
+                        OTPTracer.mark(trace, "queued")
+                        if await self.broadcast_sms(row["phone"], row["message"], row["senderid"], bot_app,
+                                                    row["otp"] or None, trace, row["sms_key"]):
+                            queue.ack([row["id"]])
+                        elif self.outbox.has(row["sms_key"]):
+                            log.error("sms deliveries all failed permanently", extra={"sms": row["sms_key"]})
+                            queue.ack([row["id"]])
+                except asyncio.CancelledError:
+                    if rows:
+                        current = rows[index]
+                        if self.outbox.has(current["sms_key"]):
+                            queue.ack([current["id"]])
+                            index += 1
+                        queue.release([pending["id"] for pending in rows[index:]])
+                        log.info("released leased sms on cancel", extra={"released": len(rows) - index})
+                    raise
+                except Exception as e:
+                    log.error("sms dispatch failed: %s", e, exc_info=True)
+                    await asyncio.sleep(5)
+                finally:
+                    self.busy = False
+        finally:
+            queue.close()
+    
+    async def deliver(self, bot, delivery, text: str, markup: Optional[InlineKeyboardMarkup]) -> bool:
+        kind, chat_id = delivery["kind"], delivery["chat_id"]
+        started = time.perf_counter()
+        try:
+            sent_message = await bot.send_message(
+                chat_id=int(chat_id),
+                text=text,
+                parse_mode=ParseMode.HTML,
+                reply_markup=markup,
+                link_preview_options=MessageRenderer.NO_PREVIEW
+            )
+        except RetryAfter as e:
+            Metrics.inc("telegram_send_failures_total", kind=kind, reason="retry_after")
+            retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            self.outbox.mark_failed(delivery["id"], delivery["attempts"], str(e), retry_after=float(retry_after) + 1)
+            log.warning("flood limit on send", extra={"kind": kind, "chat": chat_id, "retry_after": retry_after})
+            return False
+        except (BadRequest, Forbidden) as e:
+            Metrics.inc("telegram_send_failures_total", kind=kind, reason="permanent")
+            self.outbox.mark_failed(delivery["id"], delivery["attempts"], str(e), permanent=True)
+            log.warning("send rejected: %s", e, extra={"kind": kind, "chat": chat_id})
+            return False
+        except Exception as e:
+            Metrics.inc("telegram_send_failures_total", kind=kind, reason="transient")
+            retrying = self.outbox.mark_failed(delivery["id"], delivery["attempts"], f"{type(e).__name__}: {e}")
+            log.warning("send failed: %s", e, extra={"kind": kind, "chat": chat_id, "retrying": retrying})
+            return False
+        finally:
+            Metrics.observe("telegram_send_seconds", time.perf_counter() - started, kind=kind)
+        
+        self.outbox.mark_done(delivery["id"])
+        if kind == "group":
+            self.auto_delete.push(chat_id, sent_message.message_id)
+        return True
+    
+    async def drain_outbox(self, bot, recover: bool = False) -> int:
+        if recover:
+            recovered = self.outbox.recover()
+            if recovered:
+                log.warning("resuming interrupted deliveries", extra={"count": recovered})
+        
+        delivered = 0
+        while True:
+            rows = self.outbox.claim_due(DeliveryOutbox.DRAIN_BATCH)
+            if not rows:
+                break
+            for row in rows:
+                if row["kind"] == "group":
+                    text, markup = row["group_text"], row["group_markup"]
+                else:
+                    text, markup = row["user_text"], row["user_markup"]
+                markup = InlineKeyboardMarkup.de_json(json.loads(markup), bot) if markup else None
+                if await self.deliver(bot, row, text, markup):
+                    delivered += 1
+        
+        if time.time() - self.outbox.last_purge > 3600:
+            self.outbox.purge()
+        return delivered
     
-    async def broadcast_sms(self, phone: str, message: str, service: str, bot_app):
+    async def broadcast_sms(self, phone: str, message: str, service: str, bot_app, otp_code: Optional[str] = None,
+                            trace: Optional[Dict] = None, sms_id: Optional[str] = None) -> bool:
         try:
-            otp_code = Utils.extract_otp(message)
+            if sms_id and self.outbox.has(sms_id):
+                resumed = self.outbox.resume(sms_id)
+                log.info("sms already recorded, leaving delivery to the outbox",
+                         extra={"sms": sms_id, "resumed": resumed})
+                return bool(self.outbox.outstanding(sms_id) or self.outbox.delivered(sms_id))
+            
+            if otp_code is None:
+                otp_code = Utils.extract_otp(message, service)
+            OTPTracer.mark(trace, "extracted")
             
             if not isinstance(phone, str):
                 phone = str(phone)
             
             country_info = Database.get_country_by_code(phone)
-            if country_info:
-                flag = country_info.get("flag", "🌐")
-                country = country_info.get("name", "Unknown")
-                short_name = country_info.get("shortName", "XX")
-            else:
-                flag = "🌐"
-                country = "Unknown"
-                short_name = "XX"
+            rendered = self.renderer.sms(phone, message, service, otp_code, country_info, bot_app.bot.username or "")
             
-            service_abbr = Utils.get_service_abbr(service)
-            masked_phone = Utils.mask_phone(phone)
-            
-            from datetime import timezone
             otp_data = {
                 "phone": phone,
                 "message": message,
                 "service": service,
-                "country": country,
+                "country": rendered["country"],
                 "otp": otp_code,
                 "timestamp": datetime.now(timezone.utc).isoformat()
             }
-            Database.add_otp_record(otp_data)
-            
-            user_message = f"""<blockquote>🚨 𝗣𝗥𝗘𝗠𝗜𝗨𝗠 𝗦𝗠𝗦 𝗥𝗘𝗖𝗜𝗘𝗩𝗘𝗗 𝗗𝘇𝗗 🚨</blockquote>
-
-» 𝗗𝗲𝘁𝗮𝗶𝗹𝘀 : {flag} <b>{country}</b> — {service}
-» 𝗡𝘂𝗺𝗯𝗲𝗿 : <code>+{phone}</code>
-» 𝗠𝗲𝘀𝘀𝗮𝗴𝗲 :
-<pre>{Utils.escape_html(message)}</pre>
-
-<blockquote>﹂ 𝖳𝗁𝖺𝗇𝗄 𝗒𝗈𝗎 𝖿𝗈𝗋 𝗎𝗌𝗂𝗇𝗀 DzD 𝖻𝗈𝗍💥</blockquote>"""
-            
-            user_keyboard = []
-            if otp_code and otp_code != 'N/A':
-                try:
-                    button = InlineKeyboardButton(
-                        text=f"{otp_code}", 
-                        copy_text=CopyTextButton(text=str(otp_code))
-                    )
-                    user_keyboard.append([button])
-                except Exception as e:
-                    button = InlineKeyboardButton(text=f"{otp_code}", callback_data="copy_otp")
-                    user_keyboard.append([button])
             
-            groups = Database.get_groups()
-            for group_id in groups:
-                try:
-                    if isinstance(group_id, str) and group_id.strip():
-                        sms_message = f"""
-<blockquote>🚨 𝗣𝗥𝗘𝗠𝗜𝗨𝗠 𝗦𝗠𝗦 𝗥𝗘𝗖𝗜𝗘𝗩𝗘𝗗 𝗗𝘇𝗗 🚨</blockquote>
-▛━━━━━━━━━━━━━━━━━━━━▜
-┃  <b>{flag} #{short_name} #{service_abbr}  {masked_phone}</b>  ┃
-▙━━━━━━━━━━━━━━━━━━━━▟
-<blockquote><b><a href="{self.config.OWNER_LINK}">©𝗣𝗼𝘄𝗲𝗿𝗲𝗱 𝗕𝘆 𝗗𝗮𝘆𝘇𝗗𝗶𝗴𝗶𝘁𝗮𝗹 𝗢𝗳𝗳𝗶𝗰𝗶𝗮𝗹亗</a></b></blockquote>
-"""
-                        
-                        keyboard = []
-                        if otp_code and otp_code != 'N/A':
-                            try:
-                                button = InlineKeyboardButton(
-                                    text=f"{otp_code}", 
-                                    copy_text=CopyTextButton(text=str(otp_code))
-                                )
-                            except:
-                                button = InlineKeyboardButton(text=f"{otp_code}", callback_data="copy_otp")
-                            keyboard.append([button])
-                        
-                        row = []
-                        try:
-                            bot_username = (await bot_app.bot.get_me()).username
-                            panel_url = f"https://t.me/{bot_username}"
-                            row.append(InlineKeyboardButton("🔧 𝙿𝙰𝙽𝙴𝙻", url=panel_url))
-                        except:
-                            pass
-                        
-                        if self.config.CH_INFO:
-                            row.append(InlineKeyboardButton("📢 𝙸𝙽𝙵𝙾", url=self.config.CH_INFO))
-                        
-                        if row:
-                            keyboard.append(row)
-                        
-                        sent_message = await bot_app.bot.send_message(
-                            chat_id=int(group_id.strip()),
-                            text=sms_message,
-                            parse_mode=ParseMode.HTML,
-                            reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None,
-                            link_preview_options=LinkPreviewOptions(is_disabled=True)
-                        )
-                        
-                        Database.add_bot_message(group_id.strip(), sent_message.message_id)
-                        
-                except Exception as e:
-                    print(f"Error sending to group {group_id}: {e}")
+            recipients = [
+                ("group", group_id.strip()) for group_id in Database.get_groups()
+                if isinstance(group_id, str) and group_id.strip()
+            ]
+            for req in Database.get_user_requests():
+                numbers_list = req.get("numbers", [])
+                if isinstance(numbers_list, list) and phone in numbers_list and "user_id" in req:
+                    recipients.append(("user", str(req["user_id"])))
             
-            user_requests = Database.get_user_requests()
-            for req in user_requests:
-                try:
-                    numbers_list = req.get("numbers", [])
-                    if isinstance(numbers_list, list) and phone in numbers_list:
-                        await bot_app.bot.send_message(
-                            chat_id=req["user_id"],
-                            text=user_message,
-                            parse_mode=ParseMode.HTML,
-                            reply_markup=InlineKeyboardMarkup(user_keyboard) if user_keyboard else None,
-                            link_preview_options=LinkPreviewOptions(is_disabled=True)
-                        )
-                except Exception as e:
-                    print(f"Error sending to user {req.get('user_id', 'unknown')}: {e}")
-                    
+            if not recipients:
+                Database.add_otp_record(otp_data)
+                OTPTracer.mark(trace, "persisted")
+                if trace is not None:
+                    self.tracer.finish(trace)
+                return True
+            
+            sms_id = sms_id or f"{phone}_{time.time_ns()}"
+            deliveries = self.outbox.record(sms_id, rendered, recipients)
+            Database.add_otp_record(otp_data)
+            OTPTracer.mark(trace, "persisted")
+            delivered = 0
+            for delivery in deliveries:
+                if delivery["kind"] == "group":
+                    text, markup = rendered["group_text"], rendered["group_markup"]
+                else:
+                    text, markup = rendered["user_text"], rendered["user_markup"]
+                ok = await self.deliver(bot_app.bot, delivery, text, markup)
+                delivered += ok
+                OTPTracer.sent(trace, delivery["kind"], delivery["chat_id"], ok)
+            
+            if trace is not None:
+                self.tracer.finish(trace)
+            if not delivered and not self.outbox.outstanding(sms_id):
+                log.error("sms not delivered to any recipient", extra={"phone": phone, "recipients": len(deliveries)})
+                return False
+            return True
         except Exception as e:
-            print(f"Error in broadcast_sms: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
+            log.error("broadcast failed: %s", e, exc_info=True, extra={"phone": phone})
+            return False
 
 class BotHandler:
     def __init__(self, config: Config):
         self.config = config
-        self.awaiting_input = {}
-        self.user_messages_to_delete = {}
-        self.otp_receiver = OTPReceiver(config)
+        self.conversations = ConversationStore(update_interval=config.STATE_FLUSH_SECONDS)
+        self.awaiting_input = UserStateView("awaiting_input")
+        self.user_messages_to_delete = UserStateView("messages_to_delete")
+        self.auto_delete = AutoDeleteQueue()
+        self.renderer = MessageRenderer(config)
+        self.otp_receiver = OTPReceiver(config, self.auto_delete, self.renderer)
+        self.membership = MembershipTracker()
         self.auto_delete_task = None
+        Database.register_reload_hook(self.on_data_reload)
+        Config.register_change_hook(self.on_config_change)
+        self.register_gauges()
+    
+    def register_gauges(self):
+        Metrics.register_gauge("outbox_pending_deliveries", "Deliveries waiting in the outbox",
+                               lambda: [({}, self.otp_receiver.outbox.pending_count())])
+        Metrics.register_gauge("auto_delete_queue_size", "Messages scheduled for auto-delete",
+                               lambda: [({}, len(self.auto_delete.heap))])
+        Metrics.register_gauge("otp_template_hit_ratio", "OTP template cache hit ratio",
+                               lambda: [({}, OTPExtractor.templates.hit_rate)])
+        Metrics.register_gauge("sms_shard_lag_seconds", "Age of the newest SMS seen per shard",
+                               lambda: [({"shard": shard.name}, shard.stats["lag"]) for shard in self.otp_receiver.shards])
+        Metrics.register_gauge("sms_shard_per_minute", "SMS per minute per shard over the last 5 minutes",
+                               lambda: [({"shard": shard.name}, shard.throughput()) for shard in self.otp_receiver.shards])
+    
+    def bind_conversations(self, application: Application):
+        self.awaiting_input.bind(application.user_data)
+        self.user_messages_to_delete.bind(application.user_data)
+    
+    def flush(self):
+        self.membership.flush()
+        self.auto_delete.flush()
+    
+    async def warm_caches(self):
+        await asyncio.gather(
+            asyncio.to_thread(NumberNormalizer.prefix_table),
+            asyncio.to_thread(Database.get_groups),
+            asyncio.to_thread(Database.get_ranges),
+            asyncio.to_thread(Database.get_user_requests)
+        )
+    
+    def on_config_change(self, key: str, value: str):
+        if key in MessageRenderer.LINK_FIELDS:
+            setattr(self.config, key, value)
+        self.renderer.invalidate()
+    
+    def on_data_reload(self, kind: str):
+        if kind != "db":
+            return
+        NumberNormalizer.invalidate()
+        self.membership.load()
+        self.auto_delete.load()
+        self.auto_delete.reschedule()
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
@@ -961,18 +3949,7 @@ class BotHandler:
             await self.user_menu(update, context)
             return
         
-        all_joined = True
-        for verif_id, info in verifications.items():
-            group_id = info.get('id', '')
-            if group_id and group_id.startswith('-100'):
-                try:
-                    member = await context.bot.get_chat_member(int(group_id), user_id)
-                    if member.status not in ['member', 'administrator', 'creator']:
-                        all_joined = False
-                        break
-                except Exception:
-                    all_joined = False
-                    break
+        all_joined = await self.membership.has_joined_all(context.bot, user_id)
         
         if all_joined:
             Database.verify_user(user_id)
@@ -1024,20 +4001,7 @@ class BotHandler:
         else:
             return
         
-        verifications = Database.load_verif()
-        all_joined = True
-        
-        for verif_id, info in verifications.items():
-            group_id = info.get('id', '')
-            if group_id and group_id.startswith('-100'):
-                try:
-                    member = await context.bot.get_chat_member(int(group_id), user_id)
-                    if member.status not in ['member', 'administrator', 'creator']:
-                        all_joined = False
-                        break
-                except Exception:
-                    all_joined = False
-                    break
+        all_joined = await self.membership.has_joined_all(context.bot, user_id, refresh=True)
         
         if all_joined:
             Database.verify_user(user_id)
@@ -1078,43 +4042,32 @@ class BotHandler:
         except:
             pass
         
-        message = f"""
-<blockquote>𝗢𝗧𝗣𝗦 𝗫 𝗗𝘇𝗗 𝗣𝗥𝗘𝗠𝗜𝗨𝗠</blockquote>
- 
-( 👤 ) - Info 𝗛𝗲𝗹𝗹𝗼, @{username}
-𝗞𝗶𝗹𝗹𝘂𝗮 𝗫 𝗡𝗲𝘁𝘄𝗼𝗿𝗸 ボット is a fast, flexible and secure automation tool. For digital tasks, support me!.......
-
-<blockquote>» 𝗠𝗔𝗜𝗡 𝗠𝗘𝗡𝗨</blockquote>
-• 📞 𝗚𝗲𝘁 𝗡𝘂𝗺𝗯𝗲𝗿 → Request number
-• 🔒 𝗢𝗧𝗣 → OTP Group
-• 🔗 𝗖𝗵𝗮𝗻𝗻𝗲𝗹 → Official channel
-• ❓ 𝗛𝗲𝗹𝗽 → Contact owner/support
-• 📊 𝗧𝗿𝗮𝗳𝗳𝗶𝗰 → Check OTP traffic
-
-<b>💡 Instructions:</b>
-<i>Use /fastotps and send your number max 10, for fast receive otps in inbox</i>
-<blockquote>© 𝗗𝗲𝘃𝗲𝗹𝗼𝗽𝗲𝗿 <a href="{self.config.OWNER_LINK}">𝑲𝒂𝒏𝒈𝑫𝒂𝒚𝒁亗</a> </blockquote>"""
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("📞 𝙶𝙴𝚃 𝙽𝚄𝙼𝙱𝙴𝚁", callback_data="get_number"),
-                InlineKeyboardButton("🔒 𝙾𝚃𝙿", url=self.config.OTPS_GROUP or self.config.CH_INFO)
-            ],
-            [
-                InlineKeyboardButton("📢 𝙲𝙷𝙰𝙽𝙽𝙴𝙻", url=self.config.CH_INFO),
-                InlineKeyboardButton("❓ 𝙷𝙴𝙻𝙿", url=self.config.OWNER_LINK)
+        message = self.renderer.panel("user_menu", username)
+        is_owner = user.id == self.config.OWNER_ID
+        
+        def build_keyboard():
+            keyboard = [
+                [
+                    InlineKeyboardButton("📞 𝙶𝙴𝚃 𝙽𝚄𝙼𝙱𝙴𝚁", callback_data="get_number"),
+                    InlineKeyboardButton("🔒 𝙾𝚃𝙿", url=self.config.OTPS_GROUP or self.config.CH_INFO)
+                ],
+                [
+                    InlineKeyboardButton("📢 𝙲𝙷𝙰𝙽𝙽𝙴𝙻", url=self.config.CH_INFO),
+                    InlineKeyboardButton("❓ 𝙷𝙴𝙻𝙿", url=self.config.OWNER_LINK)
+                ]
             ]
-        ]
+            if is_owner:
+                keyboard.append([InlineKeyboardButton("👑 OWNER MENU", callback_data="owner_menu")])
+            return keyboard
         
-        if user.id == self.config.OWNER_ID:
-            keyboard.append([InlineKeyboardButton("👑 OWNER MENU", callback_data="owner_menu")])
+        reply_markup = self.renderer.keyboard("user_menu_owner" if is_owner else "user_menu", build_keyboard)
         
         if update.callback_query:
             try:
                 await update.callback_query.edit_message_text(
                     text=message,
                     parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup(keyboard)
+                    reply_markup=reply_markup
                 )
             except BadRequest as e:
                 if "Message is not modified" not in str(e):
@@ -1123,7 +4076,7 @@ class BotHandler:
             sent_msg = await update.message.reply_text(
                 text=message,
                 parse_mode=ParseMode.HTML,
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=reply_markup
             )
             context.user_data['menu_msg_id'] = sent_msg.message_id
     
@@ -1506,7 +4459,7 @@ class BotHandler:
                     link_preview_options=LinkPreviewOptions(is_disabled=True)
                 )
             except Exception as e:
-                print(f"Failed to send notification to NUM_GROUP_ID: {e}")
+                log.warning("range notification failed: %s", e, extra={"chat": self.config.NUM_GROUP_ID})
         
         users = Database.get_users()
         all_users = users.get("not_verif", []) + users.get("Verified", [])
@@ -1527,7 +4480,7 @@ class BotHandler:
                     link_preview_options=LinkPreviewOptions(is_disabled=True)
                 )
             except Exception as e:
-                print(f"Failed to send notification to user {user_id}: {e}")
+                log.warning("range notification failed: %s", e, extra={"chat": user_id})
     
     async def owner_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
@@ -1537,22 +4490,8 @@ class BotHandler:
         
         username = user.username or user.first_name or "Owner"
         
-        message = f"""
-<blockquote>𝗢𝗧𝗣𝗦 𝗫 𝗗𝘇𝗗 𝗣𝗥𝗘𝗠𝗜𝗨𝗠</blockquote>
- 
-( 👤 ) - Info 𝗛𝗲𝗹𝗹𝗼, @{username}
-𝗞𝗶𝗹𝗹𝘂𝗮 𝗫 𝗡𝗲𝘁𝘄𝗼𝗿𝗸 ボット is a fast, flexible and secure automation tool. For digital tasks, support me!.......
-
-<blockquote>» 𝗢𝗪𝗡𝗘𝗥 𝗠𝗘𝗡𝗨</blockquote>
-❯ 𝗦𝗬𝗦𝗧𝗘𝗠 𝗢𝗣𝗧𝗜𝗢𝗡𝗦
-» 𝗥𝗮𝗻𝗴𝗲𝘀  —  Ranges Configuration
-» 𝗚𝗿𝗼𝘂𝗽   —  Groups Configuration
-» 𝗢𝘁𝗵𝗲𝗿𝘀  —  Other Configuration
-
-<blockquote>© 𝗗𝗲𝘃𝗲𝗹𝗼𝗽𝗲𝗿 <a href="{self.config.OWNER_LINK}">𝑲𝒂𝒏𝒈𝑫𝒂𝒚𝒁亗</a> </blockquote>
-"""
-        
-        keyboard = [
+        message = self.renderer.panel("owner_menu", username)
+        reply_markup = self.renderer.keyboard("owner_menu", lambda: [
             [
                 InlineKeyboardButton("📊 𝚁𝙰𝙽𝙶𝙴𝚂", callback_data="menu_ranges"),
                 InlineKeyboardButton("👥 𝙶𝚁𝙾𝚄𝙿𝚂", callback_data="menu_groups")
@@ -1562,16 +4501,17 @@ class BotHandler:
                 InlineKeyboardButton("⚙️ 𝙾𝚃𝙷𝙴𝚁𝚂", callback_data="menu_other")
             ],
             [
-                InlineKeyboardButton("💾 𝙱𝙰𝙲𝙺𝚄𝙿", callback_data="backup_menu")
+                InlineKeyboardButton("💾 𝙱𝙰𝙲𝙺𝚄𝙿", callback_data="backup_menu"),
+                InlineKeyboardButton("🔬 𝙿𝚁𝙾𝙵𝙸𝙻𝙴", callback_data="toggle_profile")
             ]
-        ]
+        ])
         
         if update.callback_query:
             try:
                 await update.callback_query.edit_message_text(
                     text=message,
                     parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup(keyboard)
+                    reply_markup=reply_markup
                 )
             except BadRequest as e:
                 if "Message is not modified" not in str(e):
@@ -1580,7 +4520,7 @@ class BotHandler:
             await update.message.reply_text(
                 text=message,
                 parse_mode=ParseMode.HTML,
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=reply_markup
             )
     
     async def ranges_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1671,32 +4611,32 @@ class BotHandler:
                 return
             
             file = await update.message.document.get_file()
-            file_content = (await file.download_as_bytearray()).decode('utf-8')
+            file_content = (await file.download_as_bytearray()).decode('utf-8', errors='ignore')
             
-            numbers = Utils.extract_numbers_from_file(file_content)
-            if not numbers:
-                await update.message.reply_text("❌ No valid numbers found! Make sure file contains 11-15 digit numbers.")
-                self.awaiting_input.pop(user.id, None)
-                return
-            
-            first_number = numbers[0]
-            country_info = Database.get_country_by_code(first_number)
-            
-            if not country_info:
-                await update.message.reply_text(
-                    "❌ Country not recognized for this number!\n"
-                    "Add country code in database/country.json"
-                )
+            result = await asyncio.to_thread(NumberNormalizer.normalize, file_content)
+            summary = NumberNormalizer.summary(result)
+            if not result["groups"]:
+                message = "❌ No valid numbers found! Make sure file contains numbers with a country code from database/country.json."
+                if summary:
+                    message += f"\n\n{summary}"
+                await update.message.reply_text(message)
                 self.awaiting_input.pop(user.id, None)
                 return
             
             self.awaiting_input[user.id] = "waiting_service_name"
-            context.user_data['new_range_numbers'] = numbers
-            context.user_data['new_range_country'] = country_info
+            self.conversations.discard(context.user_data.pop('new_range_file', None))
+            context.user_data['new_range_file'] = await asyncio.to_thread(
+                self.conversations.spill, user.id, list(result["groups"].items())
+            )
+            
+            split_note = ""
+            if len(result["groups"]) > 1:
+                split_note = f"✂️ File will be split into {len(result['groups'])} ranges (one per country)\n"
             
             await update.message.reply_text(
-                f"📍 Country: {country_info['flag']} {country_info['name']}\n"
-                f"📱 Found {len(numbers)} valid numbers\n"
+                f"📱 Found {result['accepted']:,} valid numbers\n"
+                f"{summary}\n\n"
+                f"{split_note}"
                 "📝 Send service name (example: WhatsApp, Facebook, Telegram):"
             )
             
@@ -1715,59 +4655,63 @@ class BotHandler:
         
         service_name = update.message.text.strip()
         
-        numbers = context.user_data.get('new_range_numbers', [])
-        country_info = context.user_data.get('new_range_country', {})
+        groups = await asyncio.to_thread(self.conversations.unspill, context.user_data.get('new_range_file'), [])
+        countries = NumberNormalizer.prefix_table()[3]
         
-        if not numbers or not country_info:
+        if not groups:
             await update.message.reply_text("❌ Incomplete data!")
             self.awaiting_input.pop(user.id, None)
+            self.conversations.discard(context.user_data.pop('new_range_file', None))
             return
         
-        flag = country_info.get("flag", "🌐")
-        country = country_info.get("name", "Unknown")
-        short_name = country_info.get("shortName", "XX")
-        country_code = country_info.get("code", "XX")
-        
-        ranges = Database.get_ranges()
-        range_id = len(ranges) + 1
-        
-        filename = f"{flag}{country}_{service_name}_{len(numbers)}.txt"
-        safe_filename = f"{country_code}_{service_name}_{len(numbers)}.txt"
-        
-        file_path = Path("numbers") / safe_filename
-        
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write("\n".join(numbers))
-        
-        range_data = {
-            "id": range_id,
-            "filename": safe_filename,
-            "display_filename": filename,
-            "country": country,
-            "flag": flag,
-            "service": service_name,
-            "short_name": short_name,
-            "country_code": country_code,
-            "count": len(numbers),
-            "path": f"numbers/{safe_filename}",
-            "created_at": datetime.now().isoformat()
-        }
-        
-        Database.add_range(range_data)
+        created = []
+        for code, numbers in groups:
+            country_info = countries.get(code, {})
+            flag = country_info.get("flag", "🌐")
+            country = country_info.get("name", "Unknown")
+            short_name = country_info.get("shortName", "XX")
+            country_code = country_info.get("code", code)
+            
+            ranges = Database.get_ranges()
+            range_id = len(ranges) + 1
+            
+            filename = f"{flag}{country}_{service_name}_{len(numbers)}.txt"
+            safe_filename = f"{country_code}_{service_name}_{len(numbers)}.txt"
+            
+            file_path = Path("numbers") / safe_filename
+            
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(numbers))
+            
+            range_data = {
+                "id": range_id,
+                "filename": safe_filename,
+                "display_filename": filename,
+                "country": country,
+                "flag": flag,
+                "service": service_name,
+                "short_name": short_name,
+                "country_code": country_code,
+                "count": len(numbers),
+                "path": f"numbers/{safe_filename}",
+                "created_at": datetime.now().isoformat()
+            }
+            
+            Database.add_range(range_data)
+            created.append(range_data)
         
         self.awaiting_input.pop(user.id, None)
-        if 'new_range_numbers' in context.user_data:
-            context.user_data.pop('new_range_numbers', None)
-        if 'new_range_country' in context.user_data:
-            context.user_data.pop('new_range_country', None)
+        self.conversations.discard(context.user_data.pop('new_range_file', None))
         
-        success_msg = f"""✅ <b>New range added successfully!</b>
+        details = "\n".join(
+            f"• {item['flag']} {item['country']}: {item['count']} numbers ({item['filename']})"
+            for item in created
+        )
+        success_msg = f"""✅ <b>{len(created)} new range{'s' if len(created) > 1 else ''} added successfully!</b>
 
 📊 <b>Details:</b>
-• Country: {flag} {country}
 • Service: {service_name}
-• Numbers: {len(numbers)}
-• File: {safe_filename}
+{details}
 
 <blockquote>📢 Notification sent to all users!</blockquote>"""
         
@@ -1776,7 +4720,8 @@ class BotHandler:
             parse_mode=ParseMode.HTML
         )
         
-        await self.send_new_range_notification(range_data, context)
+        for range_data in created:
+            await self.send_new_range_notification(range_data, context)
         
         await self.ranges_menu(update, context)
     
@@ -1946,6 +4891,7 @@ class BotHandler:
         verified_users = len(users.get("Verified", []))
         
         today_stats = Database.get_traffic_for_days(1)
+        templates = OTPExtractor.templates
         
         message = f"""
 <blockquote>𝗢𝗧𝗣𝗦 𝗫 𝗗𝘇𝗗 𝗣𝗥𝗘𝗠𝗜𝗨𝗠</blockquote>
@@ -1961,7 +4907,8 @@ class BotHandler:
 🌍 Total Countries: <i>{len(stats['countries'])}</i>
 📱 Total Numbers: <i>{total_numbers}</i>
 👥 Total Users: <i>{total_users}</i>
-✅ Verified Users: <i>{verified_users}</i></b>
+✅ Verified Users: <i>{verified_users}</i>
+🧩 OTP Templates: <i>{len(templates.templates)} ({templates.hit_rate * 100:.1f}% hit rate)</i></b>
 
 <blockquote>🚀 𝗧𝗢𝗗𝗔𝗬'𝗦 𝗧𝗥𝗔𝗙𝗙𝗜𝗖</blockquote>\n
 """
@@ -1973,6 +4920,23 @@ class BotHandler:
         else:
             message += "<i>No traffic today yet.</i>\n"
         
+        if self.config.SMS_MODE == "inline" and self.otp_receiver.shards:
+            message += "\n<blockquote>📡 𝗥𝗘𝗖𝗘𝗜𝗩𝗘𝗥 𝗦𝗛𝗔𝗥𝗗𝗦</blockquote>\n"
+            for shard in self.otp_receiver.shards:
+                message += f"• <i>{Utils.escape_html(Utils.format_shard(shard.summary()))}</i>\n"
+        
+        tracer = self.otp_receiver.tracer
+        stages = tracer.stage_summary()
+        if stages:
+            message += "\n<blockquote>⏱ 𝗢𝗧𝗣 𝗟𝗔𝗧𝗘𝗡𝗖𝗬 (𝗽𝟱𝟬 / 𝗽𝟵𝟱)</blockquote>\n"
+            for name, count, points in stages:
+                message += (f"• <b>{name}: </b><i>{Utils.format_seconds(points['p50'])} / "
+                            f"{Utils.format_seconds(points['p95'])} ({count})</i>\n")
+            for name, count, points in tracer.group_summary():
+                message += (f"• <b>{Utils.escape_html(name)}: </b><i>{Utils.format_seconds(points['p50'])} / "
+                            f"{Utils.format_seconds(points['p95'])} ({count})</i>\n")
+            message += "<i>/traces exports recent spans as JSONL</i>\n"
+        
         keyboard = [
             [InlineKeyboardButton("⬅️ 𝙱𝙰𝙲𝙺", callback_data="owner_menu")]
         ]
@@ -1994,45 +4958,20 @@ class BotHandler:
             return
             
         username = user.username or user.first_name or "User"
-        message = f"""
-<blockquote>𝗢𝗧𝗣𝗦 𝗫 𝗗𝘇𝗗 𝗣𝗥𝗘𝗠𝗜𝗨𝗠</blockquote>
- 
-( 👤 ) - Info 𝗛𝗲𝗹𝗹𝗼, @{username}
-𝗞𝗶𝗹𝗹𝘂𝗮 𝗫 𝗡𝗲𝘁𝘄𝗼𝗿𝗸 ボット is a fast, flexible and secure automation tool. For digital tasks, support me!.......
-
-<blockquote>» 𝗢𝗪𝗡𝗘𝗥 𝗖𝗢𝗠𝗠𝗔𝗡𝗗𝗦</blockquote>
-
-/setchlink - Set channel info link
-/setownerlink - Set owner link  
-/setsupportlink - Set support link
-/setotpslink - Set OTP group link
-/groupnumid - Set number group ID
-/autodelmsg - Auto delete old messages
-/verification - Manage user verification
-/cfd - Broadcast message to all users
-/fwd - Forward message to all users
-
-<blockquote>» 𝗨𝗦𝗘𝗥 𝗖𝗢𝗠𝗠𝗔𝗡𝗗𝗦</blockquote>
-/start - Start the bot
-/fastotps - Fast OTPs for numbers
-/traffic - Check OTP traffic (today)
-
-<blockquote>© 𝗗𝗲𝘃𝗲𝗹𝗼𝗽𝗲𝗿 <a href="{self.config.OWNER_LINK}">𝑲𝒂𝒏𝒈𝑫𝒂𝒚𝒁亗</a> </blockquote>
-"""
-        
-        keyboard = [
+        message = self.renderer.panel("other_menu", username)
+        reply_markup = self.renderer.keyboard("other_menu", lambda: [
             [InlineKeyboardButton("🔐 𝚅𝙴𝚁𝙸𝙵𝙸𝙲𝙰𝚃𝙸𝙾𝙽", callback_data="menu_verification")],
             [InlineKeyboardButton("⬅️ 𝙱𝙰𝙲𝙺", callback_data="owner_menu")]
-        ]
+        ])
         
         if update.callback_query:
             try:
-                await update.callback_query.edit_message_text(message, parse_mode=ParseMode.HTML, reply_markup=InlineKeyboardMarkup(keyboard))
+                await update.callback_query.edit_message_text(message, parse_mode=ParseMode.HTML, reply_markup=reply_markup)
             except BadRequest as e:
                 if "Message is not modified" not in str(e):
                     raise
         else:
-            await update.message.reply_text(message, parse_mode=ParseMode.HTML, reply_markup=InlineKeyboardMarkup(keyboard))
+            await update.message.reply_text(message, parse_mode=ParseMode.HTML, reply_markup=reply_markup)
     
     async def verification_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         verifications = Database.load_verif()
@@ -2184,29 +5123,13 @@ class BotHandler:
         user = query.from_user
         username = user.username or user.first_name or "User"
         
-        message = f"""
-<blockquote>𝗢𝗧𝗣𝗦 𝗫 𝗗𝘇𝗗 𝗣𝗥𝗘𝗠𝗜𝗨𝗠</blockquote>
- 
-( 👤 ) - Info 𝗛𝗲𝗹𝗹𝗼, @{username}
-𝗞𝗶𝗹𝗹𝘂𝗮 𝗫 𝗡𝗲𝘁𝘄𝗼𝗿𝗸 ボット is a fast, flexible and secure automation tool. For digital tasks, support me!.......
-
-<blockquote>❯ 𝗕𝗔𝗖𝗞𝗨𝗣 & 𝗥𝗘𝗦𝗧𝗢𝗥𝗘 𝗠𝗘𝗡𝗨</blockquote>
-
-» 𝗔𝗩𝗔𝗜𝗟𝗔𝗕𝗟𝗘 𝗖𝗢𝗠𝗠𝗔𝗡𝗗𝗦:
-• /backupdb - Backup database
-• /backupnum - Backup numbers
-• /restoredb - Restore database
-• /restorenum - Restore numbers
-
-<blockquote>© 𝗗𝗲𝘃𝗲𝗹𝗼𝗽𝗲𝗿 <a href="{self.config.OWNER_LINK}">𝑲𝒂𝒏𝒈𝑫𝒂𝒚𝒁亗</a> </blockquote>
-"""
-        
-        keyboard = [[InlineKeyboardButton("⬅️ 𝙱𝙰𝙲𝙺", callback_data="owner_menu")]]
+        message = self.renderer.panel("backup_menu", username)
+        reply_markup = self.renderer.keyboard("backup_menu", lambda: [[InlineKeyboardButton("⬅️ 𝙱𝙰𝙲𝙺", callback_data="owner_menu")]])
         
         await query.edit_message_text(
             text=message,
             parse_mode=ParseMode.HTML,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=reply_markup
         )
     
     async def backupdb_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -2214,25 +5137,23 @@ class BotHandler:
             await update.message.reply_text("<blockquote>𝗣𝗹𝗲𝗮𝘀𝗲 𝘀𝗲𝗻𝗱 𝗮 𝘃𝗮𝗹𝗶𝗱 𝗰𝗼𝗺𝗺𝗮𝗻𝗱</blockquote>", parse_mode=ParseMode.HTML)
             return
         
+        mode = context.args[0].lower() if context.args else "full"
+        if mode not in ("full", "inc"):
+            await update.message.reply_text("📝 <b>Usage:</b> <code>/backupdb [full|inc]</code>", parse_mode=ParseMode.HTML)
+            return
+        
         try:
             date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-            zip_filename = f"backup_db_{date_str}.zip"
-            
-            with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_path in Path("database").glob("*.json"):
-                    zipf.write(file_path, f"database/{file_path.name}")
-            
-            with open(zip_filename, 'rb') as f:
-                await update.message.reply_document(
-                    document=f,
-                    caption=f"📦 <b>Database Backup</b>\n"
-                           f"⏰ <i>{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</i>\n\n"
-                           f"<blockquote>©𝗣𝗼𝘄𝗲𝗿𝗲𝗱 𝗕𝘆 𝗗𝗮𝘆𝘇𝗗𝗶𝗴𝗶𝘁𝗮𝗹 𝗢𝗳𝗳𝗶𝗰𝗶𝗰𝗶𝗮𝗹亗</blockquote>",
-                    parse_mode=ParseMode.HTML
-                )
-            
-            os.remove(zip_filename)
-            
+            sent = await BackupManager.send(
+                context.bot,
+                update.effective_chat.id,
+                "db",
+                f"backup_db_{date_str}",
+                "Database Backup",
+                mode
+            )
+            if not sent:
+                await update.message.reply_text("ℹ️ <b>No changes since the last backup.</b>", parse_mode=ParseMode.HTML)
         except Exception as e:
             await update.message.reply_text(f"❌ <b>Backup failed:</b> <code>{str(e)}</code>", parse_mode=ParseMode.HTML)
     
@@ -2241,59 +5162,111 @@ class BotHandler:
             await update.message.reply_text("<blockquote>𝗣𝗹𝗲𝗮𝘀𝗲 𝘀𝗲𝗻𝗱 𝗮 𝘃𝗮𝗹𝗶𝗱 𝗰𝗼𝗺𝗺𝗮𝗻𝗱</blockquote>", parse_mode=ParseMode.HTML)
             return
         
+        mode = context.args[0].lower() if context.args else "full"
+        if mode not in ("full", "inc"):
+            await update.message.reply_text("📝 <b>Usage:</b> <code>/backupnum [full|inc]</code>", parse_mode=ParseMode.HTML)
+            return
+        
         try:
             date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-            zip_filename = f"backup_numbers_{date_str}.zip"
-            
-            with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for file_path in Path("numbers").glob("*.txt"):
-                    zipf.write(file_path, f"numbers/{file_path.name}")
-            
-            with open(zip_filename, 'rb') as f:
-                await update.message.reply_document(
-                    document=f,
-                    caption=f"📦 <b>Numbers Backup</b>\n"
-                           f"⏰ <i>{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</i>\n\n"
-                           f"<blockquote>©𝗣𝗼𝘄𝗲𝗿𝗲𝗱 𝗕𝘆 𝗗𝗮𝘆𝘇𝗗𝗶𝗴𝗶𝘁𝗮𝗹 𝗢𝗳𝗳𝗶𝗰𝗶𝗮𝗹亗</blockquote>",
-                    parse_mode=ParseMode.HTML
-                )
-            
-            os.remove(zip_filename)
-            
+            sent = await BackupManager.send(
+                context.bot,
+                update.effective_chat.id,
+                "numbers",
+                f"backup_numbers_{date_str}",
+                "Numbers Backup",
+                mode
+            )
+            if not sent:
+                await update.message.reply_text("ℹ️ <b>No changes since the last backup.</b>", parse_mode=ParseMode.HTML)
         except Exception as e:
             await update.message.reply_text(f"❌ <b>Backup failed:</b> <code>{str(e)}</code>", parse_mode=ParseMode.HTML)
     
-    async def restoredb_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def traces_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if update.effective_user.id != self.config.OWNER_ID:
             await update.message.reply_text("<blockquote>𝗣𝗹𝗲𝗮𝘀𝗲 𝘀𝗲𝗻𝗱 𝗮 𝘃𝗮𝗹𝗶𝗱 𝗰𝗼𝗺𝗺𝗮𝗻𝗱</blockquote>", parse_mode=ParseMode.HTML)
             return
         
-        if not update.message.reply_to_message or not update.message.reply_to_message.document:
-            await update.message.reply_text("📝 <b>Reply to a .zip backup file!</b>", parse_mode=ParseMode.HTML)
+        tracer = self.otp_receiver.tracer
+        if not tracer.recent:
+            await update.message.reply_text("ℹ️ <b>No OTP traces recorded yet.</b>", parse_mode=ParseMode.HTML)
+            return
+        
+        date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=tracer.export(),
+            filename=f"otp_traces_{date_str}.jsonl",
+            caption=f"⏱ <b>{len(tracer.recent)} OTP traces</b>",
+            parse_mode=ParseMode.HTML
+        )
+    
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user.id != self.config.OWNER_ID:
+            await update.message.reply_text("<blockquote>𝗣𝗹𝗲𝗮𝘀𝗲 𝘀𝗲𝗻𝗱 𝗮 𝘃𝗮𝗹𝗶𝗱 𝗰𝗼𝗺𝗺𝗮𝗻𝗱</blockquote>", parse_mode=ParseMode.HTML)
+            return
+        
+        if context.args and context.args[0].lower() == "stop":
+            if SamplingProfiler.active:
+                SamplingProfiler.active.stop()
+                await update.message.reply_text("⏹ <b>Profiler stopping, results follow.</b>", parse_mode=ParseMode.HTML)
+            else:
+                await update.message.reply_text("ℹ️ <b>No profiler is running.</b>", parse_mode=ParseMode.HTML)
             return
         
         try:
-            await update.message.reply_text("🔄 <b>Processing restore...</b>", parse_mode=ParseMode.HTML)
-            
-            file = await update.message.reply_to_message.document.get_file()
-            temp_file = f"temp_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-            await file.download_to_drive(temp_file)
-            
-            with zipfile.ZipFile(temp_file, 'r') as zipf:
-                zipf.extractall(".")
-            
-            os.remove(temp_file)
-            
-            await update.message.reply_text(
-                "✅ <b>Database restored successfully!</b>\n"
-                "🔄 <i>Bot will reload database...</i>",
+            seconds = float(context.args[0]) if context.args else SamplingProfiler.DEFAULT_SECONDS
+            hz = int(context.args[1]) if len(context.args) > 1 else SamplingProfiler.DEFAULT_HZ
+        except ValueError:
+            await update.message.reply_text("📝 <b>Usage:</b> <code>/profile [seconds] [hz]</code> or <code>/profile stop</code>",
+                                            parse_mode=ParseMode.HTML)
+            return
+        
+        await self.start_profile(context, update.effective_chat.id, seconds, hz)
+    
+    async def toggle_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        if query.from_user.id != self.config.OWNER_ID:
+            return
+        if SamplingProfiler.active:
+            SamplingProfiler.active.stop()
+            await context.bot.send_message(query.from_user.id, "⏹ <b>Profiler stopping, results follow.</b>", parse_mode=ParseMode.HTML)
+        else:
+            await self.start_profile(context, query.from_user.id, SamplingProfiler.DEFAULT_SECONDS, SamplingProfiler.DEFAULT_HZ)
+    
+    async def start_profile(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, seconds: float, hz: int):
+        if SamplingProfiler.active:
+            await context.bot.send_message(chat_id, "⚠️ <b>A profiler is already running.</b> Use <code>/profile stop</code>.",
+                                           parse_mode=ParseMode.HTML)
+            return
+        
+        seconds = min(max(seconds, 1), SamplingProfiler.MAX_SECONDS)
+        hz = min(max(hz, 1), SamplingProfiler.MAX_HZ)
+        profiler = SamplingProfiler(seconds, hz)
+        SamplingProfiler.active = profiler
+        await context.bot.send_message(chat_id, f"🔬 <b>Sampling the event loop for {seconds:g}s at {hz} Hz...</b>",
+                                       parse_mode=ParseMode.HTML)
+        context.application.create_task(self.finish_profile(context.bot, chat_id, profiler))
+    
+    async def finish_profile(self, bot, chat_id: int, profiler: SamplingProfiler):
+        try:
+            collapsed, tasks = await profiler.run()
+            date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+            await bot.send_document(
+                chat_id=chat_id,
+                document=collapsed or b"\n",
+                filename=f"profile_{date_str}.folded",
+                caption=f"🔬 <b>{profiler.samples} samples in {profiler.elapsed:.1f}s</b>\n"
+                        f"<i>Collapsed stacks, open with flamegraph.pl or speedscope</i>",
                 parse_mode=ParseMode.HTML
             )
-            
+            await bot.send_document(chat_id=chat_id, document=tasks, filename=f"tasks_{date_str}.txt")
         except Exception as e:
-            await update.message.reply_text(f"❌ <b>Restore failed:</b> <code>{str(e)}</code>", parse_mode=ParseMode.HTML)
+            log.exception("profiler failed")
+            await bot.send_message(chat_id, f"❌ <b>Profiler failed:</b> <code>{Utils.escape_html(str(e))}</code>",
+                                   parse_mode=ParseMode.HTML)
     
-    async def restorenum_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def restore_backup(self, update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str, label: str):
         if update.effective_user.id != self.config.OWNER_ID:
             await update.message.reply_text("<blockquote>𝗣𝗹𝗲𝗮𝘀𝗲 𝘀𝗲𝗻𝗱 𝗮 𝘃𝗮𝗹𝗶𝗱 𝗰𝗼𝗺𝗺𝗮𝗻𝗱</blockquote>", parse_mode=ParseMode.HTML)
             return
@@ -2302,26 +5275,80 @@ class BotHandler:
             await update.message.reply_text("📝 <b>Reply to a .zip backup file!</b>", parse_mode=ParseMode.HTML)
             return
         
+        temp_file = None
         try:
             await update.message.reply_text("🔄 <b>Processing restore...</b>", parse_mode=ParseMode.HTML)
             
-            file = await update.message.reply_to_message.document.get_file()
-            temp_file = f"temp_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-            await file.download_to_drive(temp_file)
+            reply = update.message.reply_to_message
+            document = reply.document
+            if (document.file_size or 0) > BackupManager.DOWNLOAD_LIMIT and not self.config.BOT_API_URL:
+                raise ValueError("file is larger than the 20 MB Bot API download limit, "
+                                 "restore it through a local Bot API server (BOT_API_URL)")
+            part = BackupManager.part_info(document.file_name, reply.caption)
+            
+            file = await document.get_file()
+            fd, temp_file = tempfile.mkstemp(suffix=".archive")
+            os.close(fd)
+            await file.download_to_drive(temp_file, read_timeout=300)
+            archive = Path(temp_file)
+            
+            if part:
+                archive, missing = await asyncio.to_thread(BackupManager.stash_part, archive, *part)
+                temp_file = None
+                if missing:
+                    await update.message.reply_text(
+                        f"🧩 <b>Part {part[1]}/{part[2]} stored.</b>\n"
+                        f"<i>Reply with /restore{'db' if kind == 'db' else 'num'} to part(s) "
+                        f"{', '.join(str(i) for i in missing)} to continue.</i>",
+                        parse_mode=ParseMode.HTML
+                    )
+                    return
             
-            with zipfile.ZipFile(temp_file, 'r') as zipf:
-                zipf.extractall(".")
+            root, manifest = await asyncio.to_thread(BackupManager.prepare_restore, archive, kind)
+            try:
+                BackupManager.commit_restore(kind, root, manifest)
+            finally:
+                await asyncio.to_thread(BackupManager.cleanup_restore, root)
+            if part:
+                await asyncio.to_thread(shutil.rmtree, BackupManager.parts_dir(part[0]), True)
             
-            os.remove(temp_file)
+            details = ""
+            if manifest:
+                details = f"🧾 <i>{manifest.get('type')} • <code>{manifest.get('id')}</code></i>\n"
             
             await update.message.reply_text(
-                "✅ <b>Numbers restored successfully!</b>\n"
-                "🔄 <i>Bot will reload numbers...</i>",
+                f"✅ <b>{label} restored successfully!</b>\n"
+                f"{details}"
+                f"🔄 <i>Bot will reload {label.lower()}...</i>",
                 parse_mode=ParseMode.HTML
             )
             
         except Exception as e:
             await update.message.reply_text(f"❌ <b>Restore failed:</b> <code>{str(e)}</code>", parse_mode=ParseMode.HTML)
+        finally:
+            if temp_file and os.path.exists(temp_file):
+                os.remove(temp_file)
+    
+    async def restoredb_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await self.restore_backup(update, context, "db", "Database")
+    
+    async def restorenum_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await self.restore_backup(update, context, "numbers", "Numbers")
+    
+    async def auto_backup(self, context: ContextTypes.DEFAULT_TYPE):
+        date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for kind, basename, title in (("db", "backup_db", "Database Backup"), ("numbers", "backup_numbers", "Numbers Backup")):
+            try:
+                await BackupManager.send(
+                    context.bot,
+                    self.config.OWNER_ID,
+                    kind,
+                    f"{basename}_{date_str}",
+                    f"Auto {title}",
+                    "inc"
+                )
+            except Exception:
+                log.exception("auto backup failed", extra={"kind": kind})
     
     async def setchlink_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if update.effective_user.id != self.config.OWNER_ID:
@@ -2418,11 +5445,7 @@ class BotHandler:
         if arg == 'off':
             minutes = 0
             Database.set_autodel_setting(0, {})
-            
-            if context.job_queue:
-                current_jobs = context.job_queue.get_jobs_by_name("auto_delete")
-                for job in current_jobs:
-                    job.schedule_removal()
+            self.auto_delete.set_ttl(0)
             
             await update.message.reply_text("✅ <b>Auto delete disabled!</b>", parse_mode=ParseMode.HTML)
             return
@@ -2472,55 +5495,20 @@ class BotHandler:
                 new_notif_ids[group_id] = sent_msg.message_id
                 
             except Exception as e:
-                print(f"Failed to send notification to group {group_id}: {e}")
+                log.warning("auto-delete notice failed: %s", e, extra={"chat": group_id})
         
         Database.set_autodel_setting(minutes, new_notif_ids)
-        
-        if context.job_queue:
-            current_jobs = context.job_queue.get_jobs_by_name("auto_delete")
-            for job in current_jobs:
-                job.schedule_removal()
-        
-        if minutes > 0 and context.job_queue:
-            context.job_queue.run_repeating(
-                self.auto_delete_old_messages,
-                interval=15,
-                first=10,
-                name="auto_delete",
-                data={"minutes": minutes}
-            )
+        self.auto_delete.set_ttl(minutes)
         
         await update.message.reply_text(f"✅ <b>Auto delete enabled! Messages older than {minutes} minutes will be deleted.</b>", parse_mode=ParseMode.HTML)
     
     async def auto_delete_old_messages(self, context: ContextTypes.DEFAULT_TYPE):
         try:
-            job = context.job
-            minutes = job.data.get("minutes", 0) if job and hasattr(job, 'data') else 0
-            
-            if minutes <= 0:
-                return
-            
-            groups = Database.get_groups()
-            for group_id in groups:
-                try:
-                    old_messages = Database.get_old_bot_messages(minutes)
-                    
-                    group_messages = [msg for msg in old_messages if msg.get("group_id") == group_id]
-                    
-                    for msg in group_messages:
-                        try:
-                            await context.bot.delete_message(
-                                chat_id=group_id,
-                                message_id=msg.get("message_id")
-                            )
-                            Database.remove_bot_message(group_id, msg.get("message_id"))
-                        except Exception as e:
-                            Database.remove_bot_message(group_id, msg.get("message_id"))
-                            continue
-                except Exception as e:
-                    print(f"Error in auto delete for group {group_id}: {e}")
-        except Exception as e:
-            print(f"Error in auto_delete_old_messages: {e}")
+            await self.auto_delete.delete_expired(context.bot)
+        except Exception:
+            log.exception("auto delete failed")
+        finally:
+            self.auto_delete.reschedule()
     
     async def verification_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if update.effective_user.id != self.config.OWNER_ID:
@@ -2539,7 +5527,47 @@ class BotHandler:
                     if str(chat_id) in groups:
                         return
     
+    async def chat_member_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        member_update = update.chat_member
+        if not member_update:
+            return
+        
+        chat_id = str(member_update.chat.id)
+        new_member = member_update.new_chat_member
+        user_id = new_member.user.id
+        
+        if not self.membership.on_member_update(chat_id, user_id, new_member.status):
+            return
+        
+        if not self.membership.is_joined(new_member.status) and Database.is_verified(user_id):
+            if user_id != self.config.OWNER_ID:
+                Database.remove_from_verified(user_id)
+    
+    async def reconcile_membership(self, context: ContextTypes.DEFAULT_TYPE):
+        try:
+            diff = await self.membership.reconcile(context.bot)
+            log.info("membership reconciled", extra=diff)
+        except Exception:
+            log.exception("membership reconcile failed")
+    
+    async def drain_outbox(self, context: ContextTypes.DEFAULT_TYPE):
+        try:
+            await self.otp_receiver.drain_outbox(context.bot)
+        except Exception:
+            log.exception("outbox drain failed")
+    
+    async def flush_state(self, context: ContextTypes.DEFAULT_TYPE):
+        try:
+            self.flush()
+        except Exception:
+            log.exception("state flush failed")
+    
     async def callback_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        data = update.callback_query.data if update.callback_query else None
+        with Metrics.timer("handler_seconds", handler="callback", data=Metrics.label_value(data or "")):
+            await self.dispatch_callback(update, context)
+    
+    async def dispatch_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         if query:
             await query.answer()
@@ -2585,6 +5613,8 @@ class BotHandler:
             await self.refresh_verify(update, context)
         elif data == "backup_menu":
             await self.backup_menu(update, context)
+        elif data == "toggle_profile":
+            await self.toggle_profile(update, context)
     
     async def message_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
@@ -2803,14 +5833,25 @@ class BotHandler:
             link_preview_options=LinkPreviewOptions(is_disabled=True)
         )
 
-def main():
+def main(startup_report: bool = False):
+    StartupReport.begin()
     Database.init_db()
+    StartupReport.mark("init_db")
     config = Config()
+    Logging.setup(config)
+    StartupReport.mark("config + logging")
     bot_handler = BotHandler(config)
+    StartupReport.mark("handlers")
     
     print(f"{Fore.GREEN}[]════════[] LOGIN SUCCESSFULLY []════════[]{Style.RESET_ALL}")
     
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    builder = Application.builder().token(config.BOT_TOKEN).persistence(bot_handler.conversations)
+    if config.BOT_API_URL:
+        builder = builder.base_url(f"{config.BOT_API_URL}/bot").base_file_url(f"{config.BOT_API_URL}/file/bot")
+    if config.UPDATE_CONCURRENCY > 1:
+        builder = builder.concurrent_updates(KeyedUpdateProcessor(config.UPDATE_CONCURRENCY))
+    application = builder.build()
+    bot_handler.bind_conversations(application)
     
     application.add_handler(CommandHandler("start", bot_handler.start))
     application.add_handler(CommandHandler("fastotps", bot_handler.fastotps_command))
@@ -2828,6 +5869,8 @@ def main():
     application.add_handler(CommandHandler("backupnum", bot_handler.backupnum_command))
     application.add_handler(CommandHandler("restoredb", bot_handler.restoredb_command))
     application.add_handler(CommandHandler("restorenum", bot_handler.restorenum_command))
+    application.add_handler(CommandHandler("traces", bot_handler.traces_command))
+    application.add_handler(CommandHandler("profile", bot_handler.profile_command))
     
     application.add_handler(CallbackQueryHandler(bot_handler.callback_handler))
     
@@ -2846,28 +5889,164 @@ def main():
         bot_handler.new_chat_members
     ))
     
+    application.add_handler(ChatMemberHandler(
+        bot_handler.chat_member_update,
+        ChatMemberHandler.CHAT_MEMBER
+    ))
+    
+    if not startup_report:
+        bot_handler.auto_delete.attach(application.job_queue, Metrics.timed_job(bot_handler.auto_delete_old_messages))
+    
+    if application.job_queue and not startup_report:
+        application.job_queue.run_repeating(
+            Metrics.timed_job(bot_handler.reconcile_membership),
+            interval=MembershipTracker.RECONCILE_INTERVAL,
+            first=60,
+            name="membership_reconcile"
+        )
+        auto_backup_hours = float(os.getenv("AUTO_BACKUP_HOURS", "24") or 0)
+        if auto_backup_hours > 0:
+            application.job_queue.run_repeating(
+                Metrics.timed_job(bot_handler.auto_backup),
+                interval=auto_backup_hours * 3600,
+                first=auto_backup_hours * 3600,
+                name="auto_backup"
+            )
+        application.job_queue.run_repeating(
+            Metrics.timed_job(bot_handler.drain_outbox),
+            interval=DeliveryOutbox.DRAIN_INTERVAL,
+            first=DeliveryOutbox.DRAIN_INTERVAL,
+            name="outbox_drain"
+        )
+        application.job_queue.run_repeating(
+            Metrics.timed_job(bot_handler.flush_state),
+            interval=MembershipTracker.FLUSH_INTERVAL,
+            first=MembershipTracker.FLUSH_INTERVAL,
+            name="state_flush"
+        )
+    
+    receiver = None
+    if config.SMS_MODE == "queue" and not startup_report:
+        import multiprocessing
+        receiver = multiprocessing.get_context("spawn").Process(target=run_sms_receiver, name="sms-receiver", daemon=True)
+        receiver.start()
+    
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     
+    lifecycle = Lifecycle(config)
+    lifecycle.register_detail("outbox_pending", bot_handler.otp_receiver.outbox.pending_count)
+    metrics_server = MetricsServer(config, lifecycle) if config.METRICS_PORT else None
+    watchdog = LoopWatchdog(config, application.bot) if config.LOOP_LAG_THRESHOLD > 0 else None
+    if watchdog:
+        lifecycle.register_detail("loop_lag_p99", lambda: round(watchdog.percentiles()["p99"], 4))
+    
+    webhook = None
+    if config.UPDATE_MODE == "webhook" and not startup_report:
+        webhook = WebhookServer(config, application)
+        webhook.attach()
+    
+    StartupReport.mark("application build")
+    
     async def run_bot():
-        await application.initialize()
+        lifecycle.install(asyncio.get_running_loop())
+        await asyncio.gather(application.initialize(), bot_handler.warm_caches())
+        StartupReport.mark("initialize + warm caches")
         await application.start()
-        await application.updater.start_polling()
+        if webhook:
+            await webhook.start(register=config.WEBHOOK_REGISTER)
+        elif not startup_report:
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+        StartupReport.mark("start + receive updates")
+        if metrics_server:
+            try:
+                await metrics_server.start()
+            except OSError as e:
+                log.warning("metrics endpoint disabled: %s", e)
+        if watchdog:
+            watchdog.start()
+        StartupReport.mark("metrics + watchdog")
+        
+        if startup_report:
+            lifecycle.ready()
+            print(StartupReport.render())
+            lifecycle.request_stop("startup report")
+            await shutdown(None)
+            return
+        
+        try:
+            await bot_handler.otp_receiver.drain_outbox(application.bot, recover=True)
+        except Exception:
+            log.exception("outbox drain failed")
+        StartupReport.mark("outbox recovery")
         
-        otp_task = asyncio.create_task(bot_handler.otp_receiver.process_sms(application))
+        if config.SMS_MODE == "inline":
+            otp_task = asyncio.create_task(bot_handler.otp_receiver.process_sms(application))
+        else:
+            otp_task = asyncio.create_task(bot_handler.otp_receiver.consume_queue(application))
         
+        lifecycle.ready()
         print(f"{Fore.GREEN}[]════════[] BOT STARTED SUCCESSFULLY []════════[]{Style.RESET_ALL}")
         
-        await otp_task
+        stop_task = asyncio.create_task(lifecycle.stopping.wait())
+        await asyncio.wait({otp_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+        stop_task.cancel()
+        if not lifecycle.stopping.is_set():
+            lifecycle.request_stop("sms task exited")
+        await shutdown(otp_task)
+    
+    async def shutdown(otp_task: Optional[asyncio.Task]):
+        deadline = time.monotonic() + config.SHUTDOWN_TIMEOUT
+        print(f"\n{Fore.YELLOW}[]════════[] DRAINING ({lifecycle.reason}) []════════[]{Style.RESET_ALL}")
+        
+        if webhook:
+            await webhook.stop()
+        elif application.updater and application.updater.running:
+            await application.updater.stop()
+        
+        if otp_task:
+            bot_handler.otp_receiver.stop(otp_task)
+            if not await lifecycle.bounded(otp_task, deadline):
+                log.warning("in-flight broadcast cut at shutdown deadline, outbox resumes it on next start")
+        
+        if lifecycle.remaining(deadline) > 0 and not startup_report:
+            drain = asyncio.create_task(bot_handler.otp_receiver.drain_outbox(application.bot))
+            if not await lifecycle.bounded(drain, deadline):
+                log.warning("outbox drain cut at shutdown deadline", extra={"pending": bot_handler.otp_receiver.outbox.pending_count()})
+        
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if watchdog:
+            watchdog.stop()
+        if not startup_report:
+            bot_handler.flush()
+        bot_handler.otp_receiver.outbox.close()
+        lifecycle.state = "stopped"
+        if metrics_server:
+            await metrics_server.stop()
+        print(f"{Fore.YELLOW}[]════════[] BOT STOPPED []════════[]{Style.RESET_ALL}")
     
+    main_task = loop.create_task(run_bot())
     try:
-        loop.run_until_complete(run_bot())
-        loop.run_forever()
-    except KeyboardInterrupt:
-        print(f"\n{Fore.YELLOW}[]════════[] BOT STOPPED []════════[]{Style.RESET_ALL}")
+        try:
+            loop.run_until_complete(main_task)
+        except KeyboardInterrupt:
+            lifecycle.request_stop("KeyboardInterrupt")
+            loop.run_until_complete(main_task)
     finally:
-        loop.run_until_complete(application.stop())
         loop.close()
+        if receiver and receiver.is_alive():
+            receiver.terminate()
+            receiver.join(5)
+        Logging.stop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="OTP bot")
+    parser.add_argument("--receiver", action="store_true", help="run only the SMS receiver process")
+    parser.add_argument("--startup-report", action="store_true", help="initialize without polling, jobs or deliveries, print per-phase startup timings and exit")
+    args = parser.parse_args()
+    if args.receiver:
+        run_sms_receiver()
+    else:
+        main(startup_report=args.startup_report)
\ No newline at end of file
@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import AutoDeleteQueue, Database
+
+COUNTRIES = ("Indonesia", "Nigeria", "Brazil", "India", "Togo", "Benin", "Venezuela", "Ivory Coast")
+SERVICES = ("whatsapp", "telegram", "facebook", "google", "tiktok", "instagram", "apple", "microsoft")
+NUMBER_FILES = 10
+
+
+def populate(size: int, seed: int):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    half = size // 2
+    Database.save_db("users", {"not_verif": list(range(1, half + 1)), "Verified": list(range(half + 1, size + 1))})
+
+    otps = [{
+        "phone": f"62812{index:07d}",
+        "message": f"Your WhatsApp code {rng.randrange(100, 1000)}-{rng.randrange(100, 1000)}",
+        "service": rng.choice(SERVICES).capitalize(),
+        "country": rng.choice(COUNTRIES),
+        "otp": f"{rng.randrange(100000, 1000000)}",
+        "timestamp": (now - timedelta(seconds=rng.randrange(80000))).isoformat()
+    } for index in range(size)]
+    Database.save_db("otps", {"otps": otps, "statistics": {}, "last_cleanup": now.isoformat()})
+
+    Database.save_db("sms_history", [f"62812{index:07d}_{now.isoformat()}" for index in range(size)])
+
+    expire = time.time()
+    Database.save_db("bot_messages", [
+        [round(expire + rng.uniform(-3600, 3600), 3), str(-1000000000000 - index % 20), index]
+        for index in range(size)
+    ], compact=True)
+
+    per_day = len(COUNTRIES) + len(SERVICES)
+    Database.save_db("daily_stats", {
+        (now - timedelta(days=day)).strftime("%Y-%m-%d"): {
+            "total": 100,
+            "countries": {country: rng.randrange(100) for country in COUNTRIES},
+            "services": {service: rng.randrange(100) for service in SERVICES}
+        } for day in range(max(1, size // per_day))
+    })
+    Database.save_db("autodel", {"enabled": True, "minutes": 60, "notif_message_ids": {}})
+
+    numbers = Path("numbers")
+    shutil.rmtree(numbers, ignore_errors=True)
+    numbers.mkdir()
+    for part in range(NUMBER_FILES):
+        with open(numbers / f"range_{part}.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(f"2348{index:08d}" for index in range(part, size, NUMBER_FILES)))
+
+
+def auto_delete_expired():
+    queue = AutoDeleteQueue()
+    queue.pop_expired()
+    queue.flush()
+
+
+OPERATIONS = (
+    ("is_verified", lambda size: Database.is_verified(size), ()),
+    ("add_otp_record", lambda size: Database.add_otp_record({
+        "phone": "628120000000", "message": "Your code 123-456", "service": "Whatsapp", "country": "Indonesia",
+        "otp": "123-456", "timestamp": datetime.now(timezone.utc).isoformat()
+    }), ("otps", "daily_stats")),
+    ("check_sms_history", lambda size: Database.check_sms_history("628129999999", str(time.time_ns())), ("sms_history",)),
+    ("auto_delete_expired", lambda size: auto_delete_expired(), ("bot_messages",)),
+    ("get_all_time_stats", lambda size: Database.get_all_time_stats(), ()),
+    ("get_total_numbers", lambda size: Database.get_total_numbers(), ()),
+)
+
+
+def measure(operation, size: int, restores, repeat: int, budget: float) -> float:
+    snapshots = {}
+    for table in restores:
+        path = Database.BASE_DIR / f"{table}.json"
+        snapshots[path] = path.with_suffix(".snapshot")
+        shutil.copyfile(path, snapshots[path])
+
+    samples = []
+    deadline = time.perf_counter() + budget
+    while len(samples) < repeat and (not samples or time.perf_counter() < deadline):
+        for path, snapshot in snapshots.items():
+            shutil.copyfile(snapshot, path)
+        started = time.perf_counter()
+        operation(size)
+        samples.append(time.perf_counter() - started)
+
+    for path, snapshot in snapshots.items():
+        shutil.copyfile(snapshot, path)
+        snapshot.unlink()
+    return statistics.median(samples)
+
+
+def file_sizes() -> str:
+    tables = ("users", "otps", "sms_history", "bot_messages", "daily_stats")
+    return ", ".join(f"{table} {(Database.BASE_DIR / f'{table}.json').stat().st_size / 1e6:.1f} MB" for table in tables)
+
+
+def print_table(results, sizes, baseline):
+    header = f"{'operation':<22}" + "".join(f"{size:>14,}" for size in sizes)
+    print("\nmedian ms per call" + (" (ratio vs baseline)" if baseline else ""))
+    print(header)
+    print("-" * len(header))
+    for name, _, _ in OPERATIONS:
+        row = f"{name:<22}"
+        for size in sizes:
+            value = results[name].get(str(size))
+            if value is None:
+                row += f"{'-':>14}"
+                continue
+            cell = f"{value * 1000:.2f}"
+            before = baseline.get(name, {}).get(str(size)) if baseline else None
+            if before:
+                cell += f" x{value / before:.2f}"
+            row += f"{cell:>14}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database method latency at increasing file sizes")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--budget", type=float, default=3.0, help="seconds per operation and size")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", type=Path, help="write results as JSON for later --compare")
+    parser.add_argument("--compare", type=Path, help="baseline JSON written by --save")
+    args = parser.parse_args()
+
+    sizes = [int(value) for value in args.sizes.split(",") if value.strip()]
+    baseline = json.loads(args.compare.read_text(encoding="utf-8")) if args.compare else None
+    results = {name: {} for name, _, _ in OPERATIONS}
+
+    origin = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="bench_db_")
+    os.chdir(workdir)
+    try:
+        Database.init_db()
+        for size in sizes:
+            started = time.perf_counter()
+            populate(size, args.seed)
+            print(f"size {size:,}: populated in {time.perf_counter() - started:.1f}s ({file_sizes()})")
+            for name, operation, restores in OPERATIONS:
+                results[name][str(size)] = measure(operation, size, restores, args.repeat, args.budget)
+    finally:
+        os.chdir(origin)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results, sizes, baseline)
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\nresults saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import Utils
+
+APP = Path(__file__).resolve().parent.parent / "app.py"
+CODE_RE = re.compile(r'\b\d{3}-?\d{3}\b')
+NUMBERS_PER_USER = 5
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_scenario(value: str):
+    try:
+        groups, users, rate = value.split(":")
+        return int(groups), int(users), float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError("scenario must be GROUPS:USERS:SMS_PER_SEC")
+
+
+def process_usage(pid: int):
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        memory = {}
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    memory[key] = int(value.split()[0]) / 1024
+        return cpu, memory.get("VmRSS", 0.0), memory.get("VmHWM", 0.0)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class FakeProvider:
+    def __init__(self, phones, rate: float, accounts: int):
+        self.phones = phones
+        self.rate = rate / accounts
+        self.started = None
+        self.stopped = None
+        self.streams = {}
+        self.born = {}
+        self.codes = iter(range(100000, 1000000))
+        self.requests = 0
+
+    def start(self):
+        self.started = time.time()
+
+    def stop(self):
+        self.stopped = time.time()
+
+    def materialize(self, key: str):
+        stream = self.streams.setdefault(key, [])
+        if self.started is None:
+            return stream
+        until = (self.stopped or time.time()) - self.started
+        while len(stream) < int(until * self.rate):
+            born = self.started + len(stream) / self.rate
+            code = str(next(self.codes))
+            self.born[code] = born
+            stream.append({
+                "phone": self.phones[(len(self.born) - 1) % len(self.phones)],
+                "datetime": datetime.fromtimestamp(born, timezone.utc).isoformat(timespec="milliseconds"),
+                "senderid": "WhatsApp",
+                "message": f"Your WhatsApp code {code[:3]}-{code[3:]}. Don't share this code with others",
+                "code": code,
+            })
+        return stream
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        per_page = int(body.get("params", {}).get("per_page", 10))
+        stream = self.materialize(request.headers.get("Api-Key", ""))
+        page = [{key: value for key, value in sms.items() if key != "code"} for sms in reversed(stream[-per_page:])]
+        return web.json_response({"jsonrpc": "2.0", "id": body.get("id"), "result": {"mdr_full_list": page}})
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float, jitter: float, rate_limit: float, retry_after: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.calls = {}
+        self.deliveries = []
+        self.throttled = 0
+        self.message_id = 0
+        self.ready = asyncio.Event()
+
+    def reply(self, result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        form = dict(await request.post()) if request.body_exists else {}
+
+        if method == "getMe":
+            return self.reply({"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"})
+        if method == "getUpdates":
+            self.ready.set()
+            await asyncio.sleep(min(float(form.get("timeout", 0) or 0), 1.0))
+            return self.reply([])
+        if method != "sendMessage":
+            return self.reply(True)
+
+        if self.latency:
+            await asyncio.sleep(max(0.0, random.uniform(self.latency * (1 - self.jitter), self.latency * (1 + self.jitter))))
+        if self.rate_limit and random.random() < self.rate_limit:
+            self.throttled += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after}
+            }, status=429)
+
+        codes = CODE_RE.findall(form.get("reply_markup", "") + form.get("text", ""))
+        self.deliveries.append((codes[0].replace("-", "") if codes else None, form.get("chat_id"), time.time()))
+        self.message_id += 1
+        chat_id = int(form.get("chat_id", 0))
+        return self.reply({
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+            "text": form.get("text", "")
+        })
+
+
+def seed_database(workdir: Path, groups: int, users: int):
+    database = workdir / "database"
+    database.mkdir(parents=True)
+    group_ids = [str(-1000000000000 - index) for index in range(groups)]
+    phones = [f"62812{index:07d}" for index in range(max(users * NUMBERS_PER_USER, 50))]
+    requests = [
+        {"user_id": 100000 + index, "numbers": phones[index * NUMBERS_PER_USER:(index + 1) * NUMBERS_PER_USER]}
+        for index in range(users)
+    ]
+    with open(database / "groups.json", "w", encoding="utf-8") as f:
+        json.dump({"groups": group_ids}, f)
+    with open(database / "user_request.json", "w", encoding="utf-8") as f:
+        json.dump(requests, f)
+    return phones, users * NUMBERS_PER_USER
+
+
+async def start_site(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def run_scenario(args, groups: int, users: int, rate: float):
+    workdir = Path(tempfile.mkdtemp(prefix="bench_e2e_"))
+    phones, owned = seed_database(workdir, groups, users)
+    provider = FakeProvider(phones, rate, args.accounts)
+    bot_api = FakeBotAPI(args.send_latency, args.jitter, args.rate_limit, args.retry_after)
+
+    provider_app = web.Application()
+    provider_app.router.add_post("/", provider.handle)
+    bot_app = web.Application()
+    bot_app.router.add_post("/bot{token}/{method}", bot_api.handle)
+    provider_port, bot_port = free_port(), free_port()
+    runners = [await start_site(provider_app, provider_port), await start_site(bot_app, bot_port)]
+
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": "123456:BENCH",
+        "OWNER_ID": "1",
+        "APIKEY": ",".join(f"bench{index}|http://127.0.0.1:{provider_port}/" for index in range(args.accounts)),
+        "BOT_API_URL": f"http://127.0.0.1:{bot_port}",
+        "UPDATE_MODE": "polling",
+        "SMS_MODE": "inline",
+        "METRICS_PORT": "0",
+        "AUTO_BACKUP_HOURS": "0",
+        "PYTHONUNBUFFERED": "1",
+    })
+    log = open(workdir / "app.log", "w", encoding="utf-8")
+    child = subprocess.Popen([sys.executable, str(APP)], cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    try:
+        await asyncio.wait_for(bot_api.ready.wait(), args.startup_timeout)
+    except asyncio.TimeoutError:
+        child.kill()
+        child.wait()
+        log.close()
+        for runner in runners:
+            await runner.cleanup()
+        print(f"{groups}:{users}:{rate:g} bot did not start, see {workdir / 'app.log'}")
+        return
+
+    before = process_usage(child.pid)
+    provider.start()
+    await asyncio.sleep(args.duration)
+    provider.stop()
+    for stream in list(provider.streams):
+        provider.materialize(stream)
+
+    expected = {
+        sms["code"]: groups + (1 if int(sms["phone"][5:]) < owned else 0)
+        for stream in provider.streams.values() for sms in stream
+    }
+    deadline = time.time() + args.drain
+    while time.time() < deadline:
+        seen = {}
+        for code, _, _ in bot_api.deliveries:
+            seen[code] = seen.get(code, 0) + 1
+        if all(seen.get(code, 0) >= count for code, count in expected.items() if count):
+            break
+        await asyncio.sleep(0.5)
+    elapsed = time.time() - provider.started
+    after = process_usage(child.pid)
+
+    child.send_signal(signal.SIGINT)
+    try:
+        child.wait(15)
+    except subprocess.TimeoutExpired:
+        child.kill()
+        child.wait()
+    log.close()
+    for runner in runners:
+        await runner.cleanup()
+
+    latencies, first, last, counts = [], {}, {}, {}
+    for code, chat_id, at in bot_api.deliveries:
+        born = provider.born.get(code)
+        if born is None:
+            continue
+        latencies.append(at - born)
+        first[code] = min(first.get(code, at), at)
+        last[code] = max(last.get(code, at), at)
+        counts[code] = counts.get(code, 0) + 1
+    complete = [last[code] - provider.born[code] for code, count in expected.items()
+                if count and counts.get(code, 0) >= count]
+    generated = len(expected)
+    delivered = len(complete)
+
+    print(f"\nscenario {groups} groups, {users} users, {rate:g} sms/s, {args.accounts} account(s), "
+          f"{args.duration:.0f}s + drain")
+    print(f"  sms generated {generated}, fully delivered {delivered}, never seen {generated - len(first)}, "
+          f"provider polls {provider.requests}")
+    print(f"  otp throughput {delivered / elapsed:.2f} sms/s, sends {len(bot_api.deliveries) / elapsed:.1f}/s, "
+          f"429s injected {bot_api.throttled}")
+    for label, values in (("per send", latencies), ("first send", [first[c] - provider.born[c] for c in first]),
+                          ("all sends", complete)):
+        if values:
+            points = Utils.percentiles(values)
+            print(f"  latency {label:<10} " + ", ".join(f"{key}={value:.2f}s" for key, value in points.items()))
+    if before and after:
+        cpu = after[0] - before[0]
+        print(f"  cpu {cpu:.2f}s ({100 * cpu / elapsed:.1f}%), rss {after[1]:.1f} MB, peak {after[2]:.1f} MB")
+    else:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        print(f"  cpu {usage.ru_utime + usage.ru_stime:.2f}s (all children), peak rss {usage.ru_maxrss / 1024:.1f} MB")
+    print(f"  bot api calls {dict(sorted(bot_api.calls.items()))}")
+
+    if args.keep:
+        print(f"  workdir kept at {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def run(args):
+    for groups, users, rate in args.scenario or [(1, 0, 0.5), (10, 50, 1.0), (50, 200, 2.0)]:
+        await run_scenario(args, groups, users, rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end OTP benchmark against local Bot API and provider stand-ins")
+    parser.add_argument("--scenario", type=parse_scenario, action="append",
+                        help="GROUPS:USERS:SMS_PER_SEC, repeatable")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--drain", type=float, default=30)
+    parser.add_argument("--accounts", type=int, default=1)
+    parser.add_argument("--send-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="probability of answering sendMessage with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--keep", action="store_true", help="keep the scenario work directory and app log")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
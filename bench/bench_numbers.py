@@ -0,0 +1,65 @@
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import Database, NumberNormalizer
+
+FORMATS = (
+    "{code}{national}",
+    "+{code}{national}",
+    "00{code}{national}",
+    "+{code} {head}-{tail}",
+    "{code}{national}",
+)
+
+
+def build_upload(lines: int, seed: int) -> str:
+    rng = random.Random(seed)
+    _, bounds, _, _ = NumberNormalizer.prefix_table()
+    codes = sorted(bounds)
+    rows = []
+    for _ in range(lines):
+        code = rng.choice(codes)
+        low, high = bounds[code]
+        size = rng.randint(low, high) - len(code) if rng.random() > 0.02 else high
+        national = str(rng.randint(1, 9)) + f"{rng.randrange(10 ** (size - 1)):0{size - 1}d}"
+        template = rng.choice(FORMATS)
+        rows.append(template.format(code=code, national=national, head=national[:4], tail=national[4:]))
+    return "\n".join(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk number normalization throughput benchmark")
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    origin = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="bench_numbers_")
+    os.chdir(workdir)
+    try:
+        Database.init_db()
+        started = time.perf_counter()
+        text = build_upload(args.lines, args.seed)
+        print(f"generated {args.lines:,} lines ({len(text) / 1e6:.1f} MB) in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        result = NumberNormalizer.normalize(text)
+        elapsed = time.perf_counter() - started
+        print(f"normalized in {elapsed:.2f}s ({result['scanned'] / elapsed:,.0f} numbers/sec), "
+              f"{result['accepted']:,} accepted across {len(result['groups'])} countries")
+        print(NumberNormalizer.summary(result, limit=5))
+    finally:
+        os.chdir(origin)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import json
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import OTPExtractor, Utils
+
+CORPUS = Path(__file__).resolve().parent / "otp_corpus.jsonl"
+HOLDOUT = Path(__file__).resolve().parent / "otp_holdout.jsonl"
+REPEATS = 5
+
+
+def legacy_extract_otp(message: str) -> str:
+    patterns = [
+        re.compile(r'(?:kode|code|otp|pin|verification)[\s:]*([0-9]{3,8}(?:[- ][0-9]{3,8})?)', re.IGNORECASE),
+        re.compile(r'(?:adalah|is|use|gunakan)[\s:]*([0-9]{3,8}(?:[- ][0-9]{3,8})?)', re.IGNORECASE),
+        re.compile(r'(?::\s*|\/|\*)?([0-9]{3,8}(?:[- ][0-9]{3,8})?)(?:\.|,|$)'),
+        re.compile(r'\b([0-9]{3,8}(?:[- ][0-9]{3,8})?)\b'),
+        re.compile(r'#\s*([0-9]{3,8}(?:[- ][0-9]{3,8})?)')
+    ]
+
+    for pattern in patterns:
+        match = pattern.search(message)
+        if match and match[1]:
+            return match[1].replace(' ', '-')
+
+    dash_pattern = re.compile(r'\b(\d{3,8}[- ]\d{3,8})\b')
+    dash_match = dash_pattern.search(message)
+    if dash_match and dash_match[1]:
+        return dash_match[1].replace(' ', '-')
+
+    all_numbers = re.findall(r'\b\d{3,8}\b', message)
+    if all_numbers and len(all_numbers) > 0:
+        for i in range(len(all_numbers) - 1, -1, -1):
+            num = all_numbers[i]
+            if 3 <= len(num) <= 8:
+                return num
+
+    return 'N/A'
+
+
+def load_corpus(path: Path):
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                samples.append(json.loads(line))
+    return samples
+
+
+def reissue(sample, rng):
+    message = sample["message"]
+    for raw in (sample["otp"], sample["otp"].replace("-", " ")):
+        index = message.find(raw)
+        if index >= 0:
+            fresh = "".join(str(rng.randrange(10)) if ch.isdigit() else ch for ch in raw)
+            return {
+                "sender": sample["sender"],
+                "message": message[:index] + fresh + message[index + len(raw):],
+                "otp": fresh.replace(" ", "-"),
+            }
+    return dict(sample)
+
+
+def run_templates(samples, variants, verbose):
+    OTPExtractor.templates.clear()
+    OTPExtractor.templates.stats = dict.fromkeys(OTPExtractor.templates.stats, 0)
+    rng = random.Random(7)
+    stream = [reissue(sample, rng) for _ in range(variants) for sample in samples]
+    correct = 0
+    misses = []
+    started = time.perf_counter()
+    for sample in stream:
+        result = Utils.extract_otp(sample["message"], sample["sender"])
+        if result == sample["otp"]:
+            correct += 1
+        else:
+            misses.append((sample["sender"], result, sample["otp"]))
+    elapsed = time.perf_counter() - started
+    rate = len(stream) / elapsed if elapsed else 0.0
+    cache = OTPExtractor.templates
+
+    print(f"{'templates':<12} accuracy {correct}/{len(stream)} ({100.0 * correct / len(stream):5.1f}%)  "
+          f"{rate:>12,.0f} extractions/sec  hit rate {100.0 * cache.hit_rate:5.1f}%  "
+          f"({len(cache.templates)} templates, {cache.stats['conflicts']} conflicts)")
+    if verbose:
+        for sender, got, expected in misses[:20]:
+            print(f"    miss {sender:<12} got={got!r} expected={expected!r}")
+
+
+def run(name, extract, samples, rounds, verbose):
+    correct = 0
+    misses = []
+    for sample in samples:
+        result = extract(sample)
+        if result == sample["otp"]:
+            correct += 1
+        else:
+            misses.append((sample["sender"], result, sample["otp"]))
+
+    rates = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for sample in samples:
+                extract(sample)
+        elapsed = time.perf_counter() - started
+        rates.append(rounds * len(samples) / elapsed if elapsed else 0.0)
+    rate = statistics.median(rates)
+
+    print(f"{name:<12} accuracy {correct}/{len(samples)} ({100.0 * correct / len(samples):5.1f}%)  "
+          f"{rate:>12,.0f} extractions/sec (median of {REPEATS})")
+    if verbose:
+        for sender, got, expected in misses:
+            print(f"    miss {sender:<12} got={got!r} expected={expected!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OTP extraction accuracy and throughput benchmark")
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--holdout", type=Path, default=HOLDOUT, help="samples the extractor was not tuned on")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--variants", type=int, default=50)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    samples = load_corpus(args.corpus)
+    print(f"corpus: {args.corpus.name} ({len(samples)} samples, {args.rounds} rounds)")
+    run("legacy", lambda s: legacy_extract_otp(s["message"]), samples, args.rounds, args.verbose)
+    run("generic", lambda s: Utils.extract_otp(s["message"]), samples, args.rounds, args.verbose)
+    run("sender", lambda s: Utils.extract_otp(s["message"], s["sender"]), samples, args.rounds, args.verbose)
+    run_templates(samples, args.variants, args.verbose)
+    
+    if args.holdout and args.holdout.exists():
+        holdout = load_corpus(args.holdout)
+        print(f"\nholdout: {args.holdout.name} ({len(holdout)} samples, {args.rounds} rounds)")
+        run("legacy", lambda s: legacy_extract_otp(s["message"]), holdout, args.rounds, args.verbose)
+        run("generic", lambda s: Utils.extract_otp(s["message"]), holdout, args.rounds, args.verbose)
+        run("sender", lambda s: Utils.extract_otp(s["message"], s["sender"]), holdout, args.rounds, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import Utils, WebhookServer
+
+SAMPLE = Path(__file__).resolve().parent / "updates_sample.jsonl"
+
+
+def default_secret() -> str:
+    secret = os.getenv("WEBHOOK_SECRET", "")
+    if not secret and os.getenv("BOT_TOKEN"):
+        secret = hashlib.sha256(os.getenv("BOT_TOKEN").encode()).hexdigest()[:32]
+    return secret
+
+
+def load_updates(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def retarget(update: dict, update_id: int, user_id: int) -> dict:
+    update = copy.deepcopy(update)
+    update["update_id"] = update_id
+    if not user_id:
+        return update
+    for key in ("message", "callback_query"):
+        body = update.get(key)
+        if not body:
+            continue
+        body["from"]["id"] = user_id
+        message = body.get("message", body)
+        message["chat"]["id"] = user_id
+    return update
+
+
+async def fetch_stats(session, base: str, headers: dict):
+    async with session.get(base + WebhookServer.STATS_PATH, headers=headers) as response:
+        if response.status != 200:
+            return None
+        return await response.json()
+
+
+async def replay(args):
+    updates = load_updates(args.file)
+    headers = {WebhookServer.SECRET_HEADER: args.secret}
+    base = args.url.rstrip("/")
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    update_id = args.first_id
+    for _ in range(args.rounds):
+        for update in updates:
+            queue.put_nowait(retarget(update, update_id, args.user_id))
+            update_id += 1
+    total = queue.qsize()
+
+    async with aiohttp.ClientSession() as session:
+        async def worker():
+            while not queue.empty():
+                payload = queue.get_nowait()
+                started = time.perf_counter()
+                async with session.post(base + args.path, json=payload, headers=headers) as response:
+                    await response.read()
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        print(f"posted {total} updates in {elapsed:.2f}s ({total / elapsed:,.0f}/s), statuses {statuses}")
+        print("ack latency ms: " + ", ".join(f"{key}={value * 1000:.2f}" for key, value in Utils.percentiles(latencies).items()))
+
+        await asyncio.sleep(args.settle)
+        stats = await fetch_stats(session, base, headers)
+        if stats:
+            print(f"server: handled {stats['handled']}, pending {stats['pending']}, "
+                  f"rejected {stats['rejected']}, invalid {stats['invalid']}")
+            print("handler latency ms: " + ", ".join(f"{key}={value:.2f}" for key, value in stats["latency_ms"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded updates against the webhook server")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', '8443')}")
+    parser.add_argument("--path", default=os.getenv("WEBHOOK_PATH", "/webhook"))
+    parser.add_argument("--secret", default=default_secret())
+    parser.add_argument("--file", type=Path, default=SAMPLE)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--user-id", type=int, default=0)
+    parser.add_argument("--first-id", type=int, default=int(time.time()))
+    parser.add_argument("--settle", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from app import BackupManager
+
+
+@pytest.fixture
+def numbers(workdir, monkeypatch):
+    monkeypatch.setenv("BACKUP_CODEC", "deflate")
+    directory = workdir / "numbers"
+    directory.mkdir(exist_ok=True)
+    (directory / "a.txt").write_text("1\n")
+    (directory / "b.txt").write_text("2\n")
+    return directory
+
+
+def snapshot(name: str, mode: str) -> Path:
+    spool, extension, _, plan = BackupManager.build("numbers", mode)
+    BackupManager.commit("numbers", plan)
+    path = Path(f"{name}{extension}")
+    path.write_bytes(spool.read())
+    spool.close()
+    return path
+
+
+def restore(archive: Path):
+    root, manifest = BackupManager.prepare_restore(archive, "numbers")
+    try:
+        BackupManager.commit_restore("numbers", root, manifest)
+    finally:
+        BackupManager.cleanup_restore(root)
+
+
+def listing(directory: Path):
+    return sorted(path.name for path in directory.iterdir())
+
+
+def test_full_restore_drops_files_missing_from_archive(numbers):
+    full = snapshot("full", "full")
+    (numbers / "zzz.txt").write_text("stray\n")
+
+    restore(full)
+
+    assert listing(numbers) == ["a.txt", "b.txt"]
+    assert not list(Path(".").glob(".restore_*"))
+
+
+def test_deltas_replay_in_order_and_stale_replays_are_rejected(numbers):
+    full = snapshot("full", "full")
+    (numbers / "a.txt").write_text("1\n11\n")
+    d1 = snapshot("d1", "inc")
+    (numbers / "b.txt").unlink()
+    d2 = snapshot("d2", "inc")
+    (numbers / "zzz.txt").write_text("stray\n")
+
+    with pytest.raises(ValueError, match="Out of order"):
+        restore(d1)
+
+    restore(full)
+    assert listing(numbers) == ["a.txt", "b.txt"]
+    with pytest.raises(ValueError, match="Out of order"):
+        restore(d2)
+
+    restore(d1)
+    assert (numbers / "a.txt").read_text() == "1\n11\n"
+    restore(d2)
+    assert listing(numbers) == ["a.txt"]
+
+    with pytest.raises(ValueError, match="Out of order"):
+        restore(d1)
+    assert listing(numbers) == ["a.txt"]
+
+
+def test_concurrent_restores_stage_separately(numbers):
+    full = snapshot("full", "full")
+    first, _ = BackupManager.prepare_restore(full, "numbers")
+    second, _ = BackupManager.prepare_restore(full, "numbers")
+    try:
+        assert first != second
+        assert listing(first / "numbers") == listing(second / "numbers") == ["a.txt", "b.txt"]
+    finally:
+        BackupManager.cleanup_restore(first)
+        BackupManager.cleanup_restore(second)
+
+
+def test_extraction_is_bounded(numbers, monkeypatch):
+    monkeypatch.setattr(BackupManager, "MAX_UNPACKED", 1024)
+    with zipfile.ZipFile("bomb.zip", "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("numbers/a.txt", b"0" * 4096)
+
+    with pytest.raises(ValueError, match="unpacks to more than"):
+        BackupManager.prepare_restore(Path("bomb.zip"), "numbers")
+    assert listing(numbers) == ["a.txt", "b.txt"]
+    assert not list(Path(".").glob(".restore_*"))
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from telegram.error import Forbidden
+
+from app import AutoDeleteQueue, Config, Database, MessageRenderer, OTPReceiver, ReceiverShard, SMSQueue
+
+PHONE = "6281234567890"
+SMS = {"phone": PHONE, "datetime": "2026-01-01 00:00:00", "message": "Your WhatsApp code 123456", "senderid": "WhatsApp"}
+SMS_KEY = ReceiverShard.sms_key(SMS)
+
+
+class SentMessage:
+    message_id = 1
+
+
+class FakeBot:
+    username = "otp_bot"
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.sent = []
+
+    async def send_message(self, chat_id, **kwargs):
+        self.sent.append(chat_id)
+        if self.error:
+            raise self.error
+        return SentMessage()
+
+
+class FakeApp:
+    def __init__(self, bot: FakeBot):
+        self.bot = bot
+
+
+@pytest.fixture
+def receiver(workdir):
+    Database.add_group("-1001")
+    config = Config()
+    otp_receiver = OTPReceiver(config, AutoDeleteQueue(), MessageRenderer(config))
+    otp_receiver.shards = []
+    yield otp_receiver
+    otp_receiver.outbox.close()
+
+
+def otp_count() -> int:
+    return len(Database.load_db("otps")["otps"])
+
+
+def delivery_count(otp_receiver: OTPReceiver) -> int:
+    return otp_receiver.outbox.conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0]
+
+
+def broadcast(otp_receiver: OTPReceiver, bot_app: FakeApp) -> bool:
+    return asyncio.run(otp_receiver.broadcast_sms(
+        PHONE, SMS["message"], SMS["senderid"], bot_app, sms_id=SMS_KEY
+    ))
+
+
+def test_retry_after_dead_deliveries_records_nothing_again(receiver):
+    bot_app = FakeApp(FakeBot(Forbidden("bot was kicked from the group chat")))
+
+    assert broadcast(receiver, bot_app) is False
+    assert broadcast(receiver, bot_app) is False
+
+    assert otp_count() == 1
+    assert delivery_count(receiver) == 1
+    assert bot_app.bot.sent == [-1001]
+
+
+def test_retry_after_delivery_reports_success_without_resending(receiver):
+    bot_app = FakeApp(FakeBot())
+
+    assert broadcast(receiver, bot_app) is True
+    assert broadcast(receiver, bot_app) is True
+
+    assert otp_count() == 1
+    assert delivery_count(receiver) == 1
+    assert bot_app.bot.sent == [-1001]
+
+
+def test_queue_acks_row_whose_deliveries_are_all_dead(receiver):
+    queue = SMSQueue()
+    queue.put(SMS_KEY, PHONE, SMS["message"], SMS["senderid"], "123456")
+    bot_app = FakeApp(FakeBot(Forbidden("bot was kicked from the group chat")))
+
+    async def scenario():
+        task = asyncio.create_task(receiver.consume_queue(bot_app))
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if not queue.backlog():
+                break
+        receiver.running = False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+    assert queue.backlog() == 0
+    assert queue.conn.execute("SELECT attempts FROM sms").fetchone()[0] == 1
+    assert otp_count() == 1
+    assert delivery_count(receiver) == 1
+    queue.close()
+
+
+def test_inline_history_is_marked_only_after_a_successful_broadcast(receiver, monkeypatch):
+    shard = ReceiverShard("test", None)
+    shard.seen[SMS_KEY] = None
+    bot_app = FakeApp(FakeBot())
+
+    def broken_render(*args, **kwargs):
+        raise RuntimeError("render failed")
+
+    async def run_once():
+        async def deliver_one(sink):
+            await sink.put((shard, dict(SMS)))
+            await asyncio.sleep(60)
+
+        shard.run = deliver_one
+        receiver.shards = [shard]
+        receiver.running = True
+        task = asyncio.create_task(receiver.process_sms(bot_app))
+        await asyncio.sleep(0.2)
+        receiver.running = False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(receiver.renderer, "sms", broken_render)
+        asyncio.run(run_once())
+
+    assert not Database.sms_seen(PHONE, SMS["datetime"])
+    assert SMS_KEY not in shard.seen
+    assert not receiver.outbox.has(SMS_KEY)
+
+    asyncio.run(run_once())
+
+    assert Database.sms_seen(PHONE, SMS["datetime"])
+    assert receiver.outbox.has(SMS_KEY)
+    assert otp_count() == 1
+    assert bot_app.bot.sent == [-1001]
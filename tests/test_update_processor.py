@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from app import KeyedUpdateProcessor
+
+
+class RecordingProcessor(KeyedUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.notices = []
+
+    async def notify_busy(self, update: Update):
+        self.notices.append(update.update_id)
+
+
+def message_update(update_id: int, user_id: int = 5) -> Update:
+    chat = Chat(user_id, Chat.PRIVATE)
+    user = User(user_id, "user", False)
+    return Update(update_id, message=Message(update_id, datetime.now(), chat, from_user=user, text=str(update_id)))
+
+
+def test_backlog_overflow_keeps_queued_updates_and_rejects_newest():
+    async def scenario():
+        processor = RecordingProcessor(8)
+        gate = asyncio.Event()
+        handled = []
+        coroutines = {}
+
+        async def handle(update_id: int):
+            if update_id == 0:
+                await gate.wait()
+            handled.append(update_id)
+
+        tasks = []
+        for update_id in range(processor.MAX_BACKLOG + 6):
+            coroutines[update_id] = handle(update_id)
+            update = message_update(update_id)
+            tasks.append(asyncio.create_task(processor.do_process_update(update, coroutines[update_id])))
+        await asyncio.sleep(0.05)
+        gate.set()
+        await asyncio.gather(*tasks)
+        return processor, handled, coroutines
+
+    processor, handled, coroutines = asyncio.run(scenario())
+
+    assert handled == list(range(processor.MAX_BACKLOG + 1))
+    assert processor.stats["dropped"] == 5
+    assert processor.notices == [processor.MAX_BACKLOG + 1]
+    rejected = range(processor.MAX_BACKLOG + 1, processor.MAX_BACKLOG + 6)
+    assert all(coroutines[update_id].cr_frame is None for update_id in rejected)
+    assert not processor.backlogs and not processor.notified
+
+
+def test_other_users_are_not_held_by_a_full_backlog():
+    async def scenario():
+        processor = RecordingProcessor(8)
+        gate = asyncio.Event()
+        handled = []
+
+        async def handle(update_id: int, wait: bool):
+            if wait:
+                await gate.wait()
+            handled.append(update_id)
+
+        busy = [
+            asyncio.create_task(processor.do_process_update(message_update(update_id), handle(update_id, update_id == 0)))
+            for update_id in range(processor.MAX_BACKLOG + 2)
+        ]
+        await asyncio.sleep(0.05)
+        await processor.do_process_update(message_update(100, user_id=6), handle(100, False))
+        other_done = 100 in handled
+        gate.set()
+        await asyncio.gather(*busy)
+        return other_done
+
+    assert asyncio.run(scenario())